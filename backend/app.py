@@ -22,7 +22,7 @@ def create_app() -> Flask:
     CORS(app, resources={
         r"/api/*": {
             "origins": ["http://localhost:8080", "http://127.0.0.1:8080"],
-            "methods": ["GET", "POST", "OPTIONS"],
+            "methods": ["GET", "POST", "DELETE", "OPTIONS"],
             "allow_headers": ["Content-Type", "Authorization"]
         }
     })
@@ -30,9 +30,47 @@ def create_app() -> Flask:
     app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
+    # Local state (document cache, retrieval indexes) lives under the data directory
+    app.config['DATA_DIR'] = os.getenv('FINBRIEF_DATA_DIR', app.instance_path)
+    app.config['DOCUMENT_CACHE_DIR'] = os.path.join(app.config['DATA_DIR'], 'documents')
+    app.config['RETRIEVAL_TOP_K'] = int(os.getenv('RETRIEVAL_TOP_K', '5'))
+    app.config['JOB_MAX_WORKERS'] = int(os.getenv('JOB_MAX_WORKERS', '2'))
+    app.config['BATCH_MAX_FILES'] = int(os.getenv('BATCH_MAX_FILES', '50'))
+    # Limits on the filings unpacked from a batch upload (zip archives can expand far beyond the upload)
+    app.config['BATCH_MAX_FILE_SIZE'] = int(os.getenv('BATCH_MAX_FILE_SIZE', str(64 * 1024 * 1024)))
+    app.config['BATCH_MAX_TOTAL_SIZE'] = int(os.getenv('BATCH_MAX_TOTAL_SIZE', str(512 * 1024 * 1024)))
+    app.config['BATCH_PARSE_WORKERS'] = int(os.getenv('BATCH_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+    app.config['BATCH_LLM_WORKERS'] = int(os.getenv('BATCH_LLM_WORKERS', '4'))
+    app.config['UPLOAD_SPOOL_MAX_MEMORY'] = int(os.getenv('UPLOAD_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+    app.config['COALESCE_ACROSS_WORKERS'] = os.getenv('COALESCE_ACROSS_WORKERS', 'true').lower() == 'true'
+    app.config['ADMISSION_MAX_IN_FLIGHT'] = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '4'))
+    app.config['ADMISSION_MAX_QUEUE'] = int(os.getenv('ADMISSION_MAX_QUEUE', '16'))
+    app.config['ADMISSION_MAX_WAIT'] = float(os.getenv('ADMISSION_MAX_WAIT', '60'))
+    app.config['PROFILE_EVERY_N'] = int(os.getenv('PROFILE_EVERY_N', '0'))
+    app.config['PROFILE_SLOW_MS'] = float(os.getenv('PROFILE_SLOW_MS', '0'))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.config['DATA_DIR'], 'profiles'))
+    # Production settings (see gunicorn.conf.py): parse PDFs in a pool of warm worker
+    # processes with a time limit, started (like unfinished job recovery) once per
+    # gunicorn worker rather than in the preloading master
+    app.config['PARSE_POOL_WORKERS'] = int(os.getenv('PARSE_POOL_WORKERS', '0'))
+    app.config['PARSE_POOL_ON_START'] = os.getenv('PARSE_POOL_ON_START', 'true').lower() == 'true'
+    app.config['PARSE_WORKER_MAX_JOBS'] = int(os.getenv('PARSE_WORKER_MAX_JOBS', '50'))
+    app.config['PDF_PARSE_TIMEOUT'] = float(os.getenv('PDF_PARSE_TIMEOUT', '120'))
+    app.config['JOB_RECOVERY_ON_START'] = os.getenv('JOB_RECOVERY_ON_START', 'true').lower() == 'true'
+
+    app.config['WARMUP'] = os.getenv('WARMUP', 'true').lower() == 'true'
+
     # Register routes/blueprints
     if register_routes:
         register_routes(app)
+        if app.config['WARMUP']:
+            # Pay the slow SDK imports at start-up (before gunicorn forks, with
+            # --preload) rather than on the first request
+            from app.pipeline import warm_up
+            warm_up()
+        if app.config['PARSE_POOL_WORKERS'] > 0 and app.config['PARSE_POOL_ON_START']:
+            from app.pdf_pool import get_parse_pool
+            get_parse_pool(app.config['PARSE_POOL_WORKERS'], app.config['PARSE_WORKER_MAX_JOBS'])
     else:
         # Fallback: define a root route
         @app.route('/')
@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# Request priorities, lowest value admitted first
+PRIORITY_FAST = 0      # The fast tier (no LLM calls)
+PRIORITY_STANDARD = 1  # Full analysis with LLM stages
+PRIORITY_BATCH = 2     # Multi-filing batches
+
+class Overloaded(Exception):
+    """
+    Raised when a request cannot be admitted. retry_after is the number of
+    seconds the client should wait, estimated from recent service times.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server is busy, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounds the number of analyses running at once and the number waiting for a slot.
+
+    Requests beyond max_in_flight wait in a priority queue, so fast requests are
+    admitted before full LLM analyses that arrived earlier. When the queue already
+    holds max_queue requests, or a request has waited max_wait seconds, it is
+    rejected straight away with an Overloaded error instead of piling up.
+
+    Args:
+        max_in_flight (int): Requests allowed to run at the same time
+        max_queue (int): Requests allowed to wait for a slot
+        max_wait (float, optional): Longest time a request may wait for a slot
+        initial_service_time (float): Service time assumed before any request finished
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 16, max_wait: Optional[float] = 60.0,
+                 initial_service_time: float = 30.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.rejected = 0
+        self.service_time = {}  # priority -> moving average of seconds per request
+        self.initial_service_time = initial_service_time
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _average_service_time(self) -> float:
+        if not self.service_time:
+            return self.initial_service_time
+        return max(self.service_time.values())
+
+    def _retry_after(self) -> int:
+        # Time for everything running and queued to drain through the slots
+        backlog = self.in_flight + len(self._waiters) + 1
+        return max(1, math.ceil(backlog / self.max_in_flight * self._average_service_time()))
+
+    def _reject(self) -> Overloaded:
+        self.rejected += 1
+        return Overloaded(self._retry_after())
+
+    @contextmanager
+    def admit(self, priority: int = PRIORITY_STANDARD):
+        """
+        Hold an analysis slot for the duration of the with block.
+
+        Args:
+            priority (int): One of the PRIORITY_* constants
+
+        Raises:
+            Overloaded: If the queue is full or no slot freed up within max_wait
+        """
+        with self._cond:
+            if self.in_flight >= self.max_in_flight or self._waiters:
+                if len(self._waiters) >= self.max_queue:
+                    raise self._reject()
+                entry = (priority, next(self._seq))
+                heapq.heappush(self._waiters, entry)
+                deadline = time.monotonic() + self.max_wait if self.max_wait is not None else None
+                try:
+                    while self.in_flight >= self.max_in_flight or self._waiters[0] != entry:
+                        remaining = deadline - time.monotonic() if deadline is not None else None
+                        if remaining is not None and remaining <= 0:
+                            raise self._reject()
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+            self.in_flight += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.in_flight -= 1
+                previous = self.service_time.get(priority)
+                self.service_time[priority] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "service_time_seconds": dict(self.service_time)
+            }
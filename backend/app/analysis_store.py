@@ -0,0 +1,219 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+from .metrics import record_cache_lookup
+from .peer_index import PeerIndex
+from .models import AnalysisResult, FinancialSnapshot, IDENTITY_FIELDS, snapshot_from_result
+
+def analysis_key(document_id: str, options: Dict[str, Any], extractor_version: str) -> str:
+    """
+    Identity of an analysis: the same file analyzed with the same options by the
+    same extractor version always gets the same key.
+
+    Args:
+        document_id (str): SHA-256 of the source file
+        options (Dict[str, Any]): Output of parse_analysis_options
+        extractor_version (str): Version of the extraction and analysis code
+
+    Returns:
+        str: Hex SHA-256 of the canonical JSON of the three inputs
+    """
+    canonical = json.dumps(
+        {"document_id": document_id, "options": options, "extractor_version": extractor_version},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class AnalysisStore:
+    """
+    SQLite-backed store of finished analyses.
+
+    The analysis id is its analysis_key, so an identical repeat request maps
+    to the row written by the first one and can be answered without reparsing
+    the PDF or calling an LLM.
+
+    It also keeps a PeerIndex of the stored ratios, brought up to date from
+    the new rows whenever peers() is called, so it sees analyses stored by
+    other worker processes too.
+    """
+
+    def __init__(self, db_path: str, extractor_version: str):
+        self.db_path = db_path
+        self.extractor_version = extractor_version
+        self.peer_index = PeerIndex()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id TEXT PRIMARY KEY,
+                    document_id TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    company_name TEXT,
+                    fiscal_year TEXT,
+                    result TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_document ON analyses (document_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key_for(self, document_id: str, options: Dict[str, Any]) -> str:
+        return analysis_key(document_id, options, self.extractor_version)
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored analysis record, or None if there is none.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["options"] = json.loads(record["options"])
+        record["result"] = json.loads(record["result"])
+        return record
+
+    def find(self, document_id: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored result of an identical earlier request, or None.
+        """
+        record = self.get(self.key_for(document_id, options))
+        record_cache_lookup("result", record is not None)
+        return record["result"] if record else None
+
+    def put(self, document_id: str, options: Dict[str, Any], result: Dict[str, Any] | AnalysisResult) -> str:
+        """
+        Stores a finished analysis, replacing any earlier one with the same key.
+
+        The result is serialized through AnalysisResult, so the stored JSON
+        has the typed snapshot, ratios and scores and the keys in their
+        original order.
+
+        Args:
+            document_id (str): SHA-256 of the source file
+            options (Dict[str, Any]): Options the analysis ran with
+            result (Dict[str, Any] | AnalysisResult): The analysis results; "analysis_id" is set on it
+
+        Returns:
+            str: The analysis id
+        """
+        analysis_id = self.key_for(document_id, options)
+        if isinstance(result, AnalysisResult):
+            result.extra["analysis_id"] = analysis_id
+        else:
+            result["analysis_id"] = analysis_id
+            result = AnalysisResult.from_json(result)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(id, document_id, options, extractor_version, company_name, fiscal_year, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    analysis_id,
+                    document_id,
+                    json.dumps(options, sort_keys=True),
+                    self.extractor_version,
+                    result.company_name,
+                    result.fiscal_year,
+                    json.dumps(result.to_json()),
+                    datetime.datetime.now().isoformat()
+                )
+            )
+        return analysis_id
+
+    def list(self, limit: int = 20, offset: int = 0, document_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Returns one page of stored analyses, newest first, without their full results.
+
+        Args:
+            limit (int): Page size
+            offset (int): Number of analyses to skip
+            document_id (str, optional): Only list analyses of this document
+
+        Returns:
+            Tuple: The page of summary records, and the total number of matches
+        """
+        where, params = ("WHERE document_id = ?", (document_id,)) if document_id else ("", ())
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM analyses {where}", params).fetchone()[0]
+            rows = conn.execute(
+                "SELECT id, document_id, options, extractor_version, company_name, fiscal_year, created_at, "
+                "json_extract(result, '$.recommendation.action') AS recommendation "
+                f"FROM analyses {where} ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [dict(row, options=json.loads(row["options"])) for row in rows], total
+
+    def snapshots(self, fiscal_year: Optional[str] = None) -> Dict[str, FinancialSnapshot]:
+        """
+        The extracted data of every stored analysis, e.g. for ratio_engine.batch_ratios.
+
+        Only the identity fields and extracted data are read from each stored
+        result, and they are held as slotted snapshots rather than dicts.
+
+        Args:
+            fiscal_year (str, optional): Only analyses of this fiscal year
+
+        Returns:
+            Dict[str, FinancialSnapshot]: Snapshot by analysis id, oldest first
+        """
+        where, params = ("WHERE fiscal_year = ?", (fiscal_year,)) if fiscal_year else ("", ())
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, company_name, fiscal_year, json_extract(result, '$.fiscal_period') AS fiscal_period, "
+                f"json_extract(result, '$.extracted_data') AS extracted_data FROM analyses {where} ORDER BY rowid",
+                params
+            )
+            snapshots = {}
+            for row in rows:
+                result = {name: row[name] for name in IDENTITY_FIELDS}
+                result["extracted_data"] = json.loads(row["extracted_data"] or "{}")
+                snapshots[row["id"]] = snapshot_from_result(result)
+        return snapshots
+
+    def peers(self) -> PeerIndex:
+        """
+        Returns the peer index, after adding the analyses stored since the last call.
+        """
+        # INSERT OR REPLACE gives the replacing row a new rowid, so replaced
+        # analyses are read again as well
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT rowid, document_id, fiscal_year, json_extract(result, '$.sector') AS sector, "
+                "json_extract(result, '$.ratios') AS ratios FROM analyses WHERE rowid > ? ORDER BY rowid",
+                (self.peer_index.watermark,)
+            ).fetchall()
+        self.peer_index.update(dict(row) for row in rows)
+        return self.peer_index
+
+def analysis_to_json(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a stored analysis for the API.
+    """
+    return {
+        "analysis_id": record["id"],
+        "document_id": record["document_id"],
+        "options": record["options"],
+        "extractor_version": record["extractor_version"],
+        "created_at": record["created_at"],
+        "result": record["result"]
+    }
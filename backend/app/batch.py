@@ -0,0 +1,266 @@
+import math
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from .pdf_processor import extract_pages, build_document
+from .pdf_pool import get_parse_pool
+from .pipeline import analyze_document, analyze_inline_xbrl, is_extraction_error, needs_tables, EXTRACTOR_VERSION
+from .ixbrl import is_inline_xbrl, parse_inline_xbrl
+from .analysis_store import analysis_key
+from .metrics import observe_document, observe_page_timings
+from .utils import allowed_file, copy_and_hash, FileTooLarge
+
+def _analyze(document_id: str, pdf_data: Dict[str, Any], options: Dict[str, Any], result_store=None, single_flight=None,
+             analyze_parsed=analyze_document) -> Dict[str, Any]:
+    """
+    Run the LLM and ratio stages for one filing, sharing the run with any
+    identical analysis already in flight.
+
+    analyze_parsed is analyze_document for a parsed PDF, or analyze_inline_xbrl
+    for the facts of an inline XBRL filing.
+    """
+    def analyze():
+        # Another worker may have finished this analysis while we waited for its lock
+        stored = result_store.find(document_id, options) if result_store else None
+        return stored if stored is not None else analyze_parsed(document_id, pdf_data, options, None, result_store)
+
+    if single_flight is None:
+        return analyze()
+    return single_flight.do(analysis_key(document_id, options, EXTRACTOR_VERSION), analyze)
+
+# Size limits of the filings saved from one batch upload; zip archives can
+# expand far beyond the upload limit
+BATCH_MAX_FILE_SIZE = 64 * 1024 * 1024
+BATCH_MAX_TOTAL_SIZE = 512 * 1024 * 1024
+
+def save_batch_files(files, batch_dir: str, max_files: int, max_file_size: int = BATCH_MAX_FILE_SIZE,
+                     max_total_size: int = BATCH_MAX_TOTAL_SIZE) -> Tuple[List[Tuple[str, str, str]], List[Dict[str, Any]]]:
+    """
+    Save uploaded filings (PDFs or inline XBRL .htm files), and those inside
+    uploaded zip archives, to a batch directory, hashing each one as it is written.
+
+    Zip members whose declared size is over the limits are skipped without
+    being read, and any filing is cut off (and skipped) as soon as it turns
+    out to be larger than declared, so a zip bomb cannot fill the disk.
+
+    Args:
+        files: The uploaded FileStorage objects
+        batch_dir (str): Directory the filings are written to
+        max_files (int): Maximum number of filings accepted in one batch
+        max_file_size (int): Maximum size of one filing, in bytes
+        max_total_size (int): Maximum size of all saved filings together, in bytes
+
+    Returns:
+        Tuple: (filename, path, sha256) triples of saved filings, and error
+               records for entries that were skipped
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    saved, skipped = [], []
+    total_size = 0
+
+    def save(name: str, source) -> None:
+        nonlocal total_size
+        path = os.path.join(batch_dir, f"{len(saved):04d}_{secure_filename(name) or 'filing.pdf'}")
+        try:
+            with open(path, 'wb') as dst:
+                sha256, size = copy_and_hash(source, dst, max_size=min(max_file_size, max_total_size - total_size))
+        except FileTooLarge:
+            os.remove(path)
+            skipped.append({"filename": name, "status": "error", "error": _size_error(max_file_size, max_total_size, total_size)})
+            return
+        total_size += size
+        saved.append((name, path, sha256))
+
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for info in archive.infolist():
+                        name = os.path.basename(info.filename)
+                        if info.is_dir() or not name or name.startswith('.'):
+                            continue
+                        if not allowed_file(name):
+                            skipped.append({"filename": name, "status": "error", "error": "File type not allowed"})
+                            continue
+                        if len(saved) >= max_files:
+                            skipped.append({"filename": name, "status": "error", "error": f"Batch limit of {max_files} filings reached"})
+                            continue
+                        if info.file_size > min(max_file_size, max_total_size - total_size):
+                            skipped.append({"filename": name, "status": "error", "error": _size_error(max_file_size, max_total_size, total_size)})
+                            continue
+                        with archive.open(info) as src:
+                            save(name, src)
+            except zipfile.BadZipFile:
+                skipped.append({"filename": file.filename, "status": "error", "error": "Invalid zip archive"})
+        elif allowed_file(file.filename):
+            if len(saved) >= max_files:
+                skipped.append({"filename": file.filename, "status": "error", "error": f"Batch limit of {max_files} filings reached"})
+                continue
+            save(file.filename, file.stream)
+        else:
+            skipped.append({"filename": file.filename, "status": "error", "error": "File type not allowed"})
+
+    return saved, skipped
+
+def _size_error(max_file_size: int, max_total_size: int, total_size: int) -> str:
+    if max_file_size <= max_total_size - total_size:
+        return f"File is larger than the limit of {max_file_size} bytes"
+    return f"Batch size limit of {max_total_size} bytes reached"
+
+def latency_percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Nearest-rank p50, p90 and p99 and the maximum of a list of latencies, in seconds.
+    """
+    values = sorted(latencies)
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+
+    def rank(q: float) -> float:
+        return round(values[max(0, math.ceil(q * len(values)) - 1)], 3)
+
+    return {"p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "max": round(values[-1], 3)}
+
+def run_batch(filings: Iterable[Tuple[str, str, str]], options: Dict[str, Any], document_cache=None,
+              parse_workers: int = 2, llm_workers: int = 4, result_store=None,
+              single_flight=None, max_pending: Optional[int] = None,
+              parse_timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyze many filings, yielding one record per filing as soon as it finishes.
+
+    PDF and inline XBRL parsing runs in the parse worker pool so it uses several cores.
+    The LLM and ratio stages run in a thread pool because they mostly wait on the network;
+    the per-provider limits in llm_clients keep those calls under the rate limits.
+    A filing that fails produces an error record and does not stop the batch.
+
+    Args:
+        filings (Iterable[Tuple[str, str, str]]): (filename, path, sha256) triples;
+                                                  read lazily when max_pending is set
+        options (Dict[str, Any]): Output of parse_analysis_options, shared by all filings
+        document_cache (DocumentCache, optional): Cache of extracted documents
+        parse_workers (int): Size of the parse worker pool if it has to be started
+        llm_workers (int): Number of filings in the LLM stages at the same time
+        result_store (AnalysisStore, optional): Store of finished analyses; filings
+                                               analyzed before with the same options
+                                               are answered from it ("from_store": true)
+        single_flight (SingleFlight, optional): Shares the LLM stages of filings that
+                                                are already being analyzed elsewhere
+        max_pending (int, optional): Most filings being parsed or analyzed at once,
+                                     so parsed documents waiting for the LLM stages
+                                     do not pile up in memory; unbounded if None
+        parse_timeout (float, optional): Seconds a filing may take to parse before
+                                         its worker is killed
+
+    Yields:
+        Dict[str, Any]: One record per filing, with its document_id whether it
+                        succeeded or failed, then a final {"summary": ...} record
+                        with the throughput and the latency percentiles of the
+                        filings analyzed successfully
+    """
+    batch_start = time.monotonic()
+    parse_pool = get_parse_pool(parse_workers)
+    include_tables = needs_tables(options)
+    succeeded = failed = 0
+    latencies = []
+    filings = iter(filings)
+
+    with ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="batch-llm") as llm_pool:
+        pending = {}  # future -> (stage, filename, document_id, started)
+
+        while True:
+            for filename, path, document_id in filings:
+                started = time.monotonic()
+                stored = result_store.find(document_id, options) if result_store else None
+                if stored is not None:
+                    succeeded += 1
+                    yield {
+                        "filename": filename,
+                        "status": "ok",
+                        "document_id": document_id,
+                        "elapsed_seconds": round(time.monotonic() - started, 3),
+                        "from_store": True,
+                        "result": stored
+                    }
+                    continue
+                if is_inline_xbrl(path):
+                    future = parse_pool.submit(parse_inline_xbrl, path, timeout=parse_timeout)
+                    pending[future] = ("ixbrl", filename, document_id, started)
+                else:
+                    pdf_data = document_cache.get_document(document_id) if document_cache else None
+                    if pdf_data is not None and include_tables and not pdf_data.get('tables_extracted', True):
+                        pdf_data = None
+                    if pdf_data is not None:
+                        future = llm_pool.submit(_analyze, document_id, pdf_data, options, result_store, single_flight)
+                        pending[future] = ("analyze", filename, document_id, started)
+                    else:
+                        future = parse_pool.submit(extract_pages, path, 1, None, include_tables, timeout=parse_timeout)
+                        pending[future] = ("parse", filename, document_id, started)
+                if max_pending is not None and len(pending) >= max_pending:
+                    break
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, filename, document_id, started = pending.pop(future)
+                try:
+                    output = future.result()
+                except Exception as e:
+                    failed += 1
+                    yield {"filename": filename, "status": "error", "error": f"Error processing file: {str(e)}",
+                           "document_id": document_id}
+                    continue
+
+                if stage == "ixbrl":
+                    if "error" in output:
+                        failed += 1
+                        yield {"filename": filename, "status": "error", "error": output["error"], "document_id": document_id}
+                        continue
+                    next_future = llm_pool.submit(_analyze, document_id, output, options, result_store, single_flight,
+                                                  analyze_inline_xbrl)
+                    pending[next_future] = ("analyze", filename, document_id, started)
+                elif stage == "parse":
+                    observe_page_timings(output['timings'])
+                    output = build_document(output['pages'], output['page_count'], include_tables)
+                    if not output.get('text'):
+                        failed += 1
+                        yield {"filename": filename, "status": "error", "error": "No text could be extracted from the PDF",
+                               "document_id": document_id}
+                        continue
+                    observe_document(output)
+                    if document_cache:
+                        document_cache.put(document_id, output)
+                    next_future = llm_pool.submit(_analyze, document_id, output, options, result_store, single_flight)
+                    pending[next_future] = ("analyze", filename, document_id, started)
+                elif is_extraction_error(output):
+                    failed += 1
+                    yield {"filename": filename, "status": "error", "error": output["error"], "document_id": document_id}
+                else:
+                    succeeded += 1
+                    latencies.append(time.monotonic() - started)
+                    yield {
+                        "filename": filename,
+                        "status": "ok",
+                        "document_id": document_id,
+                        "elapsed_seconds": round(latencies[-1], 3),
+                        "result": output
+                    }
+
+    elapsed = time.monotonic() - batch_start
+    total = succeeded + failed
+    yield {
+        "summary": {
+            "filings": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "filings_per_minute": round(total / elapsed * 60, 2) if elapsed > 0 else None,
+            "latency_seconds": latency_percentiles(latencies)
+        }
+    }
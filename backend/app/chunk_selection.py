@@ -0,0 +1,131 @@
+import re
+from typing import List, Dict, Any, Tuple
+
+from .models import FINANCIAL_METRICS
+from .ratio_registry import RATIO_RULES, OPTIONAL
+
+# Chunks sent to the LLM after the financial sections: at most this many, and
+# at most this many tokens in all. The budget holds two full-size chunks
+# (estimate_tokens of pdf_processor.MAX_CHUNK_CHARS characters, about 2,550
+# tokens each) and a third of at most about 3,500 characters, such as a
+# document's last chunk
+CHUNK_TOP_K = 3
+CHUNK_TOKEN_BUDGET = 6000
+MIN_CHUNK_CHARS = 1000
+
+# Ratio inputs that many filers never report: service companies have no
+# inventory or gross profit, companies without debt no interest expense.
+# The extraction does not keep sending chunks in search of them
+OFTEN_UNREPORTED = ("gross_profit", "inventory", "interest_expense")
+
+# Fields the extraction must find before it stops early: the filing's identity
+# and every metric a scored ratio reads, other than the OFTEN_UNREPORTED ones
+REQUIRED_FIELDS = ("company_name", "fiscal_year") + tuple(dict.fromkeys(
+    source
+    for rule in RATIO_RULES
+    for source, guard in rule["inputs"].items()
+    if source in FINANCIAL_METRICS and guard != OPTIONAL and source not in OFTEN_UNREPORTED
+))
+
+# Statement titles and unit captions, wherever they appear in the chunk
+_STATEMENT_HEADING = re.compile(
+    r"\b(?:consolidated\s+)?(?:balance\s+sheets?|statements?\s+of\s+(?:consolidated\s+)?(?:operations|income|earnings|"
+    r"comprehensive\s+(?:income|loss)|cash\s+flows?|financial\s+position|(?:stockholders|shareholders)['’]?\s+equity))\b"
+    r"|\(in\s+(?:thousands|millions|billions)\b",
+    re.IGNORECASE
+)
+_NUMBER_TOKEN = re.compile(r"[($\-−–—]*\d[\d,.]*\)?%?")
+
+# How the statements label each metric
+METRIC_SYNONYMS: Dict[str, str] = {
+    "revenue": r"net sales|total (?:net )?revenues?|net revenues?",
+    "cogs": r"cost of (?:sales|revenues?|goods sold)",
+    "gross_profit": r"gross (?:profit|margin)",
+    "operating_expenses": r"total (?:operating )?(?:costs and )?expenses",
+    "operating_income": r"operating income|income from operations",
+    "interest_expense": r"interest expense",
+    "net_income": r"net (?:income|earnings|loss)",
+    "cash_and_equivalents": r"cash and cash equivalents",
+    "accounts_receivable": r"accounts receivable",
+    "inventory": r"inventor(?:y|ies)",
+    "total_current_assets": r"total current assets",
+    "ppe": r"property,? (?:plant )?and equipment",
+    "total_assets": r"total assets",
+    "accounts_payable": r"accounts payable",
+    "short_term_debt": r"short-term (?:debt|borrowings)|current portion of long-term debt|commercial paper",
+    "total_current_liabilities": r"total current liabilities",
+    "long_term_debt": r"long-term debt",
+    "total_liabilities": r"total liabilities",
+    "stockholders_equity": r"(?:stockholders|shareholders)['’]? equity",
+    "outstanding_shares": r"shares (?:of common stock )?outstanding",
+    "operating_cash_flow": r"(?:provided by|from) operating activities",
+    "capex": r"capital expenditures|purchases? of property",
+    "investing_cash_flow": r"investing activities",
+    "financing_cash_flow": r"financing activities",
+}
+_SYNONYMS = [(metric, re.compile(pattern, re.IGNORECASE)) for metric, pattern in METRIC_SYNONYMS.items()]
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count of a text (about four characters per token).
+    """
+    return len(text) // 4 + 1
+
+def score_chunk(text: str) -> float:
+    """
+    Financial density of a chunk of filing text.
+
+    The score adds two points per statement title or unit caption (up to
+    five), one point per distinct metric named by its statement label, and
+    twenty times the share of words that are numbers, so a statement page
+    (about 40% numbers) outranks prose that mentions a few metrics.
+
+    Args:
+        text (str): The chunk
+
+    Returns:
+        float: The score; 0 if the chunk has no statement title and names no metric
+    """
+    headings = min(5, len(_STATEMENT_HEADING.findall(text)))
+    metrics = sum(1 for _, pattern in _SYNONYMS if pattern.search(text))
+    if not headings and not metrics:
+        return 0.0
+    words = text.split()
+    numbers = sum(1 for word in words if _NUMBER_TOKEN.fullmatch(word))
+    return 2.0 * headings + metrics + 20.0 * numbers / max(1, len(words))
+
+def select_chunks(chunks: List[str], top_k: int = CHUNK_TOP_K,
+                  token_budget: int = CHUNK_TOKEN_BUDGET) -> List[Tuple[int, str]]:
+    """
+    The most financially dense chunks that fit a token budget, best first.
+
+    Chunks shorter than MIN_CHUNK_CHARS or with a score of 0 are never chosen.
+    A chunk that does not fit the remaining budget is passed over for smaller
+    ones further down the ranking.
+
+    Args:
+        chunks (List[str]): pdf_data["chunks"]
+        top_k (int): Most chunks to choose
+        token_budget (int): Most tokens (estimate_tokens) in the chosen chunks
+
+    Returns:
+        List[Tuple[int, str]]: (index in chunks, chunk) pairs in rank order
+    """
+    scored = [(score_chunk(chunk), index) for index, chunk in enumerate(chunks) if len(chunk) >= MIN_CHUNK_CHARS]
+    ranked = sorted((pair for pair in scored if pair[0] > 0), key=lambda pair: (-pair[0], pair[1]))
+    selected = []
+    remaining = token_budget
+    for _, index in ranked:
+        if len(selected) >= top_k:
+            break
+        tokens = estimate_tokens(chunks[index])
+        if tokens <= remaining:
+            selected.append((index, chunks[index]))
+            remaining -= tokens
+    return selected
+
+def missing_fields(combined: Dict[str, Any]) -> List[str]:
+    """
+    The REQUIRED_FIELDS that combined chunk results have not filled yet.
+    """
+    return [field for field in REQUIRED_FIELDS if combined.get(field) in (None, "")]
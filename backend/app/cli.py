@@ -0,0 +1,186 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .utils import allowed_file, compute_file_hash
+from .document_cache import DocumentCache
+from .analysis_store import AnalysisStore
+from .singleflight import SingleFlight
+from .pipeline import parse_analysis_options, EXTRACTOR_VERSION
+from .batch import run_batch
+from .pdf_pool import shutdown_parse_pool
+
+# Same default as the Flask app: the instance folder next to app.py
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+
+def find_filings(sources: Iterable[str]) -> List[str]:
+    """
+    Paths of the filings named by files, directories and glob patterns.
+
+    Directories are searched recursively. Only PDFs and inline XBRL files are
+    kept, each once, in sorted order.
+
+    Args:
+        sources (Iterable[str]): Files, directories or glob patterns (e.g. "filings/**/*.pdf")
+
+    Returns:
+        List[str]: The filing paths
+    """
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+        else:
+            matches = glob.glob(source, recursive=True) or ([source] if os.path.exists(source) else [])
+        paths.update(os.path.abspath(path) for path in matches if os.path.isfile(path) and allowed_file(path))
+    return sorted(paths)
+
+def written_documents(output_path: str, include_failed: bool = True) -> Set[str]:
+    """
+    Document ids of the filings an earlier run already wrote to a JSONL output
+    file; lines that are not complete records are ignored.
+
+    Args:
+        output_path (str): The JSONL file
+        include_failed (bool): Whether filings written with an error record count too
+    """
+    documents = set()
+    if not os.path.exists(output_path):
+        return documents
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the run was interrupted
+            if not isinstance(record, dict) or not record.get("document_id"):
+                continue
+            if record.get("status") == "ok" or (include_failed and record.get("status") == "error"):
+                documents.add(record["document_id"])
+    return documents
+
+def _hashed(paths: List[str], skip: Set[str], on_skip: Callable[[str], None]) -> Iterator[Tuple[str, str, str]]:
+    # Hashed as the batch asks for them, so the first filings start right away
+    for path in paths:
+        name = os.path.relpath(path)
+        name = path if name.startswith('..') else name
+        document_id = compute_file_hash(path)
+        if document_id in skip:
+            on_skip(name)
+            continue
+        yield name, path, document_id
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="Analyze a directory or glob of 10-K filings (PDF or inline XBRL) and write one JSON line per filing."
+    )
+    parser.add_argument("sources", nargs="+", help="Filing files, directories (searched recursively) or glob patterns")
+    parser.add_argument("-o", "--output", help="JSONL file to append the records to (default: stdout)")
+    parser.add_argument("--data-dir", default=os.getenv('FINBRIEF_DATA_DIR', DEFAULT_DATA_DIR),
+                        help="Directory of the document cache and the analysis store shared with the server "
+                             "(default: FINBRIEF_DATA_DIR or the instance folder)")
+    parser.add_argument("--parse-workers", type=int, default=int(os.getenv('BATCH_PARSE_WORKERS', str(min(4, os.cpu_count() or 1)))),
+                        help="Processes parsing PDFs")
+    parser.add_argument("--llm-workers", type=int, default=int(os.getenv('BATCH_LLM_WORKERS', '4')),
+                        help="Filings in the LLM stages at the same time")
+    parser.add_argument("--analysis-detail", choices=("fast", "standard", "detailed"), default="standard", help="Analysis tier")
+    parser.add_argument("--api-choice", choices=("gemini", "openrouter"), default="gemini")
+    parser.add_argument("--stock-price", help="Stock price used for the valuation ratios")
+    parser.add_argument("--sector", help="Sector for the peer percentiles")
+    parser.add_argument("--include-mda", action="store_true", help="Add the MD&A summary to standard analyses")
+    parser.add_argument("--include-llm-analysis", action="store_true", help="Run the LLM narrative chain in standard analyses")
+    parser.add_argument("--chunked-extraction", action="store_true", help="Use the chunk-based LLM extraction")
+    parser.add_argument("--no-results", action="store_true", help="Leave the analysis results out of the records")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Analyze filings the output file has an error record of again")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the batch pipeline over the filings named on the command line.
+
+    Filings whose analysis with the same options is already in the result store
+    are answered from it, so an interrupted run picks up where it stopped.
+    Filings the output file already has a record of are skipped (failed ones
+    are retried with --retry-failed), so running the command again on the
+    same output does not write them twice. The last
+    line is the batch summary with the throughput and latency percentiles.
+
+    Returns:
+        int: Exit status: 0 if every filing was analyzed, 1 if any failed, 2 if
+             no filings were found
+    """
+    args = parse_args(argv)
+    paths = find_filings(args.sources)
+    if not paths:
+        print("No PDF or inline XBRL filings found", file=sys.stderr)
+        return 2
+
+    options = parse_analysis_options({
+        'analysis_detail': args.analysis_detail,
+        'api_choice': args.api_choice,
+        'stock_price': args.stock_price,
+        'sector': args.sector,
+        'include_mda': str(args.include_mda).lower(),
+        'include_llm_analysis': str(args.include_llm_analysis).lower(),
+        'use_direct_extraction': str(not args.chunked_extraction).lower()
+    })
+    document_cache = DocumentCache(os.path.join(args.data_dir, 'documents'), EXTRACTOR_VERSION)
+    result_store = AnalysisStore(os.path.join(args.data_dir, 'analyses.db'), EXTRACTOR_VERSION)
+    # Lock files shared with the server's workers, so a filing it is analyzing is not analyzed twice
+    single_flight = SingleFlight(os.path.join(args.data_dir, 'locks'))
+
+    skip = written_documents(args.output, include_failed=not args.retry_failed) if args.output else set()
+    position = [0]
+
+    def on_skip(name: str) -> None:
+        position[0] += 1
+        print(f"[{position[0]}/{len(paths)}] {name}: already in {args.output}", file=sys.stderr)
+
+    partial_line = False
+    if args.output and os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        with open(args.output, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            partial_line = f.read(1) != b"\n"
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    if partial_line:
+        output.write("\n")  # End the line an interrupted run was writing
+    failed = 0
+    try:
+        records = run_batch(
+            _hashed(paths, skip, on_skip),
+            options,
+            document_cache,
+            parse_workers=max(1, args.parse_workers),
+            llm_workers=max(1, args.llm_workers),
+            result_store=result_store,
+            single_flight=single_flight,
+            max_pending=max(1, args.parse_workers) + 2 * max(1, args.llm_workers)
+        )
+        for record in records:
+            if "summary" in record:
+                summary = record["summary"]
+                failed = summary["failed"]
+                print(f"{summary['succeeded']}/{summary['filings']} filings analyzed in {summary['elapsed_seconds']}s "
+                      f"({summary['filings_per_minute']}/min), latency {summary['latency_seconds']}", file=sys.stderr)
+            else:
+                if args.no_results:
+                    record.pop("result", None)
+                status = "stored" if record.get("from_store") else record["status"]
+                position[0] += 1
+                print(f"[{position[0]}/{len(paths)}] {record['filename']}: {status} "
+                      f"{record.get('elapsed_seconds', record.get('error', ''))}", file=sys.stderr)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        shutdown_parse_pool()
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
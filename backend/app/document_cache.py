@@ -0,0 +1,92 @@
+import json
+import os
+import re
+import tempfile
+from typing import Dict, Any, Optional
+
+from .retrieval import BM25Index
+from .metrics import record_cache_lookup
+
+DOCUMENT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class DocumentCache:
+    """
+    On-disk cache of extracted PDF content keyed by the SHA-256 of the upload.
+
+    Each document gets its own directory holding the extraction result
+    ('document.json') and the BM25 retrieval index built from its page-aware
+    chunks ('index.json').
+
+    Both files are stamped with the extractor version that wrote them; a file
+    written by another version is a miss, so a change to the extraction is
+    not hidden by documents cached before it.
+    """
+
+    def __init__(self, cache_dir: str, extractor_version: str):
+        self.cache_dir = cache_dir
+        self.extractor_version = extractor_version
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, document_id: str, name: str) -> str:
+        if not DOCUMENT_ID_PATTERN.match(document_id or ""):
+            raise ValueError(f"Invalid document id: {document_id!r}")
+        return os.path.join(self.cache_dir, document_id, name)
+
+    def _read(self, document_id: str, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(document_id, name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.pop('extractor_version', None) != self.extractor_version:
+            return None
+        return data
+
+    def _write(self, document_id: str, name: str, data: Dict[str, Any]) -> None:
+        path = self._path(document_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a private temporary file first so readers never see a partial
+        # document and concurrent writers of the same document never share one
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=f"{name}.", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({**data, 'extractor_version': self.extractor_version}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached extraction result for a document, or None on a miss
+        (including a document cached by another extractor version).
+        """
+        pdf_data = self._read(document_id, 'document.json')
+        record_cache_lookup("document", pdf_data is not None)
+        return pdf_data
+
+    def get_index(self, document_id: str) -> Optional[BM25Index]:
+        """
+        Returns the retrieval index for a document, or None if it was never built.
+        """
+        data = self._read(document_id, 'index.json')
+        return BM25Index.from_dict(data) if data else None
+
+    def put(self, document_id: str, pdf_data: Dict[str, Any]) -> BM25Index:
+        """
+        Stores an extraction result and builds its retrieval index.
+
+        Args:
+            document_id (str): SHA-256 hex digest of the uploaded file
+            pdf_data (Dict[str, Any]): Output of extract_text_and_tables
+
+        Returns:
+            BM25Index: The index built over the document's page chunks
+        """
+        index = BM25Index(pdf_data.get('page_chunks', []))
+        self._write(document_id, 'document.json', pdf_data)
+        self._write(document_id, 'index.json', index.to_dict())
+        return index
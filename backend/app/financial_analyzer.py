@@ -1,7 +1,14 @@
-from .utils import safe_float # Assuming utils.py is in the same directory
+import copy
+from typing import Callable
+from .models import FinancialSnapshot, FINANCIAL_METRICS
+from .profiling import span
+from .ratio_registry import evaluate_ratios, VALUATION_PLAN
+from .peer_index import normalize_sector
 from .llm_clients import interpret_financial_ratios_with_llm, predict_earnings_outlook_with_llm, generate_swot_analysis_with_llm, create_financial_story_with_llm
 
-def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_choice: str = "gemini", include_llm_analysis: bool = True) -> dict:
+def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_choice: str = "gemini", include_llm_analysis: bool = True,
+                               on_stage: Callable[[str, dict], None] | None = None, trend_analysis: dict | None = None,
+                               peer_index=None, sector: str | None = None, document_id: str | None = None) -> dict:
     """
     Calculate financial ratios based on extracted data from financial reports
     and optionally enhance with LLM-based analysis
@@ -12,6 +19,17 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
                                     Can be None if not provided.
         api_choice (str): The API to use for LLM analysis (gemini or openrouter)
         include_llm_analysis (bool): Whether to include LLM-based analysis
+        on_stage (Callable, optional): Called as on_stage(stage, payload) once the
+                                       deterministic ratios are ready and after each
+                                       LLM stage, so callers can stream partial results
+        trend_analysis (dict, optional): Output of trends.analyze_trends for the filing;
+                                         its summary is given to the earnings outlook LLM
+        peer_index (PeerIndex, optional): Stored ratios of other filings; if given, each
+                                          score gets the ratio's percentile among the
+                                          peers of the same fiscal year (and sector)
+        sector (str, optional): Sector of the company, for the peer group
+        document_id (str, optional): SHA-256 of the filing, so earlier analyses of
+                                     it are not counted as its peers
 
     Returns:
         dict: Financial ratios, scores, recommendations, and LLM-based insights
@@ -20,10 +38,11 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
         "company_name": data.get("company_name", "Unknown"),
         "fiscal_year": data.get("fiscal_year", "Unknown"),
         "fiscal_period": data.get("fiscal_period", "Annual"),
+        "sector": normalize_sector(sector),
         "extracted_data": {},
         "ratios": {},
         "scores": {},
-        "trend_analysis": {}, # Placeholder for future trend analysis features
+        "trend_analysis": trend_analysis or {},
         "qualitative_summary": {},
         "analysis_timestamp": data.get("analysis_timestamp", "")
     }
@@ -34,6 +53,8 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
         results["llm_earnings_outlook"] = {}
         results["financial_story"] = {}
         results["analysis_reasoning_steps"] = {}
+        # LLM stages that failed and were left empty; such results are not stored
+        results["failed_llm_stages"] = []
 
     # Convert stock_price to float if provided
     _stock_price_float: float | None = None
@@ -45,164 +66,18 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
             # For now, we'll proceed as if it wasn't provided if conversion fails
             pass
 
-    # Extract and clean all financial data
-    financial_metrics = [
-        "revenue", "cogs", "gross_profit", "operating_expenses", "operating_income",
-        "interest_expense", "net_income", "cash_and_equivalents", "accounts_receivable",
-        "inventory", "total_current_assets", "ppe", "total_assets", "accounts_payable",
-        "short_term_debt", "total_current_liabilities", "long_term_debt", "total_liabilities",
-        "stockholders_equity", "outstanding_shares", "operating_cash_flow", "capex",
-        "investing_cash_flow", "financing_cash_flow", "free_cash_flow"
-    ]
-
-    # Convert all financial data to float and store in extracted_data
-    for metric in financial_metrics:
-        value = safe_float(data.get(metric))
-        results["extracted_data"][metric] = value
-
-    # For backward compatibility, handle old field names if new ones are missing
-    if "total_debt" in data and results["extracted_data"].get("short_term_debt") is None and results["extracted_data"].get("long_term_debt") is None:
-        total_debt_val = safe_float(data.get("total_debt"))
-        results["extracted_data"]["total_debt"] = total_debt_val
-    else:
-        # Calculate total debt if individual components are present
-        short_term_debt_val = results["extracted_data"].get("short_term_debt", 0) or 0
-        long_term_debt_val = results["extracted_data"].get("long_term_debt", 0) or 0
-        results["extracted_data"]["total_debt"] = short_term_debt_val + long_term_debt_val
+    # Convert all financial data to float (and derive total debt) in extracted_data
+    results["extracted_data"] = FinancialSnapshot.from_data(data).extracted_data()
 
     try:
-        # Get key values for calculations
-        revenue = results["extracted_data"].get("revenue")
         net_income = results["extracted_data"].get("net_income")
-        outstanding_shares = results["extracted_data"].get("outstanding_shares")
-        stockholders_equity = results["extracted_data"].get("stockholders_equity")
-        total_debt = results["extracted_data"].get("total_debt") # This now uses the calculated or backward-compatible value
-        total_assets = results["extracted_data"].get("total_assets")
-        operating_income = results["extracted_data"].get("operating_income")
-        interest_expense = results["extracted_data"].get("interest_expense")
-        total_current_assets = results["extracted_data"].get("total_current_assets")
-        total_current_liabilities = results["extracted_data"].get("total_current_liabilities")
-        inventory = results["extracted_data"].get("inventory")
-        gross_profit = results["extracted_data"].get("gross_profit")
         operating_cash_flow = results["extracted_data"].get("operating_cash_flow")
-        capex = results["extracted_data"].get("capex")
-
-        # --- 1. PROFITABILITY RATIOS ---
-        if outstanding_shares and outstanding_shares > 0 and net_income is not None:
-            eps = net_income / outstanding_shares
-            results["ratios"]["eps"] = eps
-            if _stock_price_float and eps != 0:
-                pe_ratio = _stock_price_float / eps
-                results["ratios"]["pe_ratio"] = pe_ratio
-                if pe_ratio < 15: results["scores"]["pe_ratio"] = {"score": 3, "interpretation": "Undervalued"}
-                elif pe_ratio <= 25: results["scores"]["pe_ratio"] = {"score": 2, "interpretation": "Fairly Valued"}
-                else: results["scores"]["pe_ratio"] = {"score": 1, "interpretation": "Overvalued"}
-
-        if stockholders_equity and stockholders_equity != 0 and net_income is not None:
-            roe = (net_income / stockholders_equity) * 100
-            results["ratios"]["roe"] = roe
-            if roe > 15: results["scores"]["roe"] = {"score": 3, "interpretation": "Strong"}
-            elif roe >= 10: results["scores"]["roe"] = {"score": 2, "interpretation": "Acceptable"}
-            else: results["scores"]["roe"] = {"score": 1, "interpretation": "Weak"}
-
-        if total_assets and total_assets != 0 and net_income is not None:
-            roa = (net_income / total_assets) * 100
-            results["ratios"]["roa"] = roa
-            if roa > 5: results["scores"]["roa"] = {"score": 3, "interpretation": "Strong"}
-            elif roa >= 2: results["scores"]["roa"] = {"score": 2, "interpretation": "Acceptable"}
-            else: results["scores"]["roa"] = {"score": 1, "interpretation": "Weak"}
-
-        if revenue and revenue != 0:
-            if net_income is not None:
-                net_margin = (net_income / revenue) * 100
-                results["ratios"]["net_profit_margin"] = net_margin
-                if net_margin > 10: results["scores"]["net_profit_margin"] = {"score": 3, "interpretation": "Strong"}
-                elif net_margin >= 5: results["scores"]["net_profit_margin"] = {"score": 2, "interpretation": "Acceptable"}
-                else: results["scores"]["net_profit_margin"] = {"score": 1, "interpretation": "Weak"}
-            if gross_profit is not None:
-                gross_margin = (gross_profit / revenue) * 100
-                results["ratios"]["gross_profit_margin"] = gross_margin
-                if gross_margin > 40: results["scores"]["gross_profit_margin"] = {"score": 3, "interpretation": "Strong"}
-                elif gross_margin >= 20: results["scores"]["gross_profit_margin"] = {"score": 2, "interpretation": "Acceptable"}
-                else: results["scores"]["gross_profit_margin"] = {"score": 1, "interpretation": "Weak"}
-            if operating_income is not None:
-                operating_margin = (operating_income / revenue) * 100
-                results["ratios"]["operating_profit_margin"] = operating_margin
-                if operating_margin > 15: results["scores"]["operating_profit_margin"] = {"score": 3, "interpretation": "Strong"}
-                elif operating_margin >= 8: results["scores"]["operating_profit_margin"] = {"score": 2, "interpretation": "Acceptable"}
-                else: results["scores"]["operating_profit_margin"] = {"score": 1, "interpretation": "Weak"}
-
-        # --- 2. LEVERAGE RATIOS ---
-        if stockholders_equity and stockholders_equity != 0 and total_debt is not None:
-            de_ratio = total_debt / stockholders_equity
-            results["ratios"]["de_ratio"] = de_ratio
-            if de_ratio < 0.5: results["scores"]["de_ratio"] = {"score": 3, "interpretation": "Low Leverage"}
-            elif de_ratio <= 1.0: results["scores"]["de_ratio"] = {"score": 2, "interpretation": "Moderate Leverage"}
-            else: results["scores"]["de_ratio"] = {"score": 1, "interpretation": "High Leverage"}
-
-        if total_assets and total_assets != 0 and total_debt is not None:
-            debt_ratio = total_debt / total_assets
-            results["ratios"]["debt_ratio"] = debt_ratio
-            if debt_ratio < 0.3: results["scores"]["debt_ratio"] = {"score": 3, "interpretation": "Low Debt"}
-            elif debt_ratio <= 0.6: results["scores"]["debt_ratio"] = {"score": 2, "interpretation": "Moderate Debt"}
-            else: results["scores"]["debt_ratio"] = {"score": 1, "interpretation": "High Debt"}
-
-        if interest_expense and interest_expense != 0 and operating_income is not None:
-            # Use abs(interest_expense) in case it's reported as negative
-            interest_coverage = operating_income / abs(interest_expense)
-            results["ratios"]["interest_coverage"] = interest_coverage
-            if interest_coverage > 5: results["scores"]["interest_coverage"] = {"score": 3, "interpretation": "Strong"}
-            elif interest_coverage >= 2: results["scores"]["interest_coverage"] = {"score": 2, "interpretation": "Acceptable"}
-            else: results["scores"]["interest_coverage"] = {"score": 1, "interpretation": "Weak"}
-
-        # --- 3. LIQUIDITY RATIOS ---
-        if total_current_liabilities and total_current_liabilities != 0 and total_current_assets is not None:
-            current_ratio = total_current_assets / total_current_liabilities
-            results["ratios"]["current_ratio"] = current_ratio
-            if current_ratio > 2: results["scores"]["current_ratio"] = {"score": 3, "interpretation": "Strong"}
-            elif current_ratio >= 1: results["scores"]["current_ratio"] = {"score": 2, "interpretation": "Acceptable"}
-            else: results["scores"]["current_ratio"] = {"score": 1, "interpretation": "Weak"}
-
-        if total_current_liabilities and total_current_liabilities != 0 and total_current_assets is not None and inventory is not None:
-            quick_ratio = (total_current_assets - inventory) / total_current_liabilities
-            results["ratios"]["quick_ratio"] = quick_ratio
-            if quick_ratio > 1.5: results["scores"]["quick_ratio"] = {"score": 3, "interpretation": "Strong"}
-            elif quick_ratio >= 1: results["scores"]["quick_ratio"] = {"score": 2, "interpretation": "Acceptable"}
-            else: results["scores"]["quick_ratio"] = {"score": 1, "interpretation": "Weak"}
-
-        # --- 4. CASH FLOW INDICATORS ---
-        if net_income and net_income != 0 and operating_cash_flow is not None:
-            # Ensure capex is treated as 0 if None for FCF calculation
-            fcf = operating_cash_flow - (capex if capex is not None else 0)
-            # Store FCF if calculated
-            if operating_cash_flow is not None:
-                 results["ratios"]["free_cash_flow_calculated"] = fcf # Storing this calculated FCF
-
-            if fcf != 0: # Check fcf itself, not net_income for division by zero with fcf
-                fcf_net_income_ratio = fcf / net_income
-                results["ratios"]["fcf_net_income_ratio"] = fcf_net_income_ratio
-                if fcf_net_income_ratio > 1.2: results["scores"]["fcf_net_income_ratio"] = {"score": 3, "interpretation": "Strong (High-quality earnings)"}
-                elif fcf_net_income_ratio >= 0.8: results["scores"]["fcf_net_income_ratio"] = {"score": 2, "interpretation": "Acceptable (Reliable earnings)"}
-                else: results["scores"]["fcf_net_income_ratio"] = {"score": 1, "interpretation": "Weak (Poor earnings quality)"}
-
-        # --- 5. VALUATION RATIOS ---
-        if _stock_price_float and stockholders_equity and outstanding_shares and outstanding_shares > 0:
-            book_value_per_share = stockholders_equity / outstanding_shares
-            if book_value_per_share > 0: # Avoid division by zero or meaningless ratio for negative BVPS
-                pb_ratio = _stock_price_float / book_value_per_share
-                results["ratios"]["pb_ratio"] = pb_ratio
-                if pb_ratio < 1.5: results["scores"]["pb_ratio"] = {"score": 3, "interpretation": "Undervalued"}
-                elif pb_ratio <= 3: results["scores"]["pb_ratio"] = {"score": 2, "interpretation": "Fairly Valued"}
-                else: results["scores"]["pb_ratio"] = {"score": 1, "interpretation": "Overvalued"}
-
-        if _stock_price_float and revenue and outstanding_shares and outstanding_shares > 0:
-            revenue_per_share = revenue / outstanding_shares
-            if revenue_per_share > 0: # Avoid division by zero
-                ps_ratio = _stock_price_float / revenue_per_share
-                results["ratios"]["ps_ratio"] = ps_ratio
-                if ps_ratio < 1: results["scores"]["ps_ratio"] = {"score": 3, "interpretation": "Undervalued"}
-                elif ps_ratio <= 3: results["scores"]["ps_ratio"] = {"score": 2, "interpretation": "Fairly Valued"}
-                else: results["scores"]["ps_ratio"] = {"score": 1, "interpretation": "Overvalued"}
+
+        # --- 1-5. PROFITABILITY, LEVERAGE, LIQUIDITY, CASH FLOW AND VALUATION RATIOS ---
+        # Formulas and score bands are declared in ratio_registry.RATIO_RULES
+        results["ratios"], results["scores"] = evaluate_ratios(results["extracted_data"], _stock_price_float)
+        if peer_index is not None:
+            _add_peer_percentiles(results, peer_index, document_id)
 
         # --- 6. QUALITATIVE ANALYSIS ---
         # Quality of Earnings Assessment
@@ -241,10 +116,24 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
             else:
                 results["qualitative_summary"]["profitability"] = "Poor - Low returns and thin margins"
 
+        if on_stage:
+            on_stage("ratios_computed", {
+                "company_name": results["company_name"],
+                "fiscal_year": results["fiscal_year"],
+                "fiscal_period": results["fiscal_period"],
+                "extracted_data": results["extracted_data"],
+                "ratios": results["ratios"],
+                "scores": results["scores"],
+                "peer_group": results.get("peer_group"),
+                "trend_analysis": results["trend_analysis"],
+                "qualitative_summary": results["qualitative_summary"]
+            })
+
         # --- 7. LLM-BASED RATIO INTERPRETATIONS (if enabled) ---
         if include_llm_analysis:
             # Get enhanced ratio interpretations from LLM
-            llm_ratio_analysis = interpret_financial_ratios_with_llm(data, results["ratios"], api_choice)
+            with span("llm_ratio_interpretation"):
+                llm_ratio_analysis = interpret_financial_ratios_with_llm(data, results["ratios"], api_choice)
             
             # Store the results if successful
             if llm_ratio_analysis and "error" not in llm_ratio_analysis:
@@ -264,13 +153,24 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
                     if llm_interpretation:
                         # Update the interpretation from LLM while preserving the score
                         results["scores"][ratio_key]["llm_interpretation"] = llm_interpretation
+            else:
+                results["failed_llm_stages"].append("llm_ratio_interpretation")
+            if on_stage:
+                on_stage("llm_ratio_interpretation_done", {
+                    "llm_ratio_interpretations": results["llm_ratio_interpretations"],
+                    "llm_overall_assessment": results.get("llm_overall_assessment"),
+                    "scores": results["scores"]
+                })
             
             # Get earnings outlook prediction from LLM
-            llm_outlook_result = predict_earnings_outlook_with_llm(
-                {"preliminary_trend_assessment": "Based on the available financial data."}, 
-                llm_ratio_analysis, 
-                api_choice
-            )
+            with span("llm_earnings_outlook"):
+                # A compact numeric summary, so the LLM does not have to derive trends from raw text
+                trend_summary = results["trend_analysis"].get("summary") or {"preliminary_trend_assessment": "Based on the available financial data."}
+                llm_outlook_result = predict_earnings_outlook_with_llm(
+                    trend_summary,
+                    llm_ratio_analysis, 
+                    api_choice
+                )
             
             if llm_outlook_result and "error" not in llm_outlook_result:
                 results["llm_earnings_outlook"] = {
@@ -280,6 +180,10 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
                     "rationale": llm_outlook_result.get("prediction_rationale")
                 }
                 results["analysis_reasoning_steps"]["earnings_prediction"] = llm_outlook_result.get("key_factors_summary", [])
+            else:
+                results["failed_llm_stages"].append("llm_earnings_outlook")
+            if on_stage:
+                on_stage("llm_earnings_outlook_done", {"llm_earnings_outlook": results["llm_earnings_outlook"]})
 
         # Calculate average score and detailed recommendation
         valid_scores = [score_data["score"] for score_data in results["scores"].values() if isinstance(score_data, dict) and "score" in score_data]
@@ -287,35 +191,13 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
             avg_score = sum(valid_scores) / len(valid_scores)
             results["average_score"] = avg_score
 
-            swot = {
-                "strengths": [], "weaknesses": [],
-                "opportunities": [], "threats": []
-            }
-
-            for category, score_data in results["scores"].items():
-                if isinstance(score_data, dict) and "score" in score_data:
-                    if score_data.get("score") == 3: swot["strengths"].append(f"Strong {category.replace('_', ' ')}")
-                    elif score_data.get("score") == 1: swot["weaknesses"].append(f"Weak {category.replace('_', ' ')}")
-
-            if results["qualitative_summary"].get("earnings_quality", "").startswith("High"):
-                swot["strengths"].append("High quality earnings")
-            elif results["qualitative_summary"].get("earnings_quality", "").startswith("Low"):
-                swot["weaknesses"].append("Poor earnings quality")
-
-            bs_summary = results["qualitative_summary"].get("balance_sheet", "")
-            if bs_summary.startswith("Very Strong") or bs_summary.startswith("Strong"):
-                swot["strengths"].append("Strong balance sheet")
-            elif bs_summary.startswith("Weak"):
-                swot["weaknesses"].append("Weak balance sheet")
-                swot["threats"].append("Financial distress risk if economic conditions worsen")
-
-            if avg_score > 2.5: swot["opportunities"].append("Potential for favorable valuation rerating")
-            elif avg_score < 1.5: swot["threats"].append("Continued underperformance may lead to valuation decline")
+            swot = _rule_based_swot(results["scores"], results["qualitative_summary"], avg_score)
 
             # --- 8. LLM-BASED SWOT ANALYSIS (if enabled) ---
             if include_llm_analysis:
                 mda_summary = results.get("qualitative_summary", {})
-                llm_swot_result = generate_swot_analysis_with_llm(data, results["llm_ratio_interpretations"], mda_summary, api_choice)
+                with span("llm_swot"):
+                    llm_swot_result = generate_swot_analysis_with_llm(data, results["llm_ratio_interpretations"], mda_summary, api_choice)
                 
                 if llm_swot_result and "error" not in llm_swot_result:
                     # Use LLM SWOT if available, otherwise use the rule-based one
@@ -327,65 +209,25 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
                         swot["opportunities"] = llm_swot_result["opportunities"]
                     if "threats" in llm_swot_result and llm_swot_result["threats"]:
                         swot["threats"] = llm_swot_result["threats"]
+                else:
+                    results["failed_llm_stages"].append("llm_swot")
+                if on_stage:
+                    on_stage("llm_swot_done", {"swot_analysis": swot})
+
+            # --- 9. RECOMMENDATION, ENHANCED WITH LLM INSIGHTS ---
+            recommendation_details = _build_recommendation(
+                avg_score, swot, results.get("llm_earnings_outlook") if include_llm_analysis else None
+            )
 
-            recommendation_details = {}
-            if avg_score > 2.5:
-                recommendation_details = {
-                    "action": "Buy", "suitable_for": "Value and Growth Investors",
-                    "explanation": "The company demonstrates strong financial health with favorable valuation metrics.",
-                    "key_factors": ["Solid profitability indicators", "Healthy balance sheet", "Reasonable valuation"],
-                    "risk_factors": [] # Populated from weaknesses
-                }
-                if "Strong balance sheet" in swot["strengths"]: recommendation_details["key_factors"].append("Strong balance sheet provides financial flexibility")
-            elif avg_score >= 1.8:
-                recommendation_details = {
-                    "action": "Hold", "suitable_for": "Current Shareholders and Moderate-Risk Investors",
-                    "explanation": "The company shows moderate financial health with a reasonable valuation profile.",
-                    "key_factors": ["Adequate financial metrics", "Some strengths offset by weaknesses"],
-                    "risk_factors": [] # Populated from weaknesses
-                }
-            else:
-                recommendation_details = {
-                    "action": "Sell", "suitable_for": "Risk-Averse Investors",
-                    "explanation": "The company exhibits significant financial weaknesses or excessive valuation.",
-                    "key_factors": [], # Populated from weaknesses
-                    "risk_factors": ["Continued financial deterioration possible", "Potential for further valuation decline"]
-                }
-
-            # Populate key/risk factors from SWOT
-            if "key_factors" in recommendation_details: # For Buy/Hold
-                 recommendation_details["key_factors"].extend([w for w in swot["weaknesses"] if w not in recommendation_details["key_factors"]])
-            if "risk_factors" in recommendation_details: # For all
-                recommendation_details["risk_factors"].extend([w for w in swot["weaknesses"] if w not in recommendation_details["risk_factors"]])
-            if not recommendation_details.get("risk_factors"): # Default if empty
-                recommendation_details["risk_factors"] = ["No significant immediate risk factors identified from ratios, check qualitative summary."]
-
-            recommendation_details["watch_list"] = [
-                "Changes in profit margins", "Debt level trends",
-                "Cash flow quality vs. reported earnings", "Industry-specific dynamics"
-            ]
-            
-            # --- 9. ENHANCE RECOMMENDATION WITH LLM INSIGHTS ---
-            if include_llm_analysis and "llm_earnings_outlook" in results and results["llm_earnings_outlook"].get("rationale"):
-                # Use the earnings prediction rationale to enhance the recommendation explanation
-                earnings_direction = results["llm_earnings_outlook"].get("direction", "").lower()
-                earnings_magnitude = results["llm_earnings_outlook"].get("magnitude", "").lower()
-                rationale_excerpt = results["llm_earnings_outlook"].get("rationale", "")
-                
-                # Add rationale to explanation if available
-                if rationale_excerpt and earnings_direction:
-                    direction_term = "increase" if earnings_direction == "increase" else "decrease" if earnings_direction == "decrease" else "remain stable"
-                    magnitude_term = f"{earnings_magnitude} " if earnings_magnitude else ""
-                    recommendation_details["explanation"] += f" LLM predicts earnings will {magnitude_term}{direction_term} because {rationale_excerpt}"
-            
             # --- 10. CREATE FINANCIAL STORY NARRATIVES ---
             if include_llm_analysis:
-                story_result = create_financial_story_with_llm(
-                    results["llm_ratio_interpretations"],
-                    results["llm_earnings_outlook"],
-                    swot,
-                    api_choice
-                )
+                with span("llm_financial_story"):
+                    story_result = create_financial_story_with_llm(
+                        results["llm_ratio_interpretations"],
+                        results["llm_earnings_outlook"],
+                        swot,
+                        api_choice
+                    )
                 
                 if story_result and "error" not in story_result:
                     results["financial_story"] = {
@@ -394,6 +236,12 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
                         "future_outlook_narrative": story_result.get("future_outlook_narrative", ""),
                         "executive_summary": story_result.get("executive_summary", "")
                     }
+                else:
+                    results["failed_llm_stages"].append("llm_financial_story")
+                if on_stage:
+                    on_stage("llm_financial_story_done", {"financial_story": results["financial_story"]})
+            else:
+                results["financial_story"] = _template_story(results, swot, recommendation_details)
             
             results["recommendation"] = recommendation_details
             results["swot_analysis"] = swot
@@ -402,3 +250,258 @@ def calculate_financial_ratios(data: dict, stock_price: str | None = None, api_c
         results["error"] = f"Error calculating ratios: {str(e)}"
 
     return results
+
+def _valuation_ratios(extracted_data: dict, stock_price: float | None) -> dict:
+    """
+    Price-dependent ratios and their scores.
+
+    Args:
+        extracted_data (dict): Cleaned financial data (results["extracted_data"])
+        stock_price (float, optional): Current stock price
+
+    Returns:
+        dict: {ratio_name: (value, score)} for whichever of pe_ratio, pb_ratio
+              and ps_ratio can be calculated, in that order
+    """
+    ratios, scores = evaluate_ratios(extracted_data, stock_price, VALUATION_PLAN)
+    return {name: (value, scores[name]) for name, value in ratios.items()}
+
+def _add_peer_percentiles(results: dict, peer_index, document_id: str | None = None, names=None) -> None:
+    """
+    Add each scored ratio's percentile among its peers to its score, in place.
+
+    Args:
+        results (dict): Results with "ratios", "scores", "fiscal_year" and "sector"
+        peer_index (PeerIndex): Stored ratios of other filings
+        document_id (str, optional): Filing to leave out of its own peers
+        names (Iterable[str], optional): Only annotate these ratios
+    """
+    ratios = results["ratios"] if names is None else {name: results["ratios"][name] for name in names if name in results["ratios"]}
+    placement = peer_index.percentiles(ratios, results.get("fiscal_year"), results.get("sector"), exclude=document_id)
+    for name, peers in placement["ratios"].items():
+        score_data = results["scores"].get(name)
+        if score_data is not None:
+            score_data["peer_percentile"] = peers["percentile"]
+            score_data["peer_count"] = peers["peers"]
+    results["peer_group"] = placement["group"]
+
+def _rule_based_swot(scores: dict, qualitative_summary: dict, avg_score: float) -> dict:
+    """
+    SWOT analysis derived from the ratio scores and the qualitative summary.
+    """
+    swot = {
+        "strengths": [], "weaknesses": [],
+        "opportunities": [], "threats": []
+    }
+
+    for category, score_data in scores.items():
+        if isinstance(score_data, dict) and "score" in score_data:
+            if score_data.get("score") == 3: swot["strengths"].append(f"Strong {category.replace('_', ' ')}")
+            elif score_data.get("score") == 1: swot["weaknesses"].append(f"Weak {category.replace('_', ' ')}")
+
+    if qualitative_summary.get("earnings_quality", "").startswith("High"):
+        swot["strengths"].append("High quality earnings")
+    elif qualitative_summary.get("earnings_quality", "").startswith("Low"):
+        swot["weaknesses"].append("Poor earnings quality")
+
+    bs_summary = qualitative_summary.get("balance_sheet", "")
+    if bs_summary.startswith("Very Strong") or bs_summary.startswith("Strong"):
+        swot["strengths"].append("Strong balance sheet")
+    elif bs_summary.startswith("Weak"):
+        swot["weaknesses"].append("Weak balance sheet")
+        swot["threats"].append("Financial distress risk if economic conditions worsen")
+
+    if avg_score > 2.5: swot["opportunities"].append("Potential for favorable valuation rerating")
+    elif avg_score < 1.5: swot["threats"].append("Continued underperformance may lead to valuation decline")
+
+    return swot
+
+def _template_story(results: dict, swot: dict, recommendation: dict) -> dict:
+    """
+    Financial story narratives filled in from the ratios, the qualitative summary
+    and the trend analysis, in the shape create_financial_story_with_llm returns.
+    """
+    ratios, summary = results["ratios"], results["qualitative_summary"]
+
+    def percent(name: str, label: str | None = None) -> str | None:
+        value = ratios.get(name)
+        return f"{label or name.replace('_', ' ')} of {value:.1f}%" if value is not None else None
+
+    def times(name: str, label: str) -> str | None:
+        value = ratios.get(name)
+        return f"{label} of {value:.2f}" if value is not None else None
+
+    def sentence(lead: str, parts: list) -> str:
+        parts = [part for part in parts if part]
+        return f"{lead}, with {', '.join(parts)}." if parts else f"{lead}."
+
+    profitability = sentence(
+        summary.get("profitability", "Profitability could not be fully assessed from the extracted data"),
+        [percent("gross_profit_margin"), percent("operating_profit_margin"), percent("net_profit_margin"),
+         percent("roe", "return on equity")]
+    )
+    financial_health = sentence(
+        summary.get("balance_sheet", "Balance sheet strength could not be fully assessed from the extracted data"),
+        [times("current_ratio", "a current ratio"), times("de_ratio", "debt to equity"),
+         times("interest_coverage", "interest coverage")]
+    )
+    if summary.get("earnings_quality"):
+        financial_health += f" Earnings quality: {summary['earnings_quality']}."
+
+    trend = (results.get("trend_analysis") or {}).get("preliminary_trend_assessment")
+    outlook = [trend or "No multi-year statement data was found to establish a trend."]
+    if swot["opportunities"]:
+        outlook.append(f"Opportunities: {'; '.join(swot['opportunities'])}.")
+    if swot["threats"]:
+        outlook.append(f"Threats: {'; '.join(swot['threats'])}.")
+
+    strengths = ", ".join(strength.lower() for strength in swot["strengths"][:3]) or "no standout strengths"
+    weaknesses = ", ".join(weakness.lower() for weakness in swot["weaknesses"][:3]) or "no major weaknesses"
+    executive_summary = (
+        f"{results['company_name']} ({results['fiscal_year']}) scores {results['average_score']:.2f} out of 3 "
+        f"on its financial ratios, for a {recommendation.get('action', 'Hold')} rating. "
+        f"It shows {strengths}, against {weaknesses}."
+    )
+    return {
+        "profitability_narrative": profitability,
+        "financial_health_narrative": financial_health,
+        "future_outlook_narrative": " ".join(outlook),
+        "executive_summary": executive_summary
+    }
+
+def _build_recommendation(avg_score: float, swot: dict, llm_earnings_outlook: dict | None = None) -> dict:
+    """
+    Investment recommendation from the average score and the SWOT analysis.
+
+    Args:
+        avg_score (float): Average of the ratio scores
+        swot (dict): Final SWOT analysis
+        llm_earnings_outlook (dict, optional): LLM earnings outlook used to extend
+                                               the explanation, if LLM analysis ran
+
+    Returns:
+        dict: The recommendation details
+    """
+    recommendation_details = {}
+    if avg_score > 2.5:
+        recommendation_details = {
+            "action": "Buy", "suitable_for": "Value and Growth Investors",
+            "explanation": "The company demonstrates strong financial health with favorable valuation metrics.",
+            "key_factors": ["Solid profitability indicators", "Healthy balance sheet", "Reasonable valuation"],
+            "risk_factors": [] # Populated from weaknesses
+        }
+        if "Strong balance sheet" in swot["strengths"]: recommendation_details["key_factors"].append("Strong balance sheet provides financial flexibility")
+    elif avg_score >= 1.8:
+        recommendation_details = {
+            "action": "Hold", "suitable_for": "Current Shareholders and Moderate-Risk Investors",
+            "explanation": "The company shows moderate financial health with a reasonable valuation profile.",
+            "key_factors": ["Adequate financial metrics", "Some strengths offset by weaknesses"],
+            "risk_factors": [] # Populated from weaknesses
+        }
+    else:
+        recommendation_details = {
+            "action": "Sell", "suitable_for": "Risk-Averse Investors",
+            "explanation": "The company exhibits significant financial weaknesses or excessive valuation.",
+            "key_factors": [], # Populated from weaknesses
+            "risk_factors": ["Continued financial deterioration possible", "Potential for further valuation decline"]
+        }
+
+    # Populate key/risk factors from SWOT
+    if "key_factors" in recommendation_details: # For Buy/Hold
+         recommendation_details["key_factors"].extend([w for w in swot["weaknesses"] if w not in recommendation_details["key_factors"]])
+    if "risk_factors" in recommendation_details: # For all
+        recommendation_details["risk_factors"].extend([w for w in swot["weaknesses"] if w not in recommendation_details["risk_factors"]])
+    if not recommendation_details.get("risk_factors"): # Default if empty
+        recommendation_details["risk_factors"] = ["No significant immediate risk factors identified from ratios, check qualitative summary."]
+
+    recommendation_details["watch_list"] = [
+        "Changes in profit margins", "Debt level trends",
+        "Cash flow quality vs. reported earnings", "Industry-specific dynamics"
+    ]
+
+    if llm_earnings_outlook and llm_earnings_outlook.get("rationale"):
+        # Use the earnings prediction rationale to enhance the recommendation explanation
+        earnings_direction = (llm_earnings_outlook.get("direction") or "").lower()
+        earnings_magnitude = (llm_earnings_outlook.get("magnitude") or "").lower()
+        rationale_excerpt = llm_earnings_outlook.get("rationale", "")
+
+        # Add rationale to explanation if available
+        if rationale_excerpt and earnings_direction:
+            direction_term = "increase" if earnings_direction == "increase" else "decrease" if earnings_direction == "decrease" else "remain stable"
+            magnitude_term = f"{earnings_magnitude} " if earnings_magnitude else ""
+            recommendation_details["explanation"] += f" LLM predicts earnings will {magnitude_term}{direction_term} because {rationale_excerpt}"
+
+    return recommendation_details
+
+def reprice_analysis(results: dict, stock_price: float, peer_index=None) -> dict:
+    """
+    Recalculate the price-dependent parts of a finished analysis for a new stock price.
+
+    Only the valuation ratios (P/E, P/B, P/S), their scores, the average score,
+    the rule-based parts of the SWOT analysis, the recommendation and a
+    templated financial story are recalculated. The extracted data, the other
+    ratios and the LLM outputs are reused, so no LLM is called.
+
+    Args:
+        results (dict): Output of calculate_financial_ratios
+        stock_price (float): The new stock price
+        peer_index (PeerIndex, optional): If given, the new valuation scores get
+                                          their peer percentiles
+
+    Returns:
+        dict: A new results dictionary; the input is not modified
+    """
+    price_keys = ("pe_ratio", "pb_ratio", "ps_ratio")
+    repriced = copy.deepcopy(results)
+    valuation = _valuation_ratios(repriced.get("extracted_data", {}), stock_price)
+
+    # Rebuild ratios and scores in the order calculate_financial_ratios produces them
+    ratios, scores = {}, {}
+    if "pe_ratio" in valuation:
+        scores["pe_ratio"] = valuation["pe_ratio"][1]
+    for name, value in repriced.get("ratios", {}).items():
+        if name in price_keys:
+            continue
+        ratios[name] = value
+        if name == "eps" and "pe_ratio" in valuation:
+            ratios["pe_ratio"] = valuation["pe_ratio"][0]
+    for name, score_data in repriced.get("scores", {}).items():
+        if name not in price_keys:
+            scores[name] = score_data
+    for name in ("pb_ratio", "ps_ratio"):
+        if name in valuation:
+            ratios[name], scores[name] = valuation[name]
+    repriced["ratios"] = ratios
+    repriced["scores"] = scores
+    if peer_index is not None:
+        _add_peer_percentiles(repriced, peer_index, repriced.get("document_id"), price_keys)
+
+    # LLM interpretations of the old valuation ratios no longer apply
+    for name in price_keys:
+        repriced.get("llm_ratio_interpretations", {}).pop(name, None)
+
+    old_swot = results.get("swot_analysis")
+    old_rule_swot = _rule_based_swot(results.get("scores", {}), results.get("qualitative_summary", {}), results.get("average_score", 0)) if old_swot else None
+
+    valid_scores = [score_data["score"] for score_data in scores.values() if isinstance(score_data, dict) and "score" in score_data]
+    if not valid_scores:
+        for key in ("average_score", "swot_analysis", "recommendation"):
+            repriced.pop(key, None)
+        return repriced
+
+    avg_score = sum(valid_scores) / len(valid_scores)
+    repriced["average_score"] = avg_score
+    swot = _rule_based_swot(scores, repriced.get("qualitative_summary", {}), avg_score)
+    if old_swot:
+        # Keep any category the LLM SWOT analysis replaced
+        for category, items in old_swot.items():
+            if items != old_rule_swot.get(category):
+                swot[category] = items
+    repriced["swot_analysis"] = swot
+    repriced["recommendation"] = _build_recommendation(
+        avg_score, swot, repriced.get("llm_earnings_outlook") if "llm_earnings_outlook" in repriced else None
+    )
+    if "financial_story" in repriced and "llm_ratio_interpretations" not in repriced:
+        # A templated story quotes the score and rating, so it is rebuilt too
+        repriced["financial_story"] = _template_story(repriced, swot, repriced["recommendation"])
+    return repriced
@@ -0,0 +1,276 @@
+import datetime
+import html.entities
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Any, BinaryIO, Optional, Tuple
+
+from .value_parser import parse_value
+
+# us-gaap concepts of each metric, most specific first; the first one the
+# filing reports for the period wins
+US_GAAP_CONCEPTS: Dict[str, List[str]] = {
+    "revenue": ["Revenues", "RevenueFromContractWithCustomerExcludingAssessedTax",
+                "RevenueFromContractWithCustomerIncludingAssessedTax", "SalesRevenueNet", "SalesRevenueGoodsNet"],
+    "cogs": ["CostOfRevenue", "CostOfGoodsAndServicesSold", "CostOfGoodsSold",
+             "CostOfGoodsAndServiceExcludingDepreciationDepletionAndAmortization"],
+    "gross_profit": ["GrossProfit"],
+    "operating_expenses": ["OperatingExpenses", "CostsAndExpenses", "OperatingCostsAndExpenses"],
+    "operating_income": ["OperatingIncomeLoss"],
+    "interest_expense": ["InterestExpense", "InterestExpenseNonoperating", "InterestAndDebtExpense", "InterestExpenseDebt"],
+    "net_income": ["NetIncomeLoss", "ProfitLoss", "NetIncomeLossAvailableToCommonStockholdersBasic"],
+    "cash_and_equivalents": ["CashAndCashEquivalentsAtCarryingValue",
+                             "CashCashEquivalentsRestrictedCashAndRestrictedCashEquivalents", "Cash"],
+    "accounts_receivable": ["AccountsReceivableNetCurrent", "ReceivablesNetCurrent", "AccountsReceivableNet"],
+    "inventory": ["InventoryNet", "InventoryGross"],
+    "total_current_assets": ["AssetsCurrent"],
+    "ppe": ["PropertyPlantAndEquipmentNet",
+            "PropertyPlantAndEquipmentAndFinanceLeaseRightOfUseAssetAfterAccumulatedDepreciationAndAmortization"],
+    "total_assets": ["Assets"],
+    "accounts_payable": ["AccountsPayableCurrent", "AccountsPayableTradeCurrent", "AccountsPayableAndAccruedLiabilitiesCurrent"],
+    "short_term_debt": ["DebtCurrent", "LongTermDebtAndCapitalLeaseObligationsCurrent", "LongTermDebtCurrent",
+                        "ShortTermBorrowings", "CommercialPaper"],
+    "total_current_liabilities": ["LiabilitiesCurrent"],
+    "long_term_debt": ["LongTermDebtNoncurrent", "LongTermDebtAndCapitalLeaseObligations", "LongTermDebt"],
+    "total_liabilities": ["Liabilities"],
+    "stockholders_equity": ["StockholdersEquity", "StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest"],
+    "outstanding_shares": ["CommonStockSharesOutstanding", "WeightedAverageNumberOfDilutedSharesOutstanding"],
+    "operating_cash_flow": ["NetCashProvidedByUsedInOperatingActivities",
+                            "NetCashProvidedByUsedInOperatingActivitiesContinuingOperations"],
+    "capex": ["PaymentsToAcquirePropertyPlantAndEquipment", "PaymentsToAcquireProductiveAssets"],
+    "investing_cash_flow": ["NetCashProvidedByUsedInInvestingActivities",
+                            "NetCashProvidedByUsedInInvestingActivitiesContinuingOperations"],
+    "financing_cash_flow": ["NetCashProvidedByUsedInFinancingActivities",
+                            "NetCashProvidedByUsedInFinancingActivitiesContinuingOperations"],
+}
+_CONCEPT_METRICS = {concept: metric for metric, concepts in US_GAAP_CONCEPTS.items() for concept in concepts}
+_PRIORITY = {concept: rank for concepts in US_GAAP_CONCEPTS.values() for rank, concept in enumerate(concepts)}
+
+# Cover page (dei) facts read as text
+_DEI_FIELDS = ("EntityRegistrantName", "DocumentFiscalYearFocus", "DocumentFiscalPeriodFocus",
+               "DocumentPeriodEndDate", "DocumentType")
+
+_ZERO_FORMATS = ("fixed-zero", "fixedzero", "zerodash", "zero-dash")
+_READ_SIZE = 1 << 16
+
+def is_inline_xbrl(source: str | BinaryIO) -> bool:
+    """
+    True if a file looks like an (X)HTML filing rather than a PDF, judged from its first bytes.
+
+    Args:
+        source (str | BinaryIO): Path to the file, or a seekable binary stream of it
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            head = f.read(4096)
+    else:
+        source.seek(0)
+        head = source.read(4096)
+        source.seek(0)
+    head = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    return not head.startswith(b"%pdf") and (head.startswith(b"<?xml") or b"<html" in head)
+
+class _FactCollector:
+    """
+    XMLParser target that keeps the contexts and the numeric and cover-page
+    facts of an inline XBRL document, without building a tree.
+    """
+
+    def __init__(self):
+        self.namespaces: Dict[str, str] = {}
+        self.contexts: Dict[str, Dict[str, Any]] = {}
+        self.facts: List[Tuple[str, str, Optional[float]]] = []  # (concept, context, value)
+        self.dei: Dict[str, Tuple[str, str]] = {}  # concept -> (text, context)
+        self.cover_shares: List[float] = []
+        self._context: Optional[Dict[str, Any]] = None
+        self._period_field: Optional[str] = None
+        self._fact: Optional[Tuple[str, str, Dict[str, str]]] = None
+        self._text: List[str] = []
+        self._depth = 0
+
+    def start_ns(self, prefix: str, uri: str) -> None:
+        self.namespaces[prefix] = uri
+
+    def _concept(self, qname: str) -> Tuple[str, str]:
+        prefix, _, local = qname.rpartition(":")
+        return self.namespaces.get(prefix, ""), local
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        if self._fact is not None:
+            self._depth += 1
+            return
+        uri, _, local = tag[1:].partition("}") if tag[:1] == "{" else ("", "", tag)
+        if "inlineXBRL" in uri and local in ("nonFraction", "nonNumeric"):
+            namespace, concept = self._concept(attrib.get("name", ""))
+            if local == "nonFraction" and "fasb.org/us-gaap" in namespace and concept in _CONCEPT_METRICS:
+                self._fact = (concept, local, attrib)
+            elif "xbrl.sec.gov/dei" in namespace and (
+                    concept in _DEI_FIELDS if local == "nonNumeric" else concept == "EntityCommonStockSharesOutstanding"):
+                self._fact = (concept, local, attrib)
+            if self._fact is not None:
+                self._text, self._depth = [], 0
+        elif uri.endswith("xbrl.org/2003/instance"):
+            if local == "context":
+                self._context = {"id": attrib.get("id"), "dimensions": False}
+            elif self._context is not None:
+                if local == "segment" or local == "scenario":
+                    self._context["dimensions"] = True
+                elif local in ("instant", "startDate", "endDate"):
+                    self._period_field, self._text = local, []
+
+    def data(self, text: str) -> None:
+        if self._fact is not None or self._period_field is not None:
+            self._text.append(text)
+
+    def end(self, tag: str) -> None:
+        if self._fact is not None:
+            if self._depth:
+                self._depth -= 1
+                return
+            concept, kind, attrib = self._fact
+            self._fact = None
+            text = "".join(self._text).strip()
+            context = attrib.get("contextRef", "")
+            if kind == "nonNumeric":
+                self.dei.setdefault(concept, (text, context))
+            elif concept == "EntityCommonStockSharesOutstanding":
+                value = _fact_value(text, attrib)
+                if value is not None:
+                    self.cover_shares.append(value)
+            else:
+                self.facts.append((concept, context, _fact_value(text, attrib)))
+        elif self._period_field is not None:
+            self._context[self._period_field] = _parse_date("".join(self._text))
+            self._period_field = None
+        elif self._context is not None and tag.endswith("}context"):
+            self.contexts[self._context["id"]] = self._context
+            self._context = None
+
+    def close(self) -> None:
+        return None
+
+def _fact_value(text: str, attrib: Dict[str, str]) -> Optional[float]:
+    """
+    Value of an ix:nonFraction fact from its displayed text and its format, scale and sign.
+    """
+    if attrib.get("{http://www.w3.org/2001/XMLSchema-instance}nil") == "true":
+        return None
+    number_format = attrib.get("format", "").rpartition(":")[2].lower()
+    if number_format in _ZERO_FORMATS:
+        return 0.0
+    if "comma-decimal" in number_format or "commadecimal" in number_format:
+        text = text.replace(".", "").replace(" ", "").replace("\xa0", "").replace(",", ".")
+    value = parse_value(text.replace("\xa0", " "))
+    if value is None:
+        return None
+    value = abs(value)
+    try:
+        value *= 10 ** int(attrib.get("scale", "0"))
+    except ValueError:
+        pass
+    return -value if attrib.get("sign") == "-" else value
+
+def _parse_date(text: str) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(text.strip()[:10])
+    except ValueError:
+        return None
+
+def _is_annual(context: Dict[str, Any]) -> bool:
+    start, end = context.get("startDate"), context.get("endDate")
+    return start is not None and end is not None and 330 <= (end - start).days <= 400
+
+def parse_inline_xbrl(source: str | BinaryIO) -> Dict[str, Any]:
+    """
+    Read the financial data of an inline XBRL (.htm) 10-K from its tagged facts.
+
+    The document is parsed as a stream of XML events, keeping only the contexts
+    and the ix:nonFraction facts of the us-gaap concepts in US_GAAP_CONCEPTS, so
+    the values are exact and no LLM is needed. Facts with dimensions (segments,
+    classes of stock) are ignored, except for the cover page share count.
+
+    Args:
+        source (str | BinaryIO): Path to the file, or a seekable binary stream of it
+
+    Returns:
+        Dict[str, Any]: {"extracted_data": data in the format of the LLM extraction,
+                         "periods": {fiscal_year: {metric: value}} for the trend
+                         analysis, "facts": number of facts read}, or an error message
+    """
+    collector = _FactCollector()
+    parser = ET.XMLParser(target=collector)
+    # Only used when the document declares a DTD; plain XHTML must use numeric references
+    parser.entity.update({name: chr(code) for name, code in html.entities.name2codepoint.items()})
+    stream = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        if not isinstance(source, str):
+            stream.seek(0)
+        while True:
+            chunk = stream.read(_READ_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+        parser.close()
+    except ET.ParseError as e:
+        return {"error": f"Could not parse the inline XBRL document: {e}"}
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+    facts = [fact for fact in collector.facts if fact[2] is not None]
+    contexts = collector.contexts
+    if not facts:
+        return {"error": "No inline XBRL financial facts found in the document"}
+
+    # The reporting period is the context of the cover page facts
+    main_context = contexts.get((collector.dei.get("DocumentPeriodEndDate") or collector.dei.get("DocumentType") or ("", ""))[1])
+    if main_context is None or main_context.get("endDate") is None:
+        ends = [context["endDate"] for context in contexts.values()
+                if not context["dimensions"] and _is_annual(context)]
+        if not ends:
+            return {"error": "No reporting period found in the inline XBRL document"}
+        main_context = {"endDate": max(ends), "startDate": None}
+    period_end = main_context["endDate"]
+
+    fiscal_year_focus = collector.dei.get("DocumentFiscalYearFocus", ("", ""))[0]
+    fiscal_year = int(fiscal_year_focus) if fiscal_year_focus.isdigit() else period_end.year
+
+    def period_year(date: datetime.date) -> int:
+        return date.year + (fiscal_year - period_end.year)
+
+    # {year: {metric: (priority, value)}}, current year included
+    best: Dict[int, Dict[str, Tuple[int, float]]] = {}
+    current: Dict[str, Tuple[int, float]] = {}
+    for concept, context_id, value in facts:
+        context = contexts.get(context_id)
+        if context is None or context["dimensions"]:
+            continue
+        metric, rank = _CONCEPT_METRICS[concept], _PRIORITY[concept]
+        instant = context.get("instant")
+        if instant is not None:
+            date = instant
+        elif _is_annual(context) or (context.get("startDate") == main_context.get("startDate")
+                                     and context.get("endDate") == period_end):
+            date = context["endDate"]
+        else:
+            continue
+        if date == period_end and (metric not in current or rank < current[metric][0]):
+            current[metric] = (rank, value)
+        if instant is not None or _is_annual(context):
+            year = best.setdefault(period_year(date), {})
+            if metric not in year or rank < year[metric][0]:
+                year[metric] = (rank, value)
+
+    fiscal_period = collector.dei.get("DocumentFiscalPeriodFocus", ("", ""))[0]
+    data: Dict[str, Any] = {
+        "company_name": collector.dei.get("EntityRegistrantName", ("Unknown", ""))[0] or "Unknown",
+        "fiscal_year": str(fiscal_year),
+        "fiscal_period": "Annual" if fiscal_period in ("", "FY") else fiscal_period,
+        **{metric: value for metric, (_, value) in current.items()}
+    }
+    if "outstanding_shares" not in data and collector.cover_shares:
+        # The cover page reports shares per class of stock, as of a later date
+        data["outstanding_shares"] = sum(collector.cover_shares)
+    if "operating_cash_flow" in data and "capex" in data:
+        data["free_cash_flow"] = data["operating_cash_flow"] - data["capex"]
+
+    periods = {year: {metric: value for metric, (_, value) in values.items()} for year, values in best.items()}
+    return {"extracted_data": data, "periods": periods, "facts": len(facts)}
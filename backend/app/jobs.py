@@ -0,0 +1,310 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Any, Callable, Optional
+
+from .pipeline import is_extraction_error
+
+# Job lifecycle states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a running job when its cancellation has been requested.
+
+    Like asyncio.CancelledError it derives from BaseException, so the broad
+    `except Exception` handlers in the PDF and ratio code do not swallow it.
+    """
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobStore:
+    """
+    SQLite-backed record of analysis jobs.
+
+    Every state change is written through to disk so that another worker, or
+    this worker after a restart, can report on and recover the job.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filepath TEXT,
+                    document_id TEXT,
+                    options TEXT,
+                    result TEXT,
+                    error TEXT,
+                    status_code INTEGER,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    owner_pid INTEGER,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "document_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN document_id TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    payload TEXT,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, seq)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, filepath: str, options: Dict[str, Any], document_id: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filepath, document_id, options, owner_pid, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filepath, document_id, json.dumps(options), os.getpid(), now, now)
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = _now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def add_event(self, job_id: str, stage: str, payload: Optional[Dict[str, Any]] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, stage, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(payload or {}), _now())
+            )
+
+    def get_events(self, job_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, stage, payload, created_at FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        return [
+            {"seq": row["seq"], "stage": row["stage"], "payload": json.loads(row["payload"]), "created_at": row["created_at"]}
+            for row in rows
+        ]
+
+    def request_cancel(self, job_id: str) -> None:
+        self.update(job_id, cancel_requested=1)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def claim(self, job_id: str, previous_owner: Optional[int]) -> bool:
+        """
+        Take over an unfinished job if it is still owned by previous_owner.
+
+        Several worker processes may try to recover the same job at start-up;
+        only the one whose update matches the old owner wins.
+
+        Returns:
+            bool: True if this process now owns the job
+        """
+        owner_clause = "owner_pid = ?" if previous_owner is not None else "owner_pid IS NULL"
+        params = (QUEUED, os.getpid(), _now(), job_id, QUEUED, RUNNING)
+        if previous_owner is not None:
+            params += (previous_owner,)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, owner_pid = ?, updated_at = ? "
+                f"WHERE id = ? AND status IN (?, ?) AND {owner_clause}",
+                params
+            )
+        return cursor.rowcount == 1
+
+    def unfinished(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, filepath, document_id, options, owner_pid FROM jobs WHERE status IN (?, ?)",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        return [dict(row, options=json.loads(row["options"]) if row["options"] else {}) for row in rows]
+
+class JobManager:
+    """
+    Runs analysis jobs on a bounded thread pool and records their state in a JobStore.
+
+    Args:
+        store (JobStore): Where job state is persisted
+        runner (Callable): Called as runner(filepath, options, on_stage, document_id) and returns
+                           the results dict, or a dict with an "error" key.
+                           on_stage(stage, payload) records a progress event
+                           and raises JobCancelled if the job was cancelled.
+        max_workers (int): Number of jobs that may run at the same time
+    """
+
+    def __init__(self, store: JobStore, runner: Callable[..., Dict[str, Any]], max_workers: int = 2):
+        self.store = store
+        self.runner = runner
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, filepath: str, options: Dict[str, Any], document_id: Optional[str] = None) -> str:
+        """
+        Queue an analysis of an uploaded file and return its job id.
+        The job takes ownership of the file and deletes it when finished.
+        """
+        job_id = self.store.create(filepath, options, document_id)
+        self.store.add_event(job_id, "upload_saved", {"bytes": os.path.getsize(filepath)})
+        self._schedule(job_id, filepath, options, document_id)
+        return job_id
+
+    def _schedule(self, job_id: str, filepath: str, options: Dict[str, Any], document_id: Optional[str]) -> None:
+        with self.lock:
+            self.futures[job_id] = self.executor.submit(self._run, job_id, filepath, options, document_id)
+
+    def _run(self, job_id: str, filepath: str, options: Dict[str, Any], document_id: Optional[str]) -> None:
+        def on_stage(stage: str, payload: Optional[Dict[str, Any]] = None) -> None:
+            if stage != "started":
+                self.store.add_event(job_id, stage, payload)
+            if self.store.is_cancel_requested(job_id):
+                raise JobCancelled()
+
+        try:
+            on_stage("started")
+            self.store.update(job_id, status=RUNNING, owner_pid=os.getpid())
+            results = self.runner(filepath, options, on_stage, document_id)
+            if is_extraction_error(results):
+                self.store.update(job_id, status=FAILED, error=results["error"], status_code=400)
+            else:
+                self.store.update(job_id, status=SUCCEEDED, result=results, status_code=200)
+        except JobCancelled:
+            self.store.update(job_id, status=CANCELLED)
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, error=f"Error processing file: {str(e)}", status_code=500)
+        finally:
+            with self.lock:
+                self.futures.pop(job_id, None)
+            if filepath and os.path.exists(filepath):
+                os.remove(filepath)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Request cancellation of a job.
+
+        A queued job is cancelled immediately; a running job stops at its next
+        stage boundary. Returns the job record, or None if the job does not exist.
+        """
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return job
+
+        self.store.request_cancel(job_id)
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None and future.cancel():
+            self.store.update(job_id, status=CANCELLED)
+            with self.lock:
+                self.futures.pop(job_id, None)
+            if job["filepath"] and os.path.exists(job["filepath"]):
+                os.remove(job["filepath"])
+        return self.store.get(job_id)
+
+    def recover(self) -> int:
+        """
+        Re-queue jobs left unfinished by a worker process that is no longer running.
+
+        Returns:
+            int: The number of jobs that were re-queued
+        """
+        recovered = 0
+        for job in self.store.unfinished():
+            if job["owner_pid"] != os.getpid() and _pid_alive(job["owner_pid"]):
+                continue  # Another live worker still owns this job
+            if job["id"] in self.futures:
+                continue  # Already scheduled in this process
+            if not job["filepath"] or not os.path.exists(job["filepath"]):
+                self.store.update(job["id"], status=FAILED, error="Job was interrupted and its upload is no longer available", status_code=500)
+                continue
+            if not self.store.claim(job["id"], job["owner_pid"]):
+                continue  # Recovered by another worker in the meantime
+            self._schedule(job["id"], job["filepath"], job["options"], job["document_id"])
+            recovered += 1
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            futures = list(self.futures.values())
+        running = sum(1 for future in futures if future.running())
+        return {"in_flight": running, "queued": len(futures) - running}
+
+    def shutdown(self, wait: bool = False) -> None:
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+def job_to_json(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a job record for the API.
+    """
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+    if job["status"] == SUCCEEDED:
+        view["result"] = job["result"]
+    elif job["status"] == FAILED:
+        view["error"] = job["error"]
+    if job["cancel_requested"] and job["status"] not in FINISHED_STATES:
+        view["cancel_requested"] = True
+    return view
@@ -1,17 +1,102 @@
 import os
 import json
-import requests
-import google.generativeai as genai
-from dotenv import load_dotenv
-from typing import Dict, List, Any, Optional
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional
 import re
 
-# Load environment variables
-load_dotenv()
+from .profiling import span
+from .models import IDENTITY_FIELDS, FINANCIAL_METRICS
+from .chunk_selection import select_chunks, missing_fields
 
-# Setup API keys
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# The Gemini SDK, requests and python-dotenv are imported on first use rather
+# than at import time: the Gemini SDK alone takes most of a second to import,
+# which slows down worker start-up, the batch parse processes and the CLI tools
+# that never call an LLM. create_app() warms them up (see pipeline.warm_up).
+_environment_loaded = False
+_lazy_lock = threading.Lock()
+
+def _load_environment() -> None:
+    """
+    Load variables from a .env file once, before the first API key or limit is read.
+    """
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    with _lazy_lock:
+        if not _environment_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _environment_loaded = True
+
+def _api_key(name: str) -> Optional[str]:
+    _load_environment()
+    return os.getenv(name)
+
+def _request_timeout() -> float:
+    """
+    Seconds to wait for one LLM API response (LLM_REQUEST_TIMEOUT, default 120),
+    so a stalled provider cannot hold a worker thread past the server timeout.
+    """
+    return float(_api_key("LLM_REQUEST_TIMEOUT") or 120)
+
+def _genai():
+    """
+    Returns the Gemini SDK module, configured with the API key.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=_api_key("GEMINI_API_KEY"))
+    return genai
+
+class ProviderLimiter:
+    """
+    Caps the number of concurrent calls, and optionally the request rate, to one
+    LLM provider. Used as a context manager around every API request so that
+    concurrent analyses (batch, background jobs) stay under the provider limits.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: int = 0):
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.min_interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def __enter__(self):
+        self.slots.acquire()
+        if self.min_interval:
+            # Reserve the next start time so calls are spaced evenly
+            with self.lock:
+                now = time.monotonic()
+                start = max(now, self.next_start)
+                self.next_start = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.slots.release()
+        return False
+
+# Created on first use so that limits set in .env are honoured
+PROVIDER_LIMITS: Dict[str, ProviderLimiter] = {}
+
+def _provider_limit(provider: str) -> ProviderLimiter:
+    """
+    Returns the shared limiter of a provider ("gemini" or "openrouter"), configured
+    from <PROVIDER>_MAX_CONCURRENCY and <PROVIDER>_REQUESTS_PER_MINUTE.
+    """
+    limiter = PROVIDER_LIMITS.get(provider)
+    if limiter is None:
+        _load_environment()
+        with _lazy_lock:
+            limiter = PROVIDER_LIMITS.get(provider)
+            if limiter is None:
+                prefix = provider.upper()
+                limiter = PROVIDER_LIMITS[provider] = ProviderLimiter(
+                    int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "4")),
+                    int(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", "0"))
+                )
+    return limiter
 
 def analyze_financial_trends_with_llm(financial_data_history: list, api_choice: str = "gemini") -> dict:
     """
@@ -232,14 +317,15 @@ def _call_gemini_api(prompt: str) -> dict:
     Returns:
         dict: The JSON response or error message
     """
-    if not GEMINI_API_KEY:
+    if not _api_key("GEMINI_API_KEY"):
         return {"error": "Gemini API key not configured"}
     
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
+        genai = _genai()
         model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20')
         
-        response = model.generate_content(prompt)
+        with span("llm.gemini"), _provider_limit("gemini"):
+            response = model.generate_content(prompt, request_options={"timeout": _request_timeout()})
         
         # Extract JSON from response
         try:
@@ -268,11 +354,11 @@ def _call_openrouter_api(prompt: str, model: str = "deepseek/deepseek-chat-v3-03
     Returns:
         dict: The JSON response or error message
     """
-    if not OPENROUTER_API_KEY:
+    if not _api_key("OPENROUTER_API_KEY"):
         return {"error": "OpenRouter API key not configured"}
         
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Authorization": f"Bearer {_api_key('OPENROUTER_API_KEY')}",
         "Content-Type": "application/json"
     }
     
@@ -282,11 +368,14 @@ def _call_openrouter_api(prompt: str, model: str = "deepseek/deepseek-chat-v3-03
     }
     
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            data=json.dumps(data)
-        )
+        import requests
+        with span("llm.openrouter"), _provider_limit("openrouter"):
+            response = requests.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                headers=headers,
+                data=json.dumps(data),
+                timeout=_request_timeout()
+            )
         
         result = response.json()
         if 'choices' in result and len(result['choices']) > 0:
@@ -316,7 +405,7 @@ def extract_data_with_openrouter(pdf_data: Dict[str, Any]) -> dict:
     Returns:
         dict: Extracted financial data or error message
     """
-    if not OPENROUTER_API_KEY:
+    if not _api_key("OPENROUTER_API_KEY"):
         return {"error": "OpenRouter API key not configured"}
 
     # Function to create a prompt for a specific chunk of text
@@ -366,35 +455,7 @@ def extract_data_with_openrouter(pdf_data: Dict[str, Any]) -> dict:
         {text_chunk}
         """
 
-    # List to store results from each chunk
-    chunk_results = []
-    
-    # First, check if we have financial sections extracted
-    if pdf_data.get('financial_sections'):
-        # Process the financial sections first - they're most likely to contain key data
-        financial_prompt = create_chunk_prompt(pdf_data['financial_sections'][:30000])
-        financial_result = _call_openrouter_api(financial_prompt)
-        if isinstance(financial_result, dict) and 'error' not in financial_result:
-            chunk_results.append(financial_result)
-
-    # Process each chunk of the full text
-    for i, chunk in enumerate(pdf_data.get('chunks', [])):
-        # Only process a reasonable number of chunks (first 3 chunks)
-        if i >= 3:
-            break
-            
-        # Skip if chunk is too small
-        if len(chunk) < 1000:
-            continue
-            
-        chunk_prompt = create_chunk_prompt(chunk)
-        chunk_result = _call_openrouter_api(chunk_prompt)
-        
-        if isinstance(chunk_result, dict) and 'error' not in chunk_result:
-            chunk_results.append(chunk_result)
-
-    # Combine results from all chunks
-    return combine_chunk_results(chunk_results)
+    return _extract_from_chunks(pdf_data, lambda text: _call_openrouter_api(create_chunk_prompt(text)), 30000)
 
 def extract_data_with_gemini(pdf_data: Dict[str, Any]) -> dict:
     """
@@ -407,11 +468,11 @@ def extract_data_with_gemini(pdf_data: Dict[str, Any]) -> dict:
     Returns:
         dict: Extracted financial data or error message
     """
-    if not GEMINI_API_KEY:
+    if not _api_key("GEMINI_API_KEY"):
         return {"error": "Gemini API key not configured"}
 
     # Configure the Gemini model
-        genai.configure(api_key=GEMINI_API_KEY)
+    genai = _genai()
     model = genai.GenerativeModel('gemini-2.0-flash')
     
     # Function to create a prompt for a specific chunk of text
@@ -462,32 +523,44 @@ def extract_data_with_gemini(pdf_data: Dict[str, Any]) -> dict:
         {text_chunk}
         """
 
+    return _extract_from_chunks(pdf_data, lambda text: _call_gemini_api(create_chunk_prompt(text)), 50000)
+
+def _extract_from_chunks(pdf_data: Dict[str, Any], extract: Callable[[str], dict], sections_chars: int) -> dict:
+    """
+    Run a chunk extraction over the financial sections, then over the most
+    financially dense chunks (see chunk_selection.select_chunks), stopping as
+    soon as the combined results have every required field.
+
+    Args:
+        pdf_data (Dict[str, Any]): The extracted data from the PDF
+        extract (Callable[[str], dict]): Sends one text to the LLM and returns its result
+        sections_chars (int): Characters of the financial sections sent in the first call
+
+    Returns:
+        dict: Output of combine_chunk_results
+    """
     # List to store results from each chunk
     chunk_results = []
     
     # First, check if we have financial sections extracted
     if pdf_data.get('financial_sections'):
         # Process the financial sections first - they're most likely to contain key data
-        financial_prompt = create_chunk_prompt(pdf_data['financial_sections'][:50000])
-        financial_result = _call_gemini_api(financial_prompt)
+        financial_result = extract(pdf_data['financial_sections'][:sections_chars])
         if isinstance(financial_result, dict) and 'error' not in financial_result:
             chunk_results.append(financial_result)
 
-    # Process each chunk of the full text
-    for i, chunk in enumerate(pdf_data.get('chunks', [])):
-        # Only process a reasonable number of chunks (first 3 chunks)
-        if i >= 3:
+    # Then the chunks most likely to hold the statements, best first, until nothing is missing
+    chunks = pdf_data.get('chunks', [])
+    selected = select_chunks(chunks)
+    calls = 0
+    for index, chunk in selected:
+        if chunk_results and not missing_fields(combine_chunk_results(chunk_results)):
             break
-            
-        # Skip if chunk is too small
-        if len(chunk) < 1000:
-            continue
-            
-        chunk_prompt = create_chunk_prompt(chunk)
-        chunk_result = _call_gemini_api(chunk_prompt)
-        
+        calls += 1
+        chunk_result = extract(chunk)
         if isinstance(chunk_result, dict) and 'error' not in chunk_result:
             chunk_results.append(chunk_result)
+    print(f"Chunk extraction: {calls} of {len(chunks)} chunks sent (ranked {[index for index, _ in selected]})")
 
     # Combine results from all chunks
     return combine_chunk_results(chunk_results)
@@ -506,36 +579,7 @@ def combine_chunk_results(chunk_results: List[Dict]) -> Dict:
         return {"error": "No valid data extracted from any text chunk"}
         
     # Create an empty result with all fields initialized to None
-    combined_result = {
-        "company_name": "",
-        "fiscal_year": "",
-        "fiscal_period": "",
-        "revenue": None,
-        "cogs": None,
-        "gross_profit": None,
-        "operating_expenses": None,
-        "operating_income": None,
-        "interest_expense": None,
-        "net_income": None,
-        "cash_and_equivalents": None,
-        "accounts_receivable": None,
-        "inventory": None,
-        "total_current_assets": None,
-        "ppe": None,
-        "total_assets": None,
-        "accounts_payable": None,
-        "short_term_debt": None,
-        "total_current_liabilities": None,
-        "long_term_debt": None,
-        "total_liabilities": None,
-        "stockholders_equity": None,
-        "outstanding_shares": None,
-        "operating_cash_flow": None,
-        "capex": None,
-        "investing_cash_flow": None,
-        "financing_cash_flow": None,
-        "free_cash_flow": None
-    }
+    combined_result = {**dict.fromkeys(IDENTITY_FIELDS, ""), **dict.fromkeys(FINANCIAL_METRICS)}
     
     # For each result, take the non-null values
     for result in chunk_results:
@@ -545,7 +589,7 @@ def combine_chunk_results(chunk_results: List[Dict]) -> Dict:
                 continue
                 
             # For string fields, prefer non-empty values
-            if key in ["company_name", "fiscal_year", "fiscal_period"]:
+            if key in IDENTITY_FIELDS:
                 if value and (not combined_result[key] or len(combined_result[key]) < len(value)):
                     combined_result[key] = value
             # For numeric fields, prefer non-null values
@@ -649,11 +693,11 @@ def extract_financial_data_directly(pdf_data: Dict[str, Any]) -> dict:
     Returns:
         dict: Extracted financial data or error message
     """
-    if not GEMINI_API_KEY:
+    if not _api_key("GEMINI_API_KEY"):
         return {"error": "Gemini API key not configured"}
 
     # Configure the Gemini model
-    genai.configure(api_key=GEMINI_API_KEY)
+    genai = _genai()
     model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20')
     
     # Collect relevant content from the PDF
@@ -757,7 +801,8 @@ def extract_financial_data_directly(pdf_data: Dict[str, Any]) -> dict:
     
     # Call the Gemini API
     try:
-        response = model.generate_content(prompt)
+        with span("llm.gemini"), _provider_limit("gemini"):
+            response = model.generate_content(prompt, request_options={"timeout": _request_timeout()})
         
         # Extract JSON from response
         try:
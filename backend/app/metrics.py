@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from prometheus_client import Counter, Histogram, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+HTTP_REQUESTS = Counter(
+    "finbrief_http_requests_total", "HTTP requests by route, method and status code",
+    ["route", "method", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "finbrief_http_request_duration_seconds", "Time to produce the response (headers, for streamed responses)",
+    ["route"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+STAGE_DURATION = Histogram(
+    "finbrief_stage_duration_seconds", "Time spent in each analysis pipeline stage",
+    ["stage"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+UPLOAD_DURATION = Histogram(
+    "finbrief_upload_duration_seconds", "Time to receive and store the uploaded files of a request",
+    ["route"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+PAGE_PARSE_DURATION = Histogram(
+    "finbrief_pdf_page_parse_duration_seconds", "Time to read the text of one PDF page",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+TABLE_EXTRACTION_DURATION = Histogram(
+    "finbrief_table_extraction_duration_seconds", "Time to detect the tables of one PDF page",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+PDF_PAGES = Counter("finbrief_pdf_pages_parsed_total", "PDF pages parsed")
+PDF_TEXT_CHARS = Counter("finbrief_pdf_text_chars_total", "Characters of text extracted from PDFs")
+CACHE_LOOKUPS = Counter(
+    "finbrief_cache_lookups_total", "Cache lookups by cache and outcome",
+    ["cache", "result"]
+)
+
+# Stats functions of the in-process components (admission, jobs, single flight, parse pool)
+_runtime_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_runtime_lock = threading.Lock()
+
+class _RuntimeCollector:
+    """
+    Exposes the live counters of the registered components at scrape time.
+    """
+
+    def collect(self):
+        with _runtime_lock:
+            sources = dict(_runtime_sources)
+        in_flight = GaugeMetricFamily("finbrief_in_flight", "Work currently running, by component", labels=["component"])
+        queued = GaugeMetricFamily("finbrief_queued", "Work waiting to run, by component", labels=["component"])
+        events = CounterMetricFamily("finbrief_component_events", "Rejections, coalesced calls and worker events, by component and event", labels=["component", "event"])
+        for component, stats_fn in sources.items():
+            stats = stats_fn()
+            if "in_flight" in stats:
+                in_flight.add_metric([component], stats["in_flight"])
+            if "queued" in stats:
+                queued.add_metric([component], stats["queued"])
+            for event in ("rejected", "coalesced", "timed_out", "recycled", "crashed"):
+                if event in stats:
+                    events.add_metric([component, event], stats[event])
+        yield in_flight
+        yield queued
+        yield events
+
+REGISTRY.register(_RuntimeCollector())
+
+def register_runtime(component: str, stats_fn: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Report a component's stats() (in_flight, queued, rejected, coalesced) on /metrics.
+    """
+    with _runtime_lock:
+        _runtime_sources[component] = stats_fn
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+def observe_document(pdf_data: Dict[str, Any]) -> None:
+    """
+    Count the pages and characters of a freshly parsed document.
+    """
+    pages = pdf_data.get('page_count')
+    if pages is None:
+        pages = len({passage['page'] for passage in pdf_data.get('page_chunks', [])})
+    PDF_PAGES.inc(pages)
+    PDF_TEXT_CHARS.inc(len(pdf_data.get('text', '')))
+
+def observe_page_timings(timings: List[Tuple[float, Optional[float]]]) -> None:
+    """
+    Record the page timings of extract_pages (its 'timings') parsed without a
+    stage_observer, e.g. by a batch in the parse worker pool.
+    """
+    for seconds, table_seconds in timings:
+        PAGE_PARSE_DURATION.observe(seconds)
+        if table_seconds is not None:
+            TABLE_EXTRACTION_DURATION.observe(table_seconds)
+
+def stage_observer(on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Callable[[str, Dict[str, Any]], None]:
+    """
+    Wrap a pipeline progress callback so the time between stage events is recorded.
+
+    Each stage is timed from the previous stage event (or from when the wrapper
+    was created) to its own event. Per-page events (page_parsed) do not end a
+    stage; the page's own "seconds" and "table_seconds" are recorded in the
+    page parse and table extraction histograms instead.
+    Wrapping an already wrapped callback returns it unchanged.
+
+    Args:
+        on_stage (Callable, optional): The callback to forward events to
+
+    Returns:
+        Callable: A callback with the same signature
+    """
+    if getattr(on_stage, "observes_stages", False):
+        return on_stage
+    last = [time.monotonic()]
+
+    def observe(stage: str, payload: Optional[Dict[str, Any]] = None) -> None:
+        if stage == "page_parsed":
+            if payload and payload.get("seconds") is not None:
+                PAGE_PARSE_DURATION.observe(payload["seconds"])
+            if payload and payload.get("table_seconds") is not None:
+                TABLE_EXTRACTION_DURATION.observe(payload["table_seconds"])
+        else:
+            now = time.monotonic()
+            STAGE_DURATION.labels(stage=stage).observe(now - last[0])
+            last[0] = now
+        if on_stage:
+            on_stage(stage, payload)
+
+    observe.observes_stages = True
+    return observe
+
+def render_latest() -> bytes:
+    """
+    Render all metrics in the Prometheus text format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (e.g. under gunicorn with several
+    workers) the counters and histograms of all workers are aggregated; the
+    in-flight gauges then describe the worker serving the scrape.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_RuntimeCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,207 @@
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Optional, Tuple
+
+from .value_parser import parse_value
+
+# Identity fields of a snapshot, as the extraction prompts return them
+IDENTITY_FIELDS = ("company_name", "fiscal_year", "fiscal_period")
+
+@dataclass(slots=True)
+class FinancialSnapshot:
+    """
+    One company's extracted financial data for one period.
+
+    A slotted object is a fraction of the size of the equivalent dict (about
+    270 bytes against 840), which matters when batch screening or the
+    analysis store holds many snapshots at once. Metric fields are floats or
+    None; the field order is the order of results["extracted_data"].
+    """
+
+    company_name: Optional[str] = None
+    fiscal_year: Optional[str] = None
+    fiscal_period: Optional[str] = None
+    # Income statement
+    revenue: Optional[float] = None
+    cogs: Optional[float] = None
+    gross_profit: Optional[float] = None
+    operating_expenses: Optional[float] = None
+    operating_income: Optional[float] = None
+    interest_expense: Optional[float] = None
+    net_income: Optional[float] = None
+    # Balance sheet
+    cash_and_equivalents: Optional[float] = None
+    accounts_receivable: Optional[float] = None
+    inventory: Optional[float] = None
+    total_current_assets: Optional[float] = None
+    ppe: Optional[float] = None
+    total_assets: Optional[float] = None
+    accounts_payable: Optional[float] = None
+    short_term_debt: Optional[float] = None
+    total_current_liabilities: Optional[float] = None
+    long_term_debt: Optional[float] = None
+    total_liabilities: Optional[float] = None
+    stockholders_equity: Optional[float] = None
+    outstanding_shares: Optional[float] = None
+    # Cash flow statement
+    operating_cash_flow: Optional[float] = None
+    capex: Optional[float] = None
+    investing_cash_flow: Optional[float] = None
+    financing_cash_flow: Optional[float] = None
+    free_cash_flow: Optional[float] = None
+    # Derived from the debt fields (or reported directly by older extractions)
+    total_debt: Optional[float] = None
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "FinancialSnapshot":
+        """
+        Build a snapshot from raw extracted data, parsing every metric.
+
+        Total debt is the reported total_debt when the data has one and neither
+        debt component, otherwise short-term plus long-term debt (missing
+        components count as zero).
+
+        Args:
+            data (Dict[str, Any]): Output of an extraction function
+
+        Returns:
+            FinancialSnapshot: The parsed snapshot
+        """
+        snapshot = cls(*[data.get(name) for name in IDENTITY_FIELDS],
+                       *[parse_value(data.get(metric)) for metric in FINANCIAL_METRICS])
+        if "total_debt" in data and snapshot.short_term_debt is None and snapshot.long_term_debt is None:
+            snapshot.total_debt = parse_value(data.get("total_debt"))
+        else:
+            snapshot.total_debt = (snapshot.short_term_debt or 0) + (snapshot.long_term_debt or 0)
+        return snapshot
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "FinancialSnapshot":
+        """
+        Snapshot from the output of to_json or extracted_data (values are used as they are).
+        """
+        return cls(*[data.get(name) for name in SNAPSHOT_FIELDS])
+
+    def extracted_data(self) -> Dict[str, Optional[float]]:
+        """
+        The metrics as results["extracted_data"]: every metric, then total_debt.
+        """
+        return {name: getattr(self, name) for name in EXTRACTED_FIELDS}
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Every field, identity first; from_json(to_json()) gives an equal snapshot.
+        """
+        return {name: getattr(self, name) for name in SNAPSHOT_FIELDS}
+
+SNAPSHOT_FIELDS = tuple(f.name for f in fields(FinancialSnapshot))
+# Metrics read from the extracted data, in the order they appear in results["extracted_data"]
+FINANCIAL_METRICS = [name for name in SNAPSHOT_FIELDS if name not in IDENTITY_FIELDS and name != "total_debt"]
+EXTRACTED_FIELDS = tuple(FINANCIAL_METRICS) + ("total_debt",)
+
+@dataclass(slots=True)
+class Score:
+    """
+    Score of one ratio, as in results["scores"].
+
+    Optional parts are left out of to_json when unset, as in the dicts the
+    pipeline builds.
+    """
+
+    score: int
+    interpretation: str
+    peer_percentile: Optional[float] = None
+    peer_count: Optional[int] = None
+    llm_interpretation: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Score":
+        return cls(data["score"], data["interpretation"], data.get("peer_percentile"),
+                   data.get("peer_count"), data.get("llm_interpretation"))
+
+    def to_json(self) -> Dict[str, Any]:
+        data = {"score": self.score, "interpretation": self.interpretation}
+        if self.peer_percentile is not None:
+            data["peer_percentile"] = self.peer_percentile
+            data["peer_count"] = self.peer_count
+        if self.llm_interpretation is not None:
+            data["llm_interpretation"] = self.llm_interpretation
+        return data
+
+# Key orders seen so far, shared between results so each keeps only a reference
+_KEY_ORDERS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+@dataclass(slots=True)
+class AnalysisResult:
+    """
+    A finished analysis: the typed core of the results dictionary plus
+    everything else it holds (LLM outputs, recommendation, ids) as is.
+
+    to_json rebuilds the dictionary with the same keys in the same order, so
+    AnalysisResult.from_json(results).to_json() == results, and serializes to
+    the same JSON.
+    """
+
+    company_name: Optional[str]
+    fiscal_year: Optional[str]
+    fiscal_period: Optional[str]
+    extracted_data: FinancialSnapshot
+    ratios: Dict[str, float]
+    scores: Dict[str, Score]
+    extra: Dict[str, Any] = field(default_factory=dict)
+    key_order: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_json(cls, results: Dict[str, Any]) -> "AnalysisResult":
+        """
+        Typed view of the output of calculate_financial_ratios or a stored result.
+
+        Args:
+            results (Dict[str, Any]): The results dictionary
+
+        Returns:
+            AnalysisResult: The analysis; the dictionary is not modified
+        """
+        keys = tuple(results)
+        extra = {key: value for key, value in results.items() if key not in _CORE_KEYS}
+        return cls(
+            results.get("company_name"),
+            results.get("fiscal_year"),
+            results.get("fiscal_period"),
+            FinancialSnapshot.from_json(results.get("extracted_data") or {}),
+            dict(results.get("ratios") or {}),
+            {name: Score.from_json(score) for name, score in (results.get("scores") or {}).items()},
+            extra,
+            _KEY_ORDERS.setdefault(keys, keys)
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        The results dictionary, with the keys in their original order.
+        """
+        core = {
+            "company_name": self.company_name,
+            "fiscal_year": self.fiscal_year,
+            "fiscal_period": self.fiscal_period,
+            "extracted_data": self.extracted_data.extracted_data(),
+            "ratios": dict(self.ratios),
+            "scores": {name: score.to_json() for name, score in self.scores.items()},
+        }
+        results = {}
+        for key in self.key_order or (*core, *self.extra):
+            if key in core:
+                results[key] = core[key]
+            elif key in self.extra:
+                results[key] = self.extra[key]
+        for key, value in self.extra.items():
+            results.setdefault(key, value)
+        return results
+
+_CORE_KEYS = frozenset(("company_name", "fiscal_year", "fiscal_period", "extracted_data", "ratios", "scores"))
+
+def snapshot_from_result(results: Dict[str, Any]) -> FinancialSnapshot:
+    """
+    The extracted data of a results dictionary, with its identity fields filled in.
+    """
+    extracted = results.get("extracted_data") or {}
+    return FinancialSnapshot(*[results.get(name) for name in IDENTITY_FIELDS],
+                             *[extracted.get(name) for name in EXTRACTED_FIELDS])
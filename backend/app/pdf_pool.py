@@ -0,0 +1,374 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, BinaryIO, Callable, List, Optional
+
+from .pdf_processor import extract_pages, build_document, count_pages
+
+# Pages parsed per job: long filings are split across the workers, and a
+# runaway page only costs its own range
+PAGES_PER_JOB = 50
+# Jobs a worker runs before it is replaced, so memory that pdfminer keeps
+# growing (font and object caches) is returned to the system; the
+# PARSE_WORKER_MAX_JOBS environment variable overrides it
+MAX_JOBS_PER_WORKER = 50
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+class ParseTimeout(Exception):
+    """
+    Raised when a parse job takes longer than allowed; its worker is killed.
+    """
+
+class ParseWorkerError(Exception):
+    """
+    Raised when a worker process dies while running a job (e.g. a crash in a
+    native library, or the out-of-memory killer); the worker is replaced.
+    """
+
+def _worker_main(connection) -> None:
+    # Runs in the worker process: pay the parser imports once, then run jobs
+    # until told to stop (None) or the pool goes away
+    import pdfplumber  # noqa: F401
+    import pdfminer.pdfinterp  # noqa: F401
+    from . import ixbrl  # noqa: F401
+
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        fn, args, kwargs = job
+        try:
+            reply = (True, fn(*args, **kwargs))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # The result or the exception could not be pickled
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+class _Worker:
+    """
+    One worker process and the parent's end of its pipe.
+    """
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), daemon=True, name="pdf-parse-worker")
+        self.process.start()
+        child.close()  # So a dead worker shows up as EOF on our end
+        self.jobs = 0
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+class ParseWorkerPool:
+    """
+    A fixed set of long-lived, warm parse worker processes.
+
+    The workers are started (spawned, so they do not inherit the server's
+    threads or locks) when the pool is created and import pdfplumber and
+    pdfminer before their first job. Each one is driven by a dispatcher thread
+    that hands it jobs from a shared queue, kills it when a job runs past its
+    timeout, and replaces it after max_jobs_per_worker jobs or when it dies;
+    either way the replacement is started right away so it is warm by the next job.
+
+    Args:
+        max_workers (int): Number of worker processes
+        max_jobs_per_worker (int): Jobs a worker runs before it is replaced
+    """
+
+    def __init__(self, max_workers: int, max_jobs_per_worker: int = MAX_JOBS_PER_WORKER):
+        self.max_workers = max_workers
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self.in_flight = 0
+        self.queued = 0  # Jobs in the queue, without the shutdown sentinels
+        self.timed_out = 0
+        self.recycled = 0
+        self.crashed = 0
+        self._threads = [
+            threading.Thread(target=self._dispatch, name=f"pdf-parse-dispatch-{index}", daemon=True)
+            for index in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        """
+        Run fn(*args, **kwargs) in a worker. fn must be a module-level function
+        and its arguments and result picklable.
+
+        Args:
+            fn (Callable): The job
+            timeout (float, optional): Seconds the job may run once a worker has
+                                       taken it; the worker is then killed and
+                                       the future fails with ParseTimeout
+
+        Returns:
+            Future: The job's result
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("The parse pool has been shut down")
+            self._jobs.put((future, fn, args, kwargs, timeout))
+            self.queued += 1
+        return future
+
+    def _replace(self, worker: Optional[_Worker], stop: bool = False) -> Optional[_Worker]:
+        # Kill (or stop) a worker and start its replacement. A replacement that
+        # fails to start is printed and retried at the next job, so the
+        # dispatcher thread keeps running; meanwhile there is no worker (None)
+        if worker is not None:
+            try:
+                if stop:
+                    worker.stop()
+                else:
+                    worker.kill()
+            except Exception as e:
+                print(f"Error stopping a PDF parse worker: {e}")
+        try:
+            return _Worker(self._context)
+        except Exception as e:
+            print(f"Error starting a PDF parse worker: {e}")
+            return None
+
+    def _dispatch(self) -> None:
+        worker = self._replace(None)
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            with self._lock:
+                self.queued -= 1
+            future, fn, args, kwargs, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if worker is None:
+                worker = self._replace(None)
+                if worker is None:
+                    future.set_exception(ParseWorkerError("No PDF parse worker could be started"))
+                    continue
+            with self._lock:
+                self.in_flight += 1
+            sent = False
+            try:
+                worker.connection.send((fn, args, kwargs))
+                sent = True
+                if not worker.connection.poll(timeout):
+                    worker = self._replace(worker)
+                    with self._lock:
+                        self.timed_out += 1
+                    future.set_exception(ParseTimeout(f"PDF parsing timed out after {timeout:g} seconds"))
+                    continue
+                ok, value = worker.connection.recv()
+            except (EOFError, OSError):
+                worker.kill()
+                exit_code = worker.process.exitcode
+                worker = self._replace(None)
+                with self._lock:
+                    self.crashed += 1
+                future.set_exception(ParseWorkerError(f"PDF parse worker died with exit code {exit_code}"))
+                continue
+            except Exception as e:
+                # The job or its reply could not be pickled. A job that was
+                # sent leaves the worker in an unknown state, so it is replaced
+                if sent:
+                    worker = self._replace(worker)
+                future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+            worker.jobs += 1
+            if worker.jobs >= self.max_jobs_per_worker:
+                worker = self._replace(worker, stop=True)
+                with self._lock:
+                    self.recycled += 1
+        if worker is not None:
+            worker.stop()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Cancel the queued jobs and stop the workers once their running jobs are done.
+        """
+        with self._lock:
+            self._shutdown = True
+            while True:
+                try:
+                    item = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    self.queued -= 1
+                    item[0].cancel()
+            for _ in self._threads:
+                self._jobs.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "workers": self.max_workers,
+                "timed_out": self.timed_out,
+                "recycled": self.recycled,
+                "crashed": self.crashed
+            }
+
+def get_parse_pool(max_workers: int, max_jobs_per_worker: Optional[int] = None) -> ParseWorkerPool:
+    """
+    Return the worker pool used for CPU-bound PDF parsing, starting it on first use.
+    The pool is shared by every request and batch in this process; the sizes
+    only apply when it is started. Without max_jobs_per_worker, the pool
+    recycles its workers after PARSE_WORKER_MAX_JOBS jobs (default
+    MAX_JOBS_PER_WORKER), as when the app starts it.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            if max_jobs_per_worker is None:
+                max_jobs_per_worker = int(os.getenv('PARSE_WORKER_MAX_JOBS', str(MAX_JOBS_PER_WORKER)))
+            _parse_pool = ParseWorkerPool(max_workers, max_jobs_per_worker)
+        return _parse_pool
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown()
+            _parse_pool = None
+
+def parse_pool_stats() -> Dict[str, Any]:
+    """
+    stats() of the parse pool, or nothing if it has not been started.
+    """
+    pool = _parse_pool
+    return pool.stats() if pool is not None else {}
+
+def page_ranges(page_count: int, pages_per_job: int = PAGES_PER_JOB) -> List[tuple]:
+    """
+    Split pages 1..page_count into (first, last) ranges of at most pages_per_job pages.
+    """
+    return [(first, min(first + pages_per_job - 1, page_count)) for first in range(1, page_count + 1, pages_per_job)]
+
+def parse_in_pool(source: str | BinaryIO, max_workers: int, timeout: Optional[float] = None,
+                  include_tables: bool = True, pages_per_job: int = PAGES_PER_JOB,
+                  on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Parse a PDF in the worker pool so the CPU work does not hold the GIL of the
+    server process.
+
+    A worker first counts the pages, so a PDF that hangs or crashes the parser
+    never does so in the server process. The workers are then given the file
+    path and a page range each, and send back page records (see
+    extract_pages), which are assembled here. A stream is first written to a
+    temporary file. The page_parsed events, with the workers' page timings,
+    are sent from this process as each range arrives.
+
+    Args:
+        source (str | BinaryIO): Path to the PDF, or a seekable stream of it
+        max_workers (int): Size of the pool if it has to be started
+        timeout (float, optional): Seconds the whole document may take,
+                                   waiting for free workers included; each job
+                                   (the page count and every page range) also
+                                   has its worker killed after this long
+        include_tables (bool): Whether to detect tables (see extract_text_and_tables)
+        pages_per_job (int): Pages per job
+        on_progress (Callable, optional): See extract_text_and_tables
+
+    Returns:
+        Dict[str, Any]: Output of extract_text_and_tables
+
+    Raises:
+        ParseTimeout: If the document or one of its jobs took longer than timeout
+        ParseWorkerError: If a worker died while parsing
+    """
+    pool = get_parse_pool(max_workers)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    temp_path = None
+    if isinstance(source, str):
+        path = source
+    else:
+        source.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp:
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                temp.write(block)
+        path = temp_path = temp.name
+
+    def result(future: Future):
+        # Waits no longer than what is left of the document's time
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except FutureTimeoutError:
+            raise ParseTimeout(f"PDF parsing timed out after {timeout:g} seconds") from None
+
+    try:
+        count = pool.submit(count_pages, path, timeout=timeout)
+        try:
+            page_count = result(count)
+        except (ParseTimeout, ParseWorkerError):
+            count.cancel()
+            raise
+        except Exception as e:
+            print(f"Error extracting content from PDF {path}: {e}")
+            return build_document([], 0, include_tables)
+
+        futures = [
+            pool.submit(extract_pages, path, first, last, include_tables, timeout=timeout)
+            for first, last in page_ranges(page_count, pages_per_job)
+        ]
+        try:
+            pages = []
+            for future in futures:
+                extracted = result(future)
+                pages.extend(extracted['pages'])
+                if on_progress:
+                    for (page_num, *_), (seconds, table_seconds) in zip(extracted['pages'], extracted['timings']):
+                        on_progress("page_parsed", {"page": page_num, "total_pages": page_count,
+                                                    "seconds": seconds, "table_seconds": table_seconds})
+        finally:
+            for future in futures:
+                future.cancel()
+        if len(pages) != page_count:
+            # A range could not be read; as with extract_text_and_tables, the document has no text
+            pages = []
+        return build_document(pages, page_count, include_tables, on_progress)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
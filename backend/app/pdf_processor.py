@@ -1,6 +1,137 @@
-import pdfplumber
 import re
-from typing import List, Dict, Any, Tuple
+import sys
+import time
+from typing import List, Dict, Any, Tuple, Callable, Optional, BinaryIO, Iterable
+
+# Page classes a backend can be chosen for: financial statement pages, whose
+# rows and tables need the layout-aware extraction, and prose pages (business
+# description, risk factors, MD&A), which only need their raw text
+PAGE_CLASSES = ("statement", "prose")
+DEFAULT_PAGE_BACKENDS = {"statement": "pdfplumber", "prose": "pdfminer"}
+
+# Target size of the document chunks (pdf_data["chunks"]); split_text_into_chunks
+# may run a chunk up to 200 characters past it to end at a paragraph break
+CHUNK_SIZE = 10000
+MAX_CHUNK_CHARS = CHUNK_SIZE + 200
+
+# Statement titles at the start of a line, e.g. "CONSOLIDATED BALANCE SHEETS"
+_STATEMENT_HEADING = re.compile(
+    r"^\s*(?:consolidated\s+)?(?:balance\s+sheets?|income\s+statements?|statements?\s+of\s+(?:consolidated\s+)?"
+    r"(?:operations|income|earnings|comprehensive\s+(?:income|loss)|cash\s+flows?|financial\s+(?:position|condition)|"
+    r"(?:stockholders|shareholders)['’]?\s+equity))\b",
+    re.IGNORECASE | re.MULTILINE
+)
+_NUMBER_TOKEN = re.compile(r"[($\-−–—]*\d[\d,.]*\)?%?")
+
+class PdfBackend:
+    """
+    Extracts the text, and optionally the tables, of the pages of one open
+    pdfplumber document. A backend object is created per document, so it may
+    keep per-document state such as font caches.
+    """
+
+    name = "base"
+    extracts_tables = False
+
+    def page_text(self, page) -> str:
+        raise NotImplementedError
+
+    def page_tables(self, page) -> List[List[List[Optional[str]]]]:
+        return []
+
+class PdfplumberBackend(PdfBackend):
+    """
+    pdfplumber's layout-aware text and table detection: the slow path, needed
+    for the rows and tables of the financial statements.
+    """
+
+    name = "pdfplumber"
+    extracts_tables = True
+
+    def page_text(self, page) -> str:
+        return page.extract_text() or ""
+
+    def page_tables(self, page) -> List[List[List[Optional[str]]]]:
+        return page.extract_tables()
+
+class PdfminerTextBackend(PdfBackend):
+    """
+    Raw text from pdfminer's content stream interpreter, without layout
+    analysis or table detection. Characters are written in stream order, with
+    a line break when the baseline moves and a space at horizontal gaps, which
+    keeps prose and simple statement rows readable at several times the speed
+    of pdfplumber.
+    """
+
+    name = "pdfminer"
+
+    def __init__(self):
+        from pdfminer.pdfinterp import PDFResourceManager
+        self._resources = PDFResourceManager(caching=True)
+
+    def page_text(self, page) -> str:
+        from pdfminer.pdfinterp import PDFPageInterpreter
+        device = _line_text_device()(self._resources)
+        PDFPageInterpreter(self._resources, device).process_page(page.page_obj)
+        return "".join(device.parts)
+
+PDF_BACKENDS = {backend.name: backend for backend in (PdfplumberBackend, PdfminerTextBackend)}
+
+_LineTextDevice = None
+
+def _line_text_device():
+    # Built on first use so importing this module does not import pdfminer
+    global _LineTextDevice
+    if _LineTextDevice is None:
+        from pdfminer.pdfdevice import PDFTextDevice
+        from pdfminer.pdffont import PDFUnicodeNotDefined
+
+        class LineTextDevice(PDFTextDevice):
+            def __init__(self, resources):
+                super().__init__(resources)
+                self.parts = []
+                self._baseline = None
+                self._end = None
+
+            def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate) -> float:
+                try:
+                    text = font.to_unichr(cid)
+                except PDFUnicodeNotDefined:
+                    text = ""
+                advance = font.char_width(cid) * fontsize * scaling
+                size = abs(fontsize * matrix[3]) or abs(fontsize)
+                x, baseline = matrix[4], matrix[5]
+                if self._baseline is not None:
+                    if abs(baseline - self._baseline) > size * 0.5:
+                        self.parts.append("\n")
+                    elif abs(x - self._end) > size * 0.25 and self.parts[-1] != " " and text != " ":
+                        self.parts.append(" ")
+                self._baseline = baseline
+                self._end = x + advance * matrix[0]
+                self.parts.append(text)
+                return advance
+
+        _LineTextDevice = LineTextDevice
+    return _LineTextDevice
+
+def classify_page(text: str) -> str:
+    """
+    Page class of a page from its text: "statement" if a line starts with a
+    financial statement title or at least a fifth of its words (and six or
+    more) are numbers, such as the continuation page of a statement; "prose"
+    otherwise.
+
+    Args:
+        text (str): The page text, from any backend
+
+    Returns:
+        str: "statement" or "prose"
+    """
+    if _STATEMENT_HEADING.search(text):
+        return "statement"
+    words = text.split()
+    numbers = sum(1 for word in words if _NUMBER_TOKEN.fullmatch(word))
+    return "statement" if numbers >= 6 and numbers * 5 >= len(words) else "prose"
 
 def extract_text_from_pdf(filepath: str) -> str:
     """
@@ -13,6 +144,7 @@ def extract_text_from_pdf(filepath: str) -> str:
         str: The concatenated text from all pages of the PDF.
              Returns an empty string if no text can be extracted.
     """
+    import pdfplumber  # Imported here so importing this module stays cheap
     pdf_text = ""
     try:
         with pdfplumber.open(filepath) as pdf:
@@ -25,12 +157,26 @@ def extract_text_from_pdf(filepath: str) -> str:
         # Optionally, re-raise or handle more gracefully
     return pdf_text
 
-def extract_text_and_tables(filepath: str) -> Dict[str, Any]:
+def extract_text_and_tables(filepath: str | BinaryIO, on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                            include_tables: bool = True) -> Dict[str, Any]:
     """
     Extracts both text and table data from a PDF file.
+
+    Each page is read with the backend DEFAULT_PAGE_BACKENDS gives its page
+    class (see PAGE_CLASSES): with the prose backend first, then, if it is
+    classified as a statement page, again with the statement backend. Only
+    pages read with a table-detecting backend contribute tables.
     
     Args:
-        filepath (str): The path to the PDF file.
+        filepath (str | BinaryIO): The path to the PDF file, or a seekable binary
+                                   stream of it (e.g. an in-memory upload).
+        on_progress (Callable, optional): Called as on_progress(event, payload) after
+                                          each page is parsed ("page_parsed") and once
+                                          the financial sections are located
+                                          ("sections_located").
+        include_tables (bool): Whether to detect tables. Table detection costs about
+                               as much as the text itself; the statement rows are
+                               in the page text either way.
         
     Returns:
         Dict: A dictionary containing:
@@ -38,77 +184,212 @@ def extract_text_and_tables(filepath: str) -> Dict[str, Any]:
             - 'tables': List of extracted tables
             - 'chunks': Text split into manageable chunks
             - 'financial_sections': Text from likely financial sections
+            - 'page_chunks': Page-aware passages used for retrieval
+            - 'page_count': Number of pages in the PDF
+            - 'tables_extracted': Whether tables were detected
+            - 'statement_pages': Numbers of the pages classified as statement pages
+                                 (empty if every page class uses the same backend)
+    """
+    extracted = extract_pages(filepath, include_tables=include_tables, on_progress=on_progress)
+    return build_document(extracted['pages'], extracted['page_count'], include_tables, on_progress)
+
+def count_pages(filepath: str | BinaryIO) -> int:
+    """
+    Number of pages of a PDF, without extracting anything from them.
+    """
+    import pdfplumber
+    with pdfplumber.open(filepath) as pdf:
+        return len(pdf.pages)
+
+def extract_pages(filepath: str | BinaryIO, first_page: int = 1, last_page: Optional[int] = None,
+                  include_tables: bool = True, on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Extract a range of pages of a PDF as compact page records, the unit of
+    work of the parse pool; build_document assembles them into the document.
+
+    Each record is a (page number, text, tables, is_statement) tuple, where
+    tables are the raw cell rows of the tables detected on the page. If the PDF
+    cannot be read, the error is printed and no records are returned.
+
+    Each page is timed: the seconds spent reading its text and detecting its
+    tables are given in the page_parsed payload ("seconds", "table_seconds")
+    and in 'timings', so a worker process can report them to its parent.
+
+    Args:
+        filepath (str | BinaryIO): The path to the PDF file, or a seekable binary stream of it
+        first_page (int): First page to extract, from 1
+        last_page (int, optional): Last page to extract (inclusive); the last page of the PDF if None
+        include_tables (bool): Whether to detect tables (see extract_text_and_tables)
+        on_progress (Callable, optional): Called as on_progress("page_parsed", payload) after each page
+
+    Returns:
+        Dict: 'pages' (the page records, in page order), 'page_count' (pages in
+              the whole PDF) and 'timings' (a (text seconds, table seconds or
+              None) pair per record)
+    """
+    import pdfplumber  # Imported here so importing this module stays cheap
+    records = []
+    timings = []
+    page_count = 0
+
+    try:
+        with pdfplumber.open(filepath) as pdf:
+            # One backend object per distinct backend, shared by the page classes using it
+            backends = {name: PDF_BACKENDS[name]() for name in set(DEFAULT_PAGE_BACKENDS.values())}
+            statement_backend = backends[DEFAULT_PAGE_BACKENDS["statement"]]
+            prose_backend = backends[DEFAULT_PAGE_BACKENDS["prose"]]
+
+            page_count = len(pdf.pages)
+            last_page = page_count if last_page is None else min(last_page, page_count)
+            for page_num in range(first_page, last_page + 1):
+                started = time.perf_counter()
+                page = pdf.pages[page_num - 1]
+                backend = prose_backend
+                text = backend.page_text(page)
+                is_statement = statement_backend is not prose_backend and classify_page(text) == "statement"
+                if is_statement:
+                    backend = statement_backend
+                    text = backend.page_text(page)
+                text_done = time.perf_counter()
+                tables = backend.page_tables(page) if include_tables else []
+                table_seconds = time.perf_counter() - text_done if include_tables else None
+                records.append((page_num, text, tables, is_statement))
+                timings.append((text_done - started, table_seconds))
+
+                if on_progress:
+                    on_progress("page_parsed", {"page": page_num, "total_pages": page_count,
+                                                "seconds": text_done - started, "table_seconds": table_seconds})
+    except Exception as e:
+        source = filepath if isinstance(filepath, str) else "stream"
+        print(f"Error extracting content from PDF {source}: {e}")
+        records = []
+        timings = []
+
+    return {'pages': records, 'page_count': page_count, 'timings': timings}
+
+def build_document(pages: List[Tuple[int, str, list, bool]], page_count: int, include_tables: bool = True,
+                   on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Assemble the page records of extract_pages, in page order, into the
+    document dictionary returned by extract_text_and_tables.
+
+    Args:
+        pages (List[Tuple]): The page records of the whole document
+        page_count (int): Number of pages in the PDF
+        include_tables (bool): Whether the records were extracted with table detection
+        on_progress (Callable, optional): Called as on_progress("sections_located", payload)
+
+    Returns:
+        Dict: See extract_text_and_tables
     """
     result = {
         'text': '',
         'tables': [],
         'chunks': [],
-        'financial_sections': ''
+        'financial_sections': '',
+        'page_chunks': [],
+        'page_count': page_count,
+        'tables_extracted': include_tables,
+        'statement_pages': []
     }
-    
-    try:
-        with pdfplumber.open(filepath) as pdf:
-            full_text = ""
-            tables_text = ""
-            
-            # Financial section keywords to look for
-            financial_keywords = [
-                "consolidated statements",
-                "balance sheet",
-                "income statement",
-                "statement of operations",
-                "cash flow",
-                "financial data",
-                "financial results",
-                "financial statements",
-                "financial highlights"
-            ]
-            
-            # Extract text and tables from each page
-            for page_num, page in enumerate(pdf.pages, 1):
-                # Extract regular text
-                text = page.extract_text() or ""
-                full_text += f"\n--- Page {page_num} ---\n{text}"
-                
-                # Extract tables on this page
-                tables = page.extract_tables()
-                if tables:
-                    for i, table in enumerate(tables):
-                        if table:
-                            # Convert table to text format
-                            table_text = "\n".join([" | ".join([str(cell) if cell else "" for cell in row]) for row in table])
-                            tables_text += f"\n--- Table on Page {page_num}, #{i+1} ---\n{table_text}\n"
-                            result['tables'].append({
-                                'page': page_num,
-                                'table_num': i+1,
-                                'content': table
-                            })
-            
-            # Combine full text with table text
-            combined_text = full_text + "\n\n" + tables_text
-            result['text'] = combined_text
-            
-            # Split into chunks of approximately 10,000 characters each
-            chunks = split_text_into_chunks(combined_text, 10000)
-            result['chunks'] = chunks
-            
-            # Extract sections likely containing financial data
-            financial_section_text = ""
-            for keyword in financial_keywords:
-                # Find all occurrences of the keyword
-                pattern = re.compile(f"(.{{0,300}}{re.escape(keyword)}.{{0,2000}})", re.IGNORECASE | re.DOTALL)
-                matches = pattern.findall(combined_text)
-                if matches:
-                    for match in matches:
-                        financial_section_text += match + "\n\n"
-            
-            result['financial_sections'] = financial_section_text
-                
-    except Exception as e:
-        print(f"Error extracting content from PDF {filepath}: {e}")
-        
+    if not pages:
+        return result
+
+    full_text = ""
+    tables_text = ""
+    page_texts = []
+
+    # Financial section keywords to look for
+    financial_keywords = [
+        "consolidated statements",
+        "balance sheet",
+        "income statement",
+        "statement of operations",
+        "cash flow",
+        "financial data",
+        "financial results",
+        "financial statements",
+        "financial highlights"
+    ]
+
+    for page_num, text, tables, is_statement in pages:
+        full_text += f"\n--- Page {page_num} ---\n{text}"
+        page_texts.append((page_num, text))
+        if is_statement:
+            result['statement_pages'].append(page_num)
+
+        for i, table in enumerate(tables):
+            if table:
+                # Convert table to text format
+                table_text = "\n".join([" | ".join([str(cell) if cell else "" for cell in row]) for row in table])
+                tables_text += f"\n--- Table on Page {page_num}, #{i+1} ---\n{table_text}\n"
+                page_texts.append((page_num, table_text))
+                result['tables'].append({
+                    'page': page_num,
+                    'table_num': i+1,
+                    'content': table
+                })
+
+    # Combine full text with table text
+    combined_text = full_text + "\n\n" + tables_text
+    result['text'] = combined_text
+
+    # Split into chunks of approximately 10,000 characters each
+    chunks = split_text_into_chunks(combined_text, CHUNK_SIZE)
+    result['chunks'] = chunks
+
+    # Keep page-aware passages so follow-up questions can cite their source
+    result['page_chunks'] = split_pages_into_passages(page_texts)
+
+    # Extract sections likely containing financial data
+    financial_section_text = ""
+    for keyword in financial_keywords:
+        for match in keyword_windows(combined_text, keyword):
+            financial_section_text += match + "\n\n"
+
+    result['financial_sections'] = financial_section_text
+    if on_progress:
+        on_progress("sections_located", {
+            "financial_sections_chars": len(financial_section_text),
+            "tables": len(result['tables'])
+        })
+
     return result
 
+def keyword_windows(text: str, keyword: str, before: int = 300, after: int = 2000) -> List[str]:
+    """
+    The passages around the occurrences of a keyword: the same non-overlapping
+    matches as re.findall(f"(.{{0,{before}}}{keyword}.{{0,{after}}})", text,
+    re.IGNORECASE | re.DOTALL), found from the keyword occurrences instead of
+    by trying the pattern at every position of the text (which took most of
+    the parsing time of a long filing).
+
+    Args:
+        text (str): The text to search
+        keyword (str): The keyword, matched literally and case-insensitively
+        before (int): Characters kept before the keyword
+        after (int): Characters kept after the keyword
+
+    Returns:
+        List[str]: The passages, in order
+    """
+    starts = [match.start() for match in re.finditer(re.escape(keyword), text, re.IGNORECASE)]
+    windows = []
+    position = 0
+    index = 0
+    while index < len(starts):
+        if starts[index] < position:
+            index += 1
+            continue
+        begin = max(position, starts[index] - before)
+        # The greedy prefix reaches the last occurrence starting within `before` characters
+        while index + 1 < len(starts) and starts[index + 1] <= begin + before:
+            index += 1
+        position = min(len(text), starts[index] + len(keyword) + after)
+        windows.append(text[begin:position])
+        index += 1
+    return windows
+
 def split_text_into_chunks(text: str, chunk_size: int = 10000) -> List[str]:
     """
     Splits text into chunks of approximately the specified size.
@@ -148,3 +429,79 @@ def split_text_into_chunks(text: str, chunk_size: int = 10000) -> List[str]:
         current_pos = end_pos
     
     return chunks
+
+def split_pages_into_passages(page_texts: List[Tuple[int, str]], passage_size: int = 1500) -> List[Dict[str, Any]]:
+    """
+    Splits per-page text into small passages that remember their page number.
+
+    Args:
+        page_texts (List[Tuple[int, str]]): (page number, text) pairs, one per page
+                                            text block or table
+        passage_size (int): Target size for each passage
+
+    Returns:
+        List[Dict[str, Any]]: Passages with 'id', 'page' and 'text' keys
+    """
+    passages = []
+    for page_num, text in page_texts:
+        if not text or not text.strip():
+            continue
+        for passage in split_text_into_chunks(text, passage_size):
+            if passage.strip():
+                passages.append({
+                    'id': len(passages),
+                    'page': page_num,
+                    'text': passage.strip()
+                })
+    return passages
+
+def benchmark_backends(paths: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Pages per second of each backend, and of the default per-class choice, on a
+    corpus of PDFs.
+
+    Args:
+        paths (Iterable[str]): The PDFs of the benchmark corpus
+
+    Returns:
+        Dict[str, Dict[str, float]]: 'pages', 'seconds' and 'pages_per_second'
+                                     for each backend's text ("<name>"), for
+                                     pdfplumber with tables ("pdfplumber+tables")
+                                     and for extract_text_and_tables with
+                                     DEFAULT_PAGE_BACKENDS ("per-class")
+    """
+    import pdfplumber
+    paths = list(paths)
+    timings = {}
+
+    def record(label, pages, seconds):
+        timing = timings.setdefault(label, {"pages": 0, "seconds": 0.0})
+        timing["pages"] += pages
+        timing["seconds"] += seconds
+
+    for path in paths:
+        for name, backend_class in PDF_BACKENDS.items():
+            for label, with_tables in ((name, False), (f"{name}+tables", True)):
+                if with_tables and not backend_class.extracts_tables:
+                    continue
+                with pdfplumber.open(path) as pdf:
+                    started = time.perf_counter()
+                    backend = backend_class()
+                    for page in pdf.pages:
+                        backend.page_text(page)
+                        if with_tables:
+                            backend.page_tables(page)
+                    record(label, len(pdf.pages), time.perf_counter() - started)
+        started = time.perf_counter()
+        parsed = extract_text_and_tables(path)
+        record("per-class", parsed['page_count'], time.perf_counter() - started)
+
+    for timing in timings.values():
+        timing["seconds"] = round(timing["seconds"], 3)
+        timing["pages_per_second"] = round(timing["pages"] / timing["seconds"], 1) if timing["seconds"] else 0.0
+    return timings
+
+if __name__ == '__main__':
+    # python -m app.pdf_processor corpus/*.pdf
+    for label, timing in benchmark_backends(sys.argv[1:]).items():
+        print(f"{label:20s} {timing['pages']:6d} pages {timing['seconds']:9.3f}s {timing['pages_per_second']:8.1f} pages/s")
@@ -0,0 +1,169 @@
+import json
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# Fewer peers than this in a group and no percentile is reported
+PEER_MIN_COUNT = 5
+
+_YEAR_PATTERN = re.compile(r"(?:19|20)\d{2}")
+
+def normalize_fiscal_year(fiscal_year: Any) -> Optional[str]:
+    """
+    The four-digit year of a fiscal year label ("FY2024", "2024", 2024), or None.
+    """
+    match = _YEAR_PATTERN.search(str(fiscal_year or ""))
+    return match.group(0) if match else None
+
+def normalize_sector(sector: Any) -> Optional[str]:
+    """
+    Sector name as used for grouping: trimmed and lowercased, None if empty.
+    """
+    sector = str(sector or "").strip().lower()
+    return sector or None
+
+class PeerIndex:
+    """
+    Sorted ratio values of stored analyses, grouped by fiscal year and sector.
+
+    Every ratio of every group is kept as a sorted list, so placing a new
+    company among its peers is two binary searches per ratio instead of a
+    pass over all stored analyses. Each document counts once, with the ratios
+    of its most recently stored analysis; an analysis with a sector is also
+    counted in the all-sector group of its fiscal year.
+
+    The index is fed rows in store order (see AnalysisStore.peers) and remembers
+    the last row it has seen, so keeping it current costs only the new rows.
+    """
+
+    def __init__(self):
+        self.watermark = 0
+        self._groups: Dict[Tuple[str, Optional[str]], Dict[str, List[float]]] = {}
+        self._documents: Dict[str, Tuple[str, Optional[str], Dict[str, float]]] = {}
+        self._sizes: Dict[Tuple[str, Optional[str]], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _group_keys(fiscal_year: str, sector: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+        return [(fiscal_year, None)] + ([(fiscal_year, sector)] if sector else [])
+
+    def _remove(self, document_id: str) -> None:
+        previous = self._documents.pop(document_id, None)
+        if previous is None:
+            return
+        fiscal_year, sector, ratios = previous
+        for group_key in self._group_keys(fiscal_year, sector):
+            self._sizes[group_key] -= 1
+            group = self._groups[group_key]
+            for name, value in ratios.items():
+                values = group[name]
+                del values[bisect_left(values, value)]
+
+    def _add(self, document_id: str, fiscal_year: str, sector: Optional[str], ratios: Dict[str, float]) -> None:
+        self._documents[document_id] = (fiscal_year, sector, ratios)
+        for group_key in self._group_keys(fiscal_year, sector):
+            self._sizes[group_key] = self._sizes.get(group_key, 0) + 1
+            group = self._groups.setdefault(group_key, {})
+            for name, value in ratios.items():
+                insort(group.setdefault(name, []), value)
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add stored analyses to the index, replacing earlier analyses of the same document.
+
+        Args:
+            rows (Iterable[Dict[str, Any]]): Rows with "rowid", "document_id",
+                                             "fiscal_year", "sector" and "ratios"
+                                             (a dict or its JSON), in rowid order
+
+        Returns:
+            int: Number of rows applied
+        """
+        count = 0
+        with self._lock:
+            for row in rows:
+                # Rows already applied by a concurrent update are skipped
+                if row["rowid"] <= self.watermark:
+                    continue
+                count += 1
+                self.watermark = row["rowid"]
+                ratios = row.get("ratios")
+                if isinstance(ratios, str):
+                    ratios = json.loads(ratios)
+                fiscal_year = normalize_fiscal_year(row.get("fiscal_year"))
+                self._remove(row["document_id"])
+                if fiscal_year is None or not ratios:
+                    continue
+                ratios = {
+                    name: float(value) for name, value in ratios.items()
+                    if isinstance(value, (int, float)) and math.isfinite(value)
+                }
+                self._add(row["document_id"], fiscal_year, normalize_sector(row.get("sector")), ratios)
+        return count
+
+    def percentiles(self, ratios: Dict[str, Any], fiscal_year: Any, sector: Optional[str] = None,
+                    exclude: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Where each ratio falls among the stored analyses of the same fiscal year.
+
+        The sector group is used when a sector is given and it has at least
+        PEER_MIN_COUNT documents; otherwise all sectors of the year are used.
+        A percentile is the share of peers with a lower value, counting ties
+        as half, so 50 is the median whatever the direction of the ratio.
+
+        Args:
+            ratios (Dict[str, Any]): Ratio values, e.g. results["ratios"]
+            fiscal_year (Any): Fiscal year of the analysis
+            sector (str, optional): Sector of the company
+            exclude (str, optional): Document id to leave out of the peers, so an
+                                     earlier analysis of the same filing is not
+                                     counted as its own peer
+
+        Returns:
+            Dict: {"group": {"fiscal_year", "sector", "documents"},
+                   "ratios": {name: {"percentile", "peers"}}}, with "ratios" empty
+                  when the group has too few peers
+        """
+        year = normalize_fiscal_year(fiscal_year)
+        sector = normalize_sector(sector)
+        if year is None:
+            return {"group": None, "ratios": {}}
+
+        with self._lock:
+            own = self._documents.get(exclude) if exclude else None
+
+            def in_group(entry, group_key):
+                return entry[0] == group_key[0] and (group_key[1] is None or entry[1] == group_key[1])
+
+            def documents(group_key):
+                count = self._sizes.get(group_key, 0)
+                return count - 1 if own is not None and in_group(own, group_key) else count
+
+            group_key = (year, None)
+            if sector and documents((year, sector)) >= PEER_MIN_COUNT:
+                group_key = (year, sector)
+            size = documents(group_key)
+            group = self._groups.get(group_key, {})
+            own_ratios = own[2] if own is not None and in_group(own, group_key) else {}
+
+            placed = {}
+            for name, value in ratios.items():
+                values = group.get(name)
+                if not values or not isinstance(value, (int, float)) or not math.isfinite(value):
+                    continue
+                below = bisect_left(values, value)
+                equal = bisect_right(values, value, below) - below
+                peers = len(values)
+                previous = own_ratios.get(name)
+                if previous is not None:
+                    peers -= 1
+                    if previous < value:
+                        below -= 1
+                    elif previous == value:
+                        equal -= 1
+                if peers < PEER_MIN_COUNT:
+                    continue
+                placed[name] = {"percentile": round(100 * (below + 0.5 * equal) / peers, 1), "peers": peers}
+        return {"group": {"fiscal_year": year, "sector": group_key[1], "documents": size}, "ratios": placed}
@@ -0,0 +1,357 @@
+import datetime
+import importlib
+import time
+from typing import Dict, Any, Callable, Optional, BinaryIO
+
+from .pdf_processor import extract_text_and_tables
+from .pdf_pool import parse_in_pool
+from .llm_clients import (
+    extract_data_with_openrouter,
+    extract_data_with_gemini,
+    extract_financial_data_directly,
+    extract_mda_summary
+)
+from .financial_analyzer import calculate_financial_ratios
+from .rule_extraction import extract_financial_data_with_rules
+from .trends import analyze_trends, compute_trends
+from .ixbrl import is_inline_xbrl, parse_inline_xbrl
+from .peer_index import normalize_sector
+from .utils import compute_file_hash
+from .metrics import stage_observer, observe_document
+from .profiling import span
+
+# Bump whenever a change to extraction, prompts or ratio logic would give a
+# different result for the same file, so stored analyses and cached documents
+# are not reused
+EXTRACTOR_VERSION = "6"
+
+# Dependencies the pipeline imports lazily because they are slow to import
+WARMUP_MODULES = ("pdfplumber", "requests", "google.generativeai")
+
+def warm_up() -> Dict[str, float]:
+    """
+    Import the lazily imported dependencies now instead of on the first request.
+
+    Returns:
+        Dict[str, float]: Seconds spent importing each module
+    """
+    timings = {}
+    for name in WARMUP_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Warm-up could not import {name}: {e}")
+        timings[name] = time.perf_counter() - started
+    return timings
+
+# Analysis tiers, cheapest first:
+#   fast     - rule-based extraction, local ratios and scores, templated SWOT and story; no LLM calls
+#   standard - LLM extraction, local ratios and scores, templated SWOT and story
+#   detailed - LLM extraction and the full LLM narrative chain, with the MD&A summary
+ANALYSIS_TIERS = ("fast", "standard", "detailed")
+
+def parse_analysis_options(form) -> Dict[str, Any]:
+    """
+    Read the analysis options from submitted form fields.
+
+    The tier decides the LLM options where it implies them: the detailed tier
+    always runs the LLM chain and the MD&A summary, the fast tier never calls
+    an LLM, and the standard tier (LLM extraction plus local scoring) runs
+    them only when include_llm_analysis or include_mda is "true".
+
+    Args:
+        form: A mapping of form fields (e.g. request.form)
+
+    Returns:
+        Dict[str, Any]: Normalized analysis options
+    """
+    tier = (form.get('analysis_detail') or 'standard').strip().lower()
+    if tier not in ANALYSIS_TIERS:
+        tier = 'standard'
+    return {
+        "stock_price": form.get('stock_price'),
+        "api_choice": form.get('api_choice', 'gemini'),  # Default to Gemini
+        "analysis_detail": tier,  # fast, standard or detailed
+        "include_mda": tier == 'detailed' or (tier == 'standard' and form.get('include_mda', 'false').lower() == 'true'),
+        "include_llm_analysis": tier == 'detailed' or (tier == 'standard' and form.get('include_llm_analysis', 'false').lower() == 'true'),
+        "use_direct_extraction": form.get('use_direct_extraction', 'true').lower() == 'true',  # Default to direct extraction
+        "sector": normalize_sector(form.get('sector'))  # Optional peer group for the ratio percentiles
+    }
+
+def is_fast_analysis(options: Dict[str, Any]) -> bool:
+    """
+    True for the fast tier, whose runs make no LLM calls and are short.
+    """
+    return options.get("analysis_detail") == 'fast'
+
+def needs_tables(options: Dict[str, Any]) -> bool:
+    """
+    True if the analysis should see the tables of the document, so a cached
+    document parsed without them (by a fast analysis) has to be parsed again.
+    """
+    return options.get("analysis_detail") != 'fast'
+
+def is_extraction_error(results: Dict[str, Any]) -> bool:
+    """
+    True if run_analysis stopped because no financial data could be extracted.
+    """
+    return "error" in results and "ratios" not in results
+
+def run_analysis(filepath: str | BinaryIO, options: Dict[str, Any], document_cache=None,
+                 on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 document_id: Optional[str] = None, result_store=None,
+                 parse_workers: int = 0, parse_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run the full analysis pipeline for one filing.
+
+    If a result store is given and it already holds an analysis of the same file
+    with the same options, that analysis is returned without parsing the PDF or
+    calling an LLM.
+
+    Args:
+        filepath (str | BinaryIO): Path to the uploaded PDF, or a seekable stream of it
+        options (Dict[str, Any]): Output of parse_analysis_options
+        document_cache (DocumentCache, optional): Cache of extracted documents
+        on_stage (Callable, optional): Called as on_stage(stage, payload) as the run
+                                       progresses, with the partial results of the
+                                       stage. It may raise to abort the run.
+        document_id (str, optional): SHA-256 of the file if already known. Required
+                                     when filepath is a stream.
+        result_store (AnalysisStore, optional): Store of finished analyses
+        parse_workers (int): If positive, parse the PDF in the shared worker pool
+                             of this size instead of in the calling thread. Per-page
+                             progress events are not reported in that case.
+        parse_timeout (float, optional): Longest time a page range may take in the
+                                         worker pool before its worker is killed
+
+    Returns:
+        Dict[str, Any]: The analysis results, or the extraction error dictionary
+                        (containing an "error" key) if no data could be extracted
+    """
+    on_stage = stage_observer(on_stage)
+
+    # Reuse a previous extraction of the same file if we have one
+    if document_id is None:
+        document_id = compute_file_hash(filepath)
+    if result_store:
+        with span("result_store.find"):
+            stored = result_store.find(document_id, options)
+        if stored is not None:
+            on_stage("result_reused", {"analysis_id": stored.get("analysis_id"), "document_id": document_id})
+            return stored
+    if is_inline_xbrl(filepath):
+        # Tagged facts give exact values without parsing a PDF or calling an LLM to extract them
+        with span("ixbrl.parse"):
+            filing = parse_inline_xbrl(filepath)
+        on_stage("ixbrl_parsed", {"document_id": document_id, "facts": filing.get("facts", 0)})
+        with span("analyze_document"):
+            return analyze_inline_xbrl(document_id, filing, options, on_stage, result_store)
+    with span("document_cache.get"):
+        pdf_data = document_cache.get_document(document_id) if document_cache else None
+    include_tables = needs_tables(options)
+    if pdf_data is not None and include_tables and not pdf_data.get('tables_extracted', True):
+        pdf_data = None
+    from_cache = pdf_data is not None
+    if pdf_data is None:
+        # Extract text and tables from PDF using improved extraction
+        with span("pdf.parse"):
+            if parse_workers > 0:
+                pdf_data = parse_in_pool(filepath, parse_workers, parse_timeout, include_tables,
+                                         on_progress=on_stage)
+            else:
+                pdf_data = extract_text_and_tables(filepath, on_progress=on_stage, include_tables=include_tables)
+        observe_document(pdf_data)
+        if document_cache and pdf_data.get('text'):
+            # Cache the extraction and build the retrieval index for follow-ups
+            with span("document_cache.put"):
+                document_cache.put(document_id, pdf_data)
+    on_stage("pdf_parsed", {
+        "document_id": document_id,
+        "from_cache": from_cache,
+        "text_chars": len(pdf_data.get('text', '')),
+        "tables": len(pdf_data.get('tables', []))
+    })
+
+    with span("analyze_document"):
+        return analyze_document(document_id, pdf_data, options, on_stage, result_store)
+
+def analyze_document(document_id: str, pdf_data: Dict[str, Any], options: Dict[str, Any],
+                     on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                     result_store=None) -> Dict[str, Any]:
+    """
+    Run the extraction, ratio and LLM stages of the pipeline on an already parsed document.
+
+    Which stages run depends on the analysis tier (options["analysis_detail"]);
+    the results list them, in order, under "stages_run".
+
+    Args:
+        document_id (str): SHA-256 of the source file
+        pdf_data (Dict[str, Any]): Output of extract_text_and_tables
+        options (Dict[str, Any]): Output of parse_analysis_options
+        on_stage (Callable, optional): See run_analysis
+        result_store (AnalysisStore, optional): Where the finished analysis is saved
+
+    Returns:
+        Dict[str, Any]: The analysis results, or the extraction error dictionary
+    """
+    stages_run, stage_done = _stage_recorder(on_stage)
+    tier = options.get("analysis_detail", "standard")
+    api_choice = options.get("api_choice", "gemini")
+
+    # Log the extraction stats
+    print(f"Extracted PDF data: {len(pdf_data.get('text', ''))} chars of text, "
+          f"{len(pdf_data.get('tables', []))} tables, "
+          f"{len(pdf_data.get('chunks', []))} chunks, "
+          f"{len(pdf_data.get('financial_sections', ''))} chars of financial sections")
+
+    # Extract data using selected API
+    with span("extraction"):
+        if tier == "fast":
+            # Read the statement rows directly, without an LLM
+            extracted_data = extract_financial_data_with_rules(pdf_data)
+        elif options.get("use_direct_extraction", True):
+            # Use the new direct extraction approach
+            extracted_data = extract_financial_data_directly(pdf_data)
+        else:
+            # Use the previous chunk-based approach as fallback
+            if api_choice == 'openrouter':
+                extracted_data = extract_data_with_openrouter(pdf_data)
+            else:
+                extracted_data = extract_data_with_gemini(pdf_data)
+
+    if "error" in extracted_data:
+        return extracted_data
+    stages_run.append("rule_extraction" if tier == "fast" else "llm_extraction")
+    stage_done("extraction_done", {"extracted_data": extracted_data})
+
+    # Year-over-year trends from the prior-year columns of the statements
+    with span("trend_analysis"):
+        trend_analysis = analyze_trends(pdf_data, extracted_data)
+    stages_run.append("trend_analysis")
+
+    # Also keep the full text for MD&A extraction
+    return _finish_analysis(document_id, extracted_data, trend_analysis, pdf_data.get('text', ''),
+                            options, stages_run, stage_done, result_store)
+
+def analyze_inline_xbrl(document_id: str, filing: Dict[str, Any], options: Dict[str, Any],
+                        on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                        result_store=None) -> Dict[str, Any]:
+    """
+    Run the ratio and LLM stages of the pipeline on the facts of an inline XBRL filing.
+
+    The tagged facts replace the extraction stage in every tier, and the trend
+    analysis uses the prior-year facts. There is no document text, so no MD&A
+    summary is made.
+
+    Args:
+        document_id (str): SHA-256 of the source file
+        filing (Dict[str, Any]): Output of ixbrl.parse_inline_xbrl
+        options (Dict[str, Any]): Output of parse_analysis_options
+        on_stage (Callable, optional): See run_analysis
+        result_store (AnalysisStore, optional): Where the finished analysis is saved
+
+    Returns:
+        Dict[str, Any]: The analysis results, or the parse error dictionary
+    """
+    if "error" in filing:
+        return filing
+    stages_run, stage_done = _stage_recorder(on_stage)
+    extracted_data = dict(filing["extracted_data"])
+    stages_run.append("ixbrl_extraction")
+    stage_done("extraction_done", {"extracted_data": extracted_data})
+
+    with span("trend_analysis"):
+        trend_analysis = compute_trends({int(year): values for year, values in filing["periods"].items()})
+    stages_run.append("trend_analysis")
+
+    return _finish_analysis(document_id, extracted_data, trend_analysis, "", options,
+                            stages_run, stage_done, result_store)
+
+def _stage_recorder(on_stage: Optional[Callable[[str, Dict[str, Any]], None]]):
+    """
+    Wrap on_stage so the LLM stages it is told about are listed in stages_run.
+
+    Returns:
+        Tuple: (stages_run, stage_done), where stage_done(stage, payload) replaces on_stage
+    """
+    on_stage = stage_observer(on_stage)
+    stages_run = []
+
+    def stage_done(stage: str, payload: Optional[Dict[str, Any]] = None) -> None:
+        if stage.startswith("llm_") and stage.endswith("_done"):
+            stages_run.append(stage[:-len("_done")])
+        on_stage(stage, payload)
+
+    return stages_run, stage_done
+
+def _finish_analysis(document_id: str, extracted_data: Dict[str, Any], trend_analysis: Dict[str, Any],
+                     pdf_text: str, options: Dict[str, Any], stages_run: list,
+                     stage_done: Callable[[str, Optional[Dict[str, Any]]], None],
+                     result_store=None) -> Dict[str, Any]:
+    """
+    The stages after extraction: ratios, scores and peer percentiles, the LLM
+    chain or the templated narrative, the MD&A summary, and saving the result.
+    """
+    tier = options.get("analysis_detail", "standard")
+    include_llm_analysis = tier != "fast" and options.get("include_llm_analysis", True)
+    api_choice = options.get("api_choice", "gemini")
+
+    # Add timestamp to the data
+    extracted_data["analysis_timestamp"] = datetime.datetime.now().isoformat()
+
+    # Ratios of the analyses stored so far, for the peer percentiles
+    with span("peer_index"):
+        peer_index = result_store.peers() if result_store else None
+
+    # Calculate financial ratios and get LLM analysis
+    stages_run.append("ratios")
+    if peer_index is not None:
+        stages_run.append("peer_percentiles")
+    with span("financial_analysis"):
+        results = calculate_financial_ratios(
+            extracted_data,
+            options.get("stock_price"),
+            api_choice,
+            include_llm_analysis,
+            on_stage=stage_done,
+            trend_analysis=trend_analysis,
+            peer_index=peer_index,
+            sector=options.get("sector"),
+            document_id=document_id
+        )
+    if not include_llm_analysis and "financial_story" in results:
+        stages_run.append("template_narrative")
+    results["document_id"] = document_id
+    stage_done("recommendation_done", {
+        "average_score": results.get("average_score"),
+        "recommendation": results.get("recommendation"),
+        "swot_analysis": results.get("swot_analysis")
+    })
+
+    # Add MD&A summary if requested (the default of the detailed tier)
+    if tier != "fast" and options.get("include_mda") and pdf_text:
+        try:
+            with span("mda_summary"):
+                mda_summary = extract_mda_summary(pdf_text, api_choice)
+            if mda_summary and "summary" in mda_summary:
+                results["qualitative_summary"]["mda_highlights"] = mda_summary["summary"]
+                if "risk_factors" in mda_summary:
+                    results["qualitative_summary"]["key_risks"] = mda_summary["risk_factors"]
+            else:
+                results.setdefault("failed_llm_stages", []).append("llm_mda")
+        except Exception as e:
+            results["qualitative_summary"]["mda_error"] = f"Could not extract MD&A summary: {str(e)}"
+            results.setdefault("failed_llm_stages", []).append("llm_mda")
+        stage_done("llm_mda_done", {"qualitative_summary": results["qualitative_summary"]})
+
+    results["analysis_tier"] = tier
+    results["stages_run"] = stages_run
+
+    # A failed or degraded analysis is returned but not stored, so the next
+    # request for the same filing and options runs it again
+    if result_store and "error" not in results and not results.get("failed_llm_stages"):
+        with span("result_store.put"):
+            result_store.put(document_id, options, results)
+
+    return results
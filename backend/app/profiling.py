@@ -0,0 +1,143 @@
+import cProfile
+import datetime
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+class Span:
+    """
+    One timed section of a request, with the sections nested inside it.
+    """
+
+    __slots__ = ("name", "started", "duration", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started
+        node = {"name": self.name, "ms": round(duration * 1000, 3)}
+        if self.children:
+            node["children"] = [child.to_dict() for child in self.children]
+        return node
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("finbrief_current_span", default=None)
+_children_lock = threading.Lock()
+
+@contextmanager
+def span(name: str):
+    """
+    Time a section of code as a child of the current span.
+
+    Does nothing unless a trace was started for the current request, so the
+    pipeline can be instrumented without cost on normal requests. Spans are
+    tracked per context, so they follow the request thread but not work handed
+    to other threads or processes.
+
+    Args:
+        name (str): Name of the section, e.g. "pdf.parse" or "llm.gemini"
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield
+        return
+    node = Span(name)
+    with _children_lock:
+        parent.children.append(node)
+    token = _current_span.set(node)
+    try:
+        yield
+    finally:
+        node.finish()
+        _current_span.reset(token)
+
+def start_trace(name: str):
+    """
+    Start collecting spans in the current context.
+
+    Returns:
+        Tuple: The root Span and the token to pass to stop_trace
+    """
+    root = Span(name)
+    return root, _current_span.set(root)
+
+def stop_trace(token) -> None:
+    """
+    Stop collecting spans in the current context.
+    """
+    _current_span.reset(token)
+
+class RequestProfiler:
+    """
+    Runs cProfile on a sample of requests and writes the profiles to a directory.
+
+    Every Nth request is profiled and always written. If a latency threshold is
+    set, every request is profiled and written when it took longer than the
+    threshold; this costs some CPU on each request, so it is meant for
+    diagnosing a slow deployment rather than leaving on.
+
+    Args:
+        profile_dir (str): Where .prof files are written (open with pstats or snakeviz)
+        every_n (int): Profile every Nth request; 0 disables sampling
+        slow_ms (float): Write the profile of any request slower than this; 0 disables
+    """
+
+    def __init__(self, profile_dir: str, every_n: int = 0, slow_ms: float = 0):
+        self.profile_dir = profile_dir
+        self.every_n = every_n
+        self.slow_ms = slow_ms
+        self._counter = itertools.count(1)
+        if self.enabled:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.every_n > 0 or self.slow_ms > 0
+
+    def start(self):
+        """
+        Start profiling the current request if it is selected.
+
+        Returns:
+            Tuple: (profile, sampled) where profile is None if the request is not profiled
+        """
+        if not self.enabled:
+            return None, False
+        sampled = self.every_n > 0 and next(self._counter) % self.every_n == 0
+        if not sampled and self.slow_ms <= 0:
+            return None, False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. a concurrent request on Python 3.12+)
+            return None, False
+        return profile, sampled
+
+    def finish(self, profile, sampled: bool, elapsed: float, label: str) -> Optional[str]:
+        """
+        Stop profiling and write the profile if the request was sampled or slow.
+
+        Returns:
+            str: Path of the written profile, or None
+        """
+        profile.disable()
+        elapsed_ms = elapsed * 1000
+        if not sampled and elapsed_ms < self.slow_ms:
+            return None
+        timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_") or "request"
+        path = os.path.join(self.profile_dir, f"{timestamp}_{name}_{int(elapsed_ms)}ms.prof")
+        profile.dump_stats(path)
+        return path
@@ -0,0 +1,220 @@
+import ast
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import FinancialSnapshot, FINANCIAL_METRICS
+from .ratio_registry import RATIO_RULES, SCORE_BANDS, PLAN_ARGUMENTS, PRESENT, NONZERO, POSITIVE, OPTIONAL
+
+# Columns of the input matrix: the extracted metrics plus the derived total debt
+COLUMNS = FINANCIAL_METRICS + ["total_debt"]
+_COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# Ratios in the order calculate_financial_ratios adds them to results["ratios"]
+RATIO_ORDER = [rule["name"] for rule in RATIO_RULES]
+
+def snapshot_matrix(extracted_rows: Sequence[Dict[str, Any] | FinancialSnapshot]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack extracted financial data into arrays.
+
+    Args:
+        extracted_rows (Sequence): One results["extracted_data"] dict or
+                                   FinancialSnapshot per snapshot (company and period)
+
+    Returns:
+        Tuple: (values, present), both of shape (N, len(COLUMNS)). values holds the
+               metrics as float64 with 0 where a metric is missing; present is True
+               where the metric was not None.
+    """
+    values = np.zeros((len(extracted_rows), len(COLUMNS)), dtype=np.float64)
+    present = np.zeros(values.shape, dtype=bool)
+    for i, row in enumerate(extracted_rows):
+        if isinstance(row, FinancialSnapshot):
+            row_values = [getattr(row, name) for name in COLUMNS]
+        else:
+            row_values = [row.get(name) for name in COLUMNS]
+        for j, value in enumerate(row_values):
+            if value is not None:
+                values[i, j] = value
+                present[i, j] = True
+    return values, present
+
+def _scores(name: str, ratio: np.ndarray, computed: np.ndarray) -> np.ndarray:
+    higher_is_better, strong, acceptable, _ = SCORE_BANDS[name]
+    with np.errstate(invalid="ignore"):
+        if higher_is_better:
+            score = np.where(ratio > strong, 3, np.where(ratio >= acceptable, 2, 1))
+        else:
+            score = np.where(ratio < strong, 3, np.where(ratio <= acceptable, 2, 1))
+    return np.where(computed, score, 0).astype(np.int8)
+
+# Guards of ratio_registry as boolean array expressions; has_<name> is the
+# presence mask of an input (or the computed mask of an earlier ratio)
+_ARRAY_GUARDS = {
+    PRESENT: "has_{0}",
+    NONZERO: "(has_{0} & ({0} != 0))",
+    POSITIVE: "(has_{0} & ({0} > 0))",
+}
+
+class _ArrayExpression(ast.NodeTransformer):
+    """
+    Rewrites a rule's scalar expression to work on whole columns: "x is None"
+    becomes a presence test, "a if c else b" a where(), and the boolean
+    operators the elementwise ones.
+    """
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.Is, ast.IsNot)):
+                if not (isinstance(left, ast.Name) and isinstance(right, ast.Constant) and right.value is None):
+                    raise ValueError(f"Only 'name is (not) None' is supported: {ast.unparse(node)}")
+                test = ast.Name(f"has_{left.id}", ast.Load())
+                parts.append(test if isinstance(op, ast.IsNot) else ast.UnaryOp(ast.Invert(), test))
+            else:
+                parts.append(ast.Compare(left, [op], [right]))
+            left = right
+        return self._combine(ast.BitAnd(), parts)
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        return self._combine(ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr(), node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        return ast.UnaryOp(ast.Invert(), node.operand) if isinstance(node.op, ast.Not) else node
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return ast.Call(ast.Name("where", ast.Load()), [node.test, node.body, node.orelse], [])
+
+    @staticmethod
+    def _combine(op, parts):
+        combined = parts[0]
+        for part in parts[1:]:
+            combined = ast.BinOp(combined, op, part)
+        return combined
+
+def _array_expression(expression: str) -> str:
+    return ast.unparse(_ArrayExpression().visit(ast.parse(expression, mode="eval")))
+
+def compile_array_plan(rules: List[Dict[str, Any]]) -> Callable[..., Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]]:
+    """
+    Compile ratio rules into one NumPy evaluation function, the vectorized
+    counterpart of ratio_registry.compile_plan.
+
+    Each rule becomes a mask (its guards and "when" condition as boolean array
+    expressions) and its formula evaluated on whole columns, kept where the
+    mask holds. The masks follow the scalar guards exactly, so a ratio is
+    computed for a snapshot exactly when the scalar plan computes it, with the
+    same value.
+
+    Args:
+        rules (List[Dict[str, Any]]): Ratio rules, e.g. RATIO_RULES
+
+    Returns:
+        Callable: evaluate(values, present, stock_price, has_stock_price) ->
+                  (ratios, computed), with values and present as from
+                  snapshot_matrix and the prices as float and bool arrays. Its
+                  generated code is in evaluate.source.
+    """
+    names = [rule["name"] for rule in rules]
+    lines = ["def evaluate(values, present, stock_price, has_stock_price):",
+             "    ratios = {}", "    computed = {}"]
+    read = set()
+    for rule in rules:
+        for source in rule["inputs"]:
+            if source in names or source in PLAN_ARGUMENTS or source in read:
+                continue
+            if source not in _COLUMN_INDEX:
+                raise ValueError(f"{rule['name']} reads {source}, which is not a snapshot column")
+            read.add(source)
+            lines.append(f"    {source} = values[:, {_COLUMN_INDEX[source]}]")
+            lines.append(f"    has_{source} = present[:, {_COLUMN_INDEX[source]}]")
+    lines.append("    with errstate(divide='ignore', invalid='ignore', over='ignore'):")
+    defined = set()
+    for rule in rules:
+        name = rule["name"]
+        for source in rule["inputs"]:
+            if source in names and source not in defined:
+                raise ValueError(f"{name} reads {source}, which is not defined before it")
+        conditions = [_ARRAY_GUARDS[guard].format(source) for source, guard in rule["inputs"].items() if guard != OPTIONAL]
+        if "when" in rule:
+            conditions.append(f"({_array_expression(rule['when'])})")
+        mask = " & ".join(conditions) or "full(values.shape[0], True)"
+        lines.append(f"        has_{name} = {mask}")
+        lines.append(f"        {name} = where(has_{name}, {_array_expression(rule['formula'])}, nan)")
+        lines.append(f"        ratios[{name!r}] = {name}")
+        lines.append(f"        computed[{name!r}] = has_{name}")
+        defined.add(name)
+    lines.append("    return ratios, computed")
+
+    source_code = "\n".join(lines)
+    namespace = {"where": np.where, "full": np.full, "nan": np.nan, "errstate": np.errstate}
+    exec(compile(source_code, "<ratio array plan>", "exec"), namespace)
+    evaluate = namespace["evaluate"]
+    evaluate.source = source_code
+    return evaluate
+
+RATIO_ARRAY_PLAN = compile_array_plan(RATIO_RULES)
+
+def compute_ratio_arrays(values: np.ndarray, present: np.ndarray,
+                         stock_prices: Optional[Sequence[Optional[float]]] = None) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Compute every ratio and score of calculate_financial_ratios for N snapshots at once.
+
+    Args:
+        values (np.ndarray): Metric values from snapshot_matrix
+        present (np.ndarray): Presence mask from snapshot_matrix
+        stock_prices (Sequence[float], optional): Stock price per snapshot; None or 0
+                                                   skips the valuation ratios
+
+    Returns:
+        Dict: {"ratios": {name: float array, NaN where not computed},
+               "computed": {name: bool array},
+               "scores": {name: int8 array, 0 where not computed}}
+    """
+    n = values.shape[0]
+    if stock_prices is None:
+        price, has_price = np.zeros(n), np.zeros(n, dtype=bool)
+    else:
+        price = np.array([p if p is not None else 0.0 for p in stock_prices], dtype=np.float64)
+        has_price = np.array([p is not None for p in stock_prices], dtype=bool)
+    ratios, computed = RATIO_ARRAY_PLAN(values, present, price, has_price)
+    scores = {name: _scores(name, ratios[name], computed[name]) for name in SCORE_BANDS}
+    return {"ratios": ratios, "computed": computed, "scores": scores}
+
+def batch_ratios(extracted_rows: Sequence[Dict[str, Any] | FinancialSnapshot],
+                 stock_prices: Optional[Sequence[Optional[float]]] = None) -> List[Tuple[Dict[str, float], Dict[str, Dict[str, Any]]]]:
+    """
+    Ratios and scores for many snapshots, in the same form as calculate_financial_ratios.
+
+    Args:
+        extracted_rows (Sequence): One results["extracted_data"] dict or FinancialSnapshot per snapshot
+        stock_prices (Sequence[float], optional): Stock price per snapshot
+
+    Returns:
+        List: (ratios, scores) per snapshot, equal to results["ratios"] and
+              results["scores"] of the scalar path before any LLM interpretation
+    """
+    values, present = snapshot_matrix(extracted_rows)
+    arrays = compute_ratio_arrays(values, present, stock_prices)
+    ratio_columns = {name: arrays["ratios"][name].tolist() for name in RATIO_ORDER}
+    computed_columns = {name: arrays["computed"][name].tolist() for name in RATIO_ORDER}
+    score_columns = {name: arrays["scores"][name].tolist() for name in SCORE_BANDS}
+
+    results = []
+    for i in range(len(extracted_rows)):
+        ratios, scores = {}, {}
+        for name in RATIO_ORDER:
+            if computed_columns[name][i]:
+                ratios[name] = ratio_columns[name][i]
+        # Scores are keyed in the scalar path's order (it has no eps or free_cash_flow_calculated)
+        for name in SCORE_BANDS:
+            score = score_columns[name][i]
+            if score:
+                scores[name] = {"score": score, "interpretation": SCORE_BANDS[name][3][3 - score]}
+        results.append((ratios, scores))
+    return results
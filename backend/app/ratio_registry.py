@@ -0,0 +1,189 @@
+from typing import Callable, Dict, List, Any, Iterable, Optional, Tuple
+
+# Input guards: when an input counts as usable for a ratio
+PRESENT = "present"    # Not None
+NONZERO = "nonzero"    # Not None and not zero
+POSITIVE = "positive"  # Not None and greater than zero
+OPTIONAL = "optional"  # May be None; the formula handles it
+
+_STRENGTH = ("Strong", "Acceptable", "Weak")
+_VALUATION = ("Undervalued", "Fairly Valued", "Overvalued")
+
+# Every ratio of calculate_financial_ratios, in the order it appears in results["ratios"]
+# and results["scores"]. Adding a ratio means adding an entry here.
+#
+# - inputs: results["extracted_data"] keys, "stock_price", or ratios defined earlier
+#   in the list, each with the guard it must pass for the ratio to be computed
+# - formula: Python expression over the inputs
+# - when (optional): extra condition, checked after the guards
+# - bands (optional): (direction, bound for score 3, bound for score 2, labels for 3, 2, 1).
+#   "higher": 3 if value > first bound, 2 if value >= second bound, else 1.
+#   "lower": 3 if value < first bound, 2 if value <= second bound, else 1.
+RATIO_RULES: List[Dict[str, Any]] = [
+    # --- Profitability ---
+    {"name": "eps", "inputs": {"outstanding_shares": POSITIVE, "net_income": PRESENT},
+     "formula": "net_income / outstanding_shares"},
+    {"name": "pe_ratio", "inputs": {"stock_price": NONZERO, "eps": NONZERO},
+     "formula": "stock_price / eps",
+     "bands": ("lower", 15, 25, _VALUATION)},
+    {"name": "roe", "inputs": {"stockholders_equity": NONZERO, "net_income": PRESENT},
+     "formula": "(net_income / stockholders_equity) * 100",
+     "bands": ("higher", 15, 10, _STRENGTH)},
+    {"name": "roa", "inputs": {"total_assets": NONZERO, "net_income": PRESENT},
+     "formula": "(net_income / total_assets) * 100",
+     "bands": ("higher", 5, 2, _STRENGTH)},
+    {"name": "net_profit_margin", "inputs": {"revenue": NONZERO, "net_income": PRESENT},
+     "formula": "(net_income / revenue) * 100",
+     "bands": ("higher", 10, 5, _STRENGTH)},
+    {"name": "gross_profit_margin", "inputs": {"revenue": NONZERO, "gross_profit": PRESENT},
+     "formula": "(gross_profit / revenue) * 100",
+     "bands": ("higher", 40, 20, _STRENGTH)},
+    {"name": "operating_profit_margin", "inputs": {"revenue": NONZERO, "operating_income": PRESENT},
+     "formula": "(operating_income / revenue) * 100",
+     "bands": ("higher", 15, 8, _STRENGTH)},
+    # --- Leverage ---
+    {"name": "de_ratio", "inputs": {"stockholders_equity": NONZERO, "total_debt": PRESENT},
+     "formula": "total_debt / stockholders_equity",
+     "bands": ("lower", 0.5, 1.0, ("Low Leverage", "Moderate Leverage", "High Leverage"))},
+    {"name": "debt_ratio", "inputs": {"total_assets": NONZERO, "total_debt": PRESENT},
+     "formula": "total_debt / total_assets",
+     "bands": ("lower", 0.3, 0.6, ("Low Debt", "Moderate Debt", "High Debt"))},
+    # abs() in case interest expense is reported as negative
+    {"name": "interest_coverage", "inputs": {"interest_expense": NONZERO, "operating_income": PRESENT},
+     "formula": "operating_income / abs(interest_expense)",
+     "bands": ("higher", 5, 2, _STRENGTH)},
+    # --- Liquidity ---
+    {"name": "current_ratio", "inputs": {"total_current_liabilities": NONZERO, "total_current_assets": PRESENT},
+     "formula": "total_current_assets / total_current_liabilities",
+     "bands": ("higher", 2, 1, _STRENGTH)},
+    {"name": "quick_ratio", "inputs": {"total_current_liabilities": NONZERO, "total_current_assets": PRESENT, "inventory": PRESENT},
+     "formula": "(total_current_assets - inventory) / total_current_liabilities",
+     "bands": ("higher", 1.5, 1, _STRENGTH)},
+    # --- Cash flow ---
+    {"name": "free_cash_flow_calculated", "inputs": {"net_income": NONZERO, "operating_cash_flow": PRESENT, "capex": OPTIONAL},
+     "formula": "operating_cash_flow - (capex if capex is not None else 0)"},
+    {"name": "fcf_net_income_ratio", "inputs": {"free_cash_flow_calculated": NONZERO, "net_income": NONZERO},
+     "formula": "free_cash_flow_calculated / net_income",
+     "bands": ("higher", 1.2, 0.8, ("Strong (High-quality earnings)", "Acceptable (Reliable earnings)", "Weak (Poor earnings quality)"))},
+    # --- Valuation (skipped for a non-positive book value or revenue per share) ---
+    {"name": "pb_ratio", "inputs": {"stock_price": NONZERO, "stockholders_equity": NONZERO, "outstanding_shares": POSITIVE},
+     "when": "stockholders_equity / outstanding_shares > 0",
+     "formula": "stock_price / (stockholders_equity / outstanding_shares)",
+     "bands": ("lower", 1.5, 3, _VALUATION)},
+    {"name": "ps_ratio", "inputs": {"stock_price": NONZERO, "revenue": NONZERO, "outstanding_shares": POSITIVE},
+     "when": "revenue / outstanding_shares > 0",
+     "formula": "stock_price / (revenue / outstanding_shares)",
+     "bands": ("lower", 1, 3, _VALUATION)},
+]
+
+# Inputs passed to a compiled plan as arguments rather than read from the values dict
+PLAN_ARGUMENTS = ("stock_price",)
+
+_GUARDS = {
+    PRESENT: "{0} is not None",
+    NONZERO: "{0} is not None and {0} != 0",
+    POSITIVE: "{0} is not None and {0} > 0",
+}
+
+def _score_expression(name: str, bands: Tuple) -> str:
+    direction, strong, acceptable, labels = bands
+    if direction not in ("higher", "lower"):
+        raise ValueError(f"Unknown band direction for {name}: {direction}")
+    above, at_least = (">", ">=") if direction == "higher" else ("<", "<=")
+    score = [f'{{"score": {value}, "interpretation": {label!r}}}' for value, label in zip((3, 2, 1), labels)]
+    return f"{score[0]} if {name} {above} {strong!r} else {score[1]} if {name} {at_least} {acceptable!r} else {score[2]}"
+
+def compile_plan(rules: List[Dict[str, Any]], outputs: Optional[Iterable[str]] = None) -> Callable[[Dict[str, Any]], Tuple[Dict[str, float], Dict[str, Dict[str, Any]]]]:
+    """
+    Compile ratio rules into one evaluation function.
+
+    The rules are turned into straight-line Python source, with each input read
+    into a local variable once and each guard, formula and score band inlined,
+    and compiled when this module is imported. Evaluating the plan is then a
+    single function call with no per-rule interpretation.
+
+    Args:
+        rules (List[Dict[str, Any]]): Ratio rules, e.g. RATIO_RULES
+        outputs (Iterable[str], optional): Only return these ratios (the ratios
+                                           they depend on are still computed)
+
+    Returns:
+        Callable: evaluate(values, stock_price=None) -> (ratios, scores), where
+                  values maps input names to numbers or None and missing names
+                  count as None. Its generated code is in evaluate.source.
+    """
+    names = [rule["name"] for rule in rules]
+    wanted = set(names if outputs is None else outputs)
+    unknown = wanted - set(names)
+    if unknown:
+        raise ValueError(f"Unknown ratios: {', '.join(sorted(unknown))}")
+
+    # Keep the wanted ratios and, transitively, the earlier ratios they read
+    needed = set(wanted)
+    for rule in reversed(rules):
+        if rule["name"] in needed:
+            needed.update(source for source in rule["inputs"] if source in names)
+
+    inputs = []
+    for rule in rules:
+        if rule["name"] not in needed:
+            continue
+        for source in rule["inputs"]:
+            if source not in names and source not in PLAN_ARGUMENTS and source not in inputs:
+                inputs.append(source)
+
+    arguments = "".join(f", {name}=None" for name in PLAN_ARGUMENTS)
+    lines = [f"def evaluate(values{arguments}):", "    ratios = {}", "    scores = {}", "    get = values.get"]
+    lines += [f"    {source} = get({source!r})" for source in inputs]
+    defined = set()
+    for rule in rules:
+        name = rule["name"]
+        defined.add(name)
+        if name not in needed:
+            continue
+        for source in rule["inputs"]:
+            if source in names and source not in defined - {name}:
+                raise ValueError(f"{name} reads {source}, which is not defined before it")
+        conditions = [_GUARDS[guard].format(source) for source, guard in rule["inputs"].items() if guard != OPTIONAL]
+        if "when" in rule:
+            conditions.append(f"({rule['when']})")
+        lines.append(f"    {name} = None")
+        lines.append(f"    if {' and '.join(conditions) or 'True'}:")
+        lines.append(f"        {name} = {rule['formula']}")
+        if name in wanted:
+            lines.append(f"        ratios[{name!r}] = {name}")
+            if "bands" in rule:
+                lines.append(f"        scores[{name!r}] = {_score_expression(name, rule['bands'])}")
+    lines.append("    return ratios, scores")
+
+    source_code = "\n".join(lines)
+    namespace = {}
+    exec(compile(source_code, "<ratio plan>", "exec"), namespace)
+    evaluate = namespace["evaluate"]
+    evaluate.source = source_code
+    return evaluate
+
+RATIO_PLAN = compile_plan(RATIO_RULES)
+# Ratios that depend on the stock price, recomputed when an analysis is repriced
+VALUATION_RATIOS = [rule["name"] for rule in RATIO_RULES if "stock_price" in rule["inputs"]]
+VALUATION_PLAN = compile_plan(RATIO_RULES, VALUATION_RATIOS)
+# Score bands by ratio as (higher_is_better, bound for 3, bound for 2, labels), for the vectorized engine
+SCORE_BANDS = {
+    rule["name"]: (rule["bands"][0] == "higher",) + tuple(rule["bands"][1:])
+    for rule in RATIO_RULES if "bands" in rule
+}
+
+def evaluate_ratios(extracted_data: Dict[str, Any], stock_price: Optional[float] = None,
+                    plan: Optional[Callable] = None) -> Tuple[Dict[str, float], Dict[str, Dict[str, Any]]]:
+    """
+    Ratios and scores for one snapshot of extracted data.
+
+    Args:
+        extracted_data (Dict[str, Any]): Cleaned financial data (results["extracted_data"])
+        stock_price (float, optional): Current stock price; valuation ratios are skipped without one
+        plan (Callable, optional): Compiled plan to evaluate, RATIO_PLAN by default
+
+    Returns:
+        Tuple: (ratios, scores) as in results["ratios"] and results["scores"]
+    """
+    return (plan or RATIO_PLAN)(extracted_data, stock_price)
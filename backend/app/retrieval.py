@@ -0,0 +1,106 @@
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any
+
+# Words that carry no retrieval signal in a 10-K question or passage
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for",
+    "from", "has", "have", "how", "in", "is", "it", "its", "of", "on", "or",
+    "that", "the", "their", "this", "to", "was", "were", "what", "when", "which",
+    "why", "will", "with", "company", "company's"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9&'\-]*")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases text and splits it into retrieval terms, dropping stopwords.
+
+    Args:
+        text (str): The text to tokenize
+
+    Returns:
+        List[str]: The terms in the order they appear
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 index over the page-aware passages of a single document.
+
+    Term frequencies are kept as plain dictionaries so the index can be serialized
+    to JSON, stored next to the cached document and reloaded without re-tokenizing.
+    """
+
+    def __init__(self, passages: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75,
+                 term_freqs: List[Dict[str, int]] | None = None):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        if term_freqs is None:
+            term_freqs = [dict(Counter(tokenize(passage.get('text', '')))) for passage in passages]
+        self.term_freqs = term_freqs
+        self.doc_lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        total = len(passages)
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Returns the passages most relevant to the query.
+
+        Args:
+            query (str): The user's question
+            top_k (int): Maximum number of passages to return
+
+        Returns:
+            List[Dict[str, Any]]: Passages with an added 'score' key, best first
+        """
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        if not query_terms or not self.passages:
+            return []
+
+        scored = []
+        for i, freqs in enumerate(self.term_freqs):
+            length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / (self.avg_doc_length or 1))
+            score = 0.0
+            for term in query_terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + length_norm)
+            if score > 0:
+                scored.append((score, i))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [dict(self.passages[i], score=round(score, 4)) for score, i in scored[:top_k]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serializes the index to a JSON-compatible dictionary.
+        """
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "passages": self.passages,
+            "term_freqs": self.term_freqs
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        """
+        Rebuilds an index from the output of to_dict.
+        """
+        return cls(
+            data.get("passages", []),
+            data.get("k1", 1.5),
+            data.get("b", 0.75),
+            term_freqs=data.get("term_freqs")
+        )
@@ -1,24 +1,136 @@
-from flask import request, jsonify
-from werkzeug.utils import secure_filename
+from flask import request, jsonify, Response, g
+import json
+import math
 import os
+import shutil
 import tempfile
-import datetime
-
-from .utils import allowed_file
-from .pdf_processor import extract_text_from_pdf, extract_text_and_tables
-from .llm_clients import (
-    extract_data_with_openrouter, 
-    extract_data_with_gemini,
-    extract_financial_data_directly,
-    extract_mda_summary,
-    analyze_financial_trends_with_llm,
-    interpret_financial_ratios_with_llm,
-    predict_earnings_outlook_with_llm,
-    create_financial_story_with_llm
-)
-from .financial_analyzer import calculate_financial_ratios
+import time
+import uuid
+from contextlib import ExitStack
+
+from .utils import allowed_file, compute_file_hash, SpooledUpload
+from .document_cache import DocumentCache
+from .pipeline import parse_analysis_options, run_analysis, is_extraction_error, is_fast_analysis, EXTRACTOR_VERSION
+from .analysis_store import AnalysisStore, analysis_to_json
+from .financial_analyzer import reprice_analysis
+from .singleflight import SingleFlight
+from .pdf_pool import ParseTimeout, parse_pool_stats
+from .metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION, UPLOAD_DURATION, register_runtime, render_latest
+from .profiling import RequestProfiler, start_trace, stop_trace
+from .admission import AdmissionController, Overloaded, PRIORITY_FAST, PRIORITY_STANDARD, PRIORITY_BATCH
+from .batch import save_batch_files, run_batch, BATCH_MAX_FILE_SIZE, BATCH_MAX_TOTAL_SIZE
+from .jobs import JobStore, JobManager, job_to_json, SUCCEEDED, FAILED, FINISHED_STATES
 
 def register_routes(app):
+    document_cache = DocumentCache(
+        app.config.get('DOCUMENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'finbrief_documents')),
+        EXTRACTOR_VERSION
+    )
+    retrieval_top_k = app.config.get('RETRIEVAL_TOP_K', 5)
+
+    # Background jobs for POST /api/analyze with async=true
+    data_dir = app.config.get('DATA_DIR', os.path.join(tempfile.gettempdir(), 'finbrief'))
+    upload_dir = os.path.join(data_dir, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    upload_spool_max_memory = app.config.get('UPLOAD_SPOOL_MAX_MEMORY', 8 * 1024 * 1024)
+    # Finished analyses, so identical repeat requests skip parsing and the LLMs
+    result_store = AnalysisStore(os.path.join(data_dir, 'analyses.db'), EXTRACTOR_VERSION)
+    # Identical analyses already running share one run, across worker processes too
+    single_flight = SingleFlight(
+        os.path.join(data_dir, 'locks') if app.config.get('COALESCE_ACROSS_WORKERS', True) else None
+    )
+    app.extensions['finbrief_single_flight'] = single_flight
+
+    # In production PDFs are parsed in a process pool so parsing does not hold the GIL
+    parse_workers = app.config.get('PARSE_POOL_WORKERS', 0)
+    parse_timeout = app.config.get('PDF_PARSE_TIMEOUT')
+
+    def run_coalesced(filepath, options, on_stage=None, document_id=None):
+        if document_id is None:
+            document_id = compute_file_hash(filepath)
+        return single_flight.do(
+            result_store.key_for(document_id, options),
+            lambda: run_analysis(
+                filepath, options, document_cache, on_stage, document_id, result_store,
+                parse_workers=parse_workers, parse_timeout=parse_timeout
+            )
+        )
+
+    # Bound the synchronous analyses running at once and the ones waiting for a slot
+    admission = AdmissionController(
+        max_in_flight=app.config.get('ADMISSION_MAX_IN_FLIGHT', 4),
+        max_queue=app.config.get('ADMISSION_MAX_QUEUE', 16),
+        max_wait=app.config.get('ADMISSION_MAX_WAIT', 60.0)
+    )
+    app.extensions['finbrief_admission'] = admission
+
+    @app.errorhandler(Overloaded)
+    def handle_overloaded(e):
+        response = jsonify({"error": "Server is busy, please retry later", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    job_store = JobStore(os.path.join(data_dir, 'jobs.db'))
+    job_manager = JobManager(job_store, run_coalesced, max_workers=app.config.get('JOB_MAX_WORKERS', 2))
+    if app.config.get('JOB_RECOVERY_ON_START', True):
+        job_manager.recover()
+    sse_poll_interval = app.config.get('SSE_POLL_INTERVAL', 0.25)
+    app.extensions['finbrief_jobs'] = job_manager
+
+    register_runtime("admission", admission.stats)
+    register_runtime("jobs", job_manager.stats)
+    register_runtime("single_flight", single_flight.stats)
+    register_runtime("parse_pool", parse_pool_stats)
+
+    # Sampled cProfile dumps of API requests
+    profiler = RequestProfiler(
+        app.config.get('PROFILE_DIR', os.path.join(data_dir, 'profiles')),
+        every_n=app.config.get('PROFILE_EVERY_N', 0),
+        slow_ms=app.config.get('PROFILE_SLOW_MS', 0)
+    )
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.monotonic()
+        # A '_timings' tree of the request's spans is added to JSON responses on request
+        if request.headers.get('X-Debug-Timings', '').lower() in ('1', 'true') or request.args.get('debug') == 'timings':
+            g.trace, g.trace_token = start_trace(f"{request.method} {request.path}")
+        if request.path.startswith('/api/'):
+            g.profile, g.profile_sampled = profiler.start()
+
+    @app.after_request
+    def record_request_metrics(response):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUESTS.labels(route=route, method=request.method, status=str(response.status_code)).inc()
+        if "request_started" in g:
+            HTTP_REQUEST_DURATION.labels(route=route).observe(time.monotonic() - g.request_started)
+        if g.get('trace') is not None and response.is_json and not response.is_streamed:
+            data = response.get_json()
+            if isinstance(data, dict):
+                g.trace.finish()
+                data["_timings"] = g.trace.to_dict()
+                response.set_data(app.json.dumps(data))
+        return response
+
+    @app.teardown_request
+    def finish_request_trace(exc):
+        if g.get('trace') is not None:
+            stop_trace(g.trace_token)
+            g.trace = None
+        if g.get('profile') is not None:
+            path = profiler.finish(g.profile, g.profile_sampled, time.monotonic() - g.request_started, f"{request.method} {request.path}")
+            g.profile = None
+            if path:
+                print(f"Wrote request profile to {path}")
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """
+        Prometheus metrics: request counts and latency per route, pipeline stage
+        durations, pages and characters parsed, cache hits and in-flight work.
+        """
+        return Response(render_latest(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/api/analyze', methods=['POST'])
     def analyze_report():
         # Check if a file was uploaded
@@ -26,81 +138,240 @@ def register_routes(app):
             return jsonify({"error": "No file part"}), 400
 
         file = request.files['file']
-        stock_price = request.form.get('stock_price')
-        api_choice = request.form.get('api_choice', 'gemini')  # Default to Gemini
-        analysis_detail = request.form.get('analysis_detail', 'standard')  # standard or detailed
-        include_mda = request.form.get('include_mda', 'false').lower() == 'true'
-        include_llm_analysis = request.form.get('include_llm_analysis', 'true').lower() == 'true'
-        use_direct_extraction = request.form.get('use_direct_extraction', 'true').lower() == 'true'  # Default to direct extraction
+        options = parse_analysis_options(request.form)
+        run_async = request.form.get('async', 'false').lower() == 'true'
 
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
 
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(tempfile.gettempdir(), filename)
-            file.save(filepath)
+            # Stream the upload into a private spooled file, hashing it on the way
+            with SpooledUpload(file, upload_spool_max_memory) as upload:
+                # From the start of the request: the body is received while the form is parsed
+                UPLOAD_DURATION.labels(route="analyze").observe(time.monotonic() - g.request_started)
+                if run_async:
+                    # Keep the upload on disk until the background job is done with it
+                    filepath = upload.persist(upload_dir)
+                    job_id = job_manager.submit(filepath, options, upload.sha256)
+                    response = jsonify({
+                        "job_id": job_id,
+                        "status": "queued",
+                        "status_url": f"/api/jobs/{job_id}"
+                    })
+                    response.headers['Location'] = f"/api/jobs/{job_id}"
+                    return response, 202
 
-            try:
-                # Extract text and tables from PDF using improved extraction
-                pdf_data = extract_text_and_tables(filepath)
-                
-                # Also keep the full text for MD&A extraction
-                pdf_text = pdf_data.get('text', '')
-                
-                # Log the extraction stats
-                print(f"Extracted PDF data: {len(pdf_data.get('text', ''))} chars of text, "
-                      f"{len(pdf_data.get('tables', []))} tables, "
-                      f"{len(pdf_data.get('chunks', []))} chunks, "
-                      f"{len(pdf_data.get('financial_sections', ''))} chars of financial sections")
-
-                # Extract data using selected API
-                if use_direct_extraction:
-                    # Use the new direct extraction approach
-                    extracted_data = extract_financial_data_directly(pdf_data)
-                else:
-                    # Use the previous chunk-based approach as fallback
-                    if api_choice == 'openrouter':
-                        extracted_data = extract_data_with_openrouter(pdf_data)
-                    else:
-                        extracted_data = extract_data_with_gemini(pdf_data)
-
-                if "error" in extracted_data:
-                    return jsonify(extracted_data), 400
-                
-                # Add timestamp to the data
-                extracted_data["analysis_timestamp"] = datetime.datetime.now().isoformat()
-
-                # Calculate financial ratios and get LLM analysis
-                results = calculate_financial_ratios(
-                    extracted_data, 
-                    stock_price, 
-                    api_choice, 
-                    include_llm_analysis
-                )
-
-                # Clean up the temporary file
-                os.remove(filepath)
-
-                # Add MD&A summary if detailed analysis requested or include_mda is True
-                if (analysis_detail == 'detailed' or include_mda) and pdf_text:
+                # Requests without LLM stages jump ahead of full analyses in the queue
+                with admission.admit(PRIORITY_FAST if is_fast_analysis(options) else PRIORITY_STANDARD):
                     try:
-                        mda_summary = extract_mda_summary(pdf_text, api_choice)
-                        if mda_summary and "summary" in mda_summary:
-                            results["qualitative_summary"]["mda_highlights"] = mda_summary["summary"]
-                            if "risk_factors" in mda_summary:
-                                results["qualitative_summary"]["key_risks"] = mda_summary["risk_factors"]
+                        results = run_coalesced(upload.stream, options, document_id=upload.sha256)
+                        if is_extraction_error(results):
+                            return jsonify(results), 400
+                        return jsonify(results)
+
+                    except ParseTimeout as e:
+                        return jsonify({"error": str(e)}), 504
                     except Exception as e:
-                        results["qualitative_summary"]["mda_error"] = f"Could not extract MD&A summary: {str(e)}"
+                        return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+
+        return jsonify({"error": "File type not allowed"}), 400
 
-                return jsonify(results)
+    @app.route('/api/analyze/batch', methods=['POST'])
+    def analyze_batch():
+        """
+        Endpoint for analyzing many filings in one request.
 
-            except Exception as e:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+        Accepts several PDFs or inline XBRL .htm filings and/or zip archives of
+        them in the 'files' field and streams back one JSON line per filing as it
+        completes, followed by a summary line with the batch throughput.
+        """
+        files = request.files.getlist('files') + request.files.getlist('file')
+        if not files:
+            return jsonify({"error": "No files uploaded"}), 400
 
-        return jsonify({"error": "File type not allowed"}), 400
+        options = parse_analysis_options(request.form)
+        # Hold one slot until the streamed response is closed
+        slot = ExitStack()
+        slot.enter_context(admission.admit(PRIORITY_BATCH))
+        batch_dir = os.path.join(data_dir, 'batches', uuid.uuid4().hex)
+        try:
+            filings, skipped = save_batch_files(
+                files, batch_dir, app.config.get('BATCH_MAX_FILES', 50),
+                max_file_size=app.config.get('BATCH_MAX_FILE_SIZE', BATCH_MAX_FILE_SIZE),
+                max_total_size=app.config.get('BATCH_MAX_TOTAL_SIZE', BATCH_MAX_TOTAL_SIZE)
+            )
+            UPLOAD_DURATION.labels(route="analyze_batch").observe(time.monotonic() - g.request_started)
+        except BaseException:
+            slot.close()
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            raise
+        if not filings:
+            slot.close()
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            return jsonify({"error": "No valid filings in the batch", "skipped": skipped}), 400
+
+        def generate():
+            try:
+                for record in skipped:
+                    yield json.dumps(record) + "\n"
+                for record in run_batch(
+                    filings,
+                    options,
+                    document_cache,
+                    parse_workers=app.config.get('BATCH_PARSE_WORKERS', 2),
+                    llm_workers=app.config.get('BATCH_LLM_WORKERS', 4),
+                    result_store=result_store,
+                    single_flight=single_flight,
+                    parse_timeout=parse_timeout
+                ):
+                    if "summary" in record:
+                        record["summary"]["skipped"] = len(skipped)
+                    yield json.dumps(record) + "\n"
+            finally:
+                shutil.rmtree(batch_dir, ignore_errors=True)
+
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.call_on_close(slot.close)
+        return response
+
+    @app.route('/api/analyses', methods=['GET'])
+    def list_analyses():
+        """
+        Endpoint for listing stored analyses, newest first, one page at a time.
+        """
+        try:
+            limit = max(1, min(int(request.args.get('limit', 20)), 100))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({"error": "'limit' and 'offset' must be integers"}), 400
+
+        analyses, total = result_store.list(limit, offset, request.args.get('document_id'))
+        return jsonify({
+            "analyses": [
+                {
+                    "analysis_id": record["id"],
+                    "document_id": record["document_id"],
+                    "company_name": record["company_name"],
+                    "fiscal_year": record["fiscal_year"],
+                    "recommendation": record["recommendation"],
+                    "options": record["options"],
+                    "created_at": record["created_at"]
+                }
+                for record in analyses
+            ],
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if offset + limit < total else None
+        })
+
+    @app.route('/api/analyses/<analysis_id>', methods=['GET'])
+    def get_analysis(analysis_id):
+        """
+        Endpoint for fetching a stored analysis by its id.
+        """
+        record = result_store.get(analysis_id)
+        if record is None:
+            return jsonify({"error": "Analysis not found"}), 404
+        return jsonify(analysis_to_json(record))
+
+    @app.route('/api/analyses/<analysis_id>/reprice', methods=['POST'])
+    def reprice(analysis_id):
+        """
+        Endpoint for re-running the price-dependent part of a stored analysis
+        (valuation ratios, scores, SWOT and recommendation) at a new stock price.
+        No PDF parsing or LLM calls are made.
+        """
+        data = request.get_json(silent=True) or {}
+        try:
+            stock_price = float(data.get('stock_price'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "A numeric 'stock_price' is required"}), 400
+        if not math.isfinite(stock_price) or stock_price <= 0:
+            return jsonify({"error": "'stock_price' must be a positive finite number"}), 400
+
+        record = result_store.get(analysis_id)
+        if record is None:
+            return jsonify({"error": "Analysis not found"}), 404
+        if "ratios" not in record["result"]:
+            return jsonify({"error": "Analysis has no ratios to reprice"}), 400
+
+        results = reprice_analysis(record["result"], stock_price, result_store.peers())
+        # Saved under the options of the new price, so a later identical upload reuses it
+        options = dict(record["options"], stock_price=str(data.get('stock_price')))
+        result_store.put(record["document_id"], options, results)
+        return jsonify(results)
+
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """
+        Endpoint for polling the status and result of an asynchronous analysis.
+        """
+        job = job_store.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job_to_json(job))
+
+    @app.route('/api/jobs/<job_id>/events', methods=['GET'])
+    def stream_job_events(job_id):
+        """
+        Server-sent events stream of an asynchronous analysis.
+
+        Each stage event carries its partial results. The stream ends with a
+        'complete', 'failed' or 'cancelled' event holding the final job record.
+        Clients can resume with the Last-Event-ID header.
+        """
+        if job_store.get(job_id) is None:
+            return jsonify({"error": "Job not found"}), 404
+
+        try:
+            last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+        except ValueError:
+            last_seq = 0
+
+        def generate():
+            seq = last_seq
+            idle = 0.0
+            while True:
+                # Read the status before the events so no event written before
+                # the job finished can be missed
+                job = job_store.get(job_id)
+                events = job_store.get_events(job_id, seq)
+                for event in events:
+                    seq = event["seq"]
+                    yield f"id: {seq}\nevent: {event['stage']}\ndata: {json.dumps(event['payload'])}\n\n"
+
+                if job is None or job["status"] in FINISHED_STATES:
+                    final_event = "complete" if job and job["status"] == SUCCEEDED else (job["status"] if job else "failed")
+                    yield f"event: {final_event}\ndata: {json.dumps(job_to_json(job) if job else {})}\n\n"
+                    return
+
+                if events:
+                    idle = 0.0
+                else:
+                    time.sleep(sse_poll_interval)
+                    idle += sse_poll_interval
+                    if idle >= 15:
+                        # Keep proxies from closing an idle connection
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    @app.route('/api/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        """
+        Endpoint for cancelling a queued or running asynchronous analysis.
+        """
+        job = job_manager.cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        if job["status"] in (SUCCEEDED, FAILED):
+            return jsonify({"error": f"Job already {job['status']}", **job_to_json(job)}), 409
+        return jsonify(job_to_json(job))
     
     @app.route('/api/explain_further', methods=['POST'])
     def explain_further():
@@ -115,9 +386,27 @@ def register_routes(app):
         context = data.get('context', '')
         question = data.get('question', '')
         api_choice = data.get('api_choice', 'gemini')
+        document_id = data.get('document_id')
+        
+        if not question or not (context or document_id):
+            return jsonify({"error": "'question' and either 'context' or 'document_id' are required"}), 400
         
-        if not context or not question:
-            return jsonify({"error": "Both 'context' and 'question' are required"}), 400
+        # Ground the answer in the most relevant passages of the original filing
+        passages = []
+        if document_id:
+            try:
+                index = document_cache.get_index(document_id)
+            except ValueError:
+                return jsonify({"error": "Invalid 'document_id'"}), 400
+            if index is None:
+                return jsonify({"error": "Document not found. Please analyze the report again."}), 404
+            try:
+                top_k = max(1, min(int(data.get('top_k', retrieval_top_k)), 20))
+            except (TypeError, ValueError):
+                top_k = retrieval_top_k
+            passages = index.search(question, top_k)
+        
+        passages_text = "\n\n".join(f"[Page {p['page']}] {p['text']}" for p in passages)
         
         # Prepare a prompt for the LLM to explain the context further
         prompt = f"""
@@ -125,14 +414,19 @@ def register_routes(app):
         a specific part of a financial analysis.
         
         Here is the context from the analysis:
-        {context}
+        {context or "No specific section was selected."}
+        
+        Here are the most relevant passages from the original 10-K report:
+        {passages_text or "No matching passages were found in the report."}
         
         The user's question is:
         {question}
         
         Please provide a clear, helpful explanation that addresses the user's question directly.
+        Base your answer on the passages above where possible and cite their page numbers.
         Explain financial concepts in simple terms that would be understandable to a non-expert.
         """
+        sources = [{"page": p["page"], "score": p["score"]} for p in passages]
         
         # Use the appropriate LLM client based on api_choice
         if api_choice == 'openrouter':
@@ -144,16 +438,16 @@ def register_routes(app):
         
         # If the LLM returns a JSON with an explanation, extract it
         if isinstance(response, dict) and "explanation" in response:
-            return jsonify({"explanation": response["explanation"]})
+            return jsonify({"explanation": response["explanation"], "sources": sources})
         elif isinstance(response, dict) and "error" not in response:
             # If we get a valid response but not in the expected format, 
             # the LLM might have returned the explanation directly
-            return jsonify({"explanation": str(response)})
+            return jsonify({"explanation": str(response), "sources": sources})
         elif isinstance(response, dict) and "error" in response:
             return jsonify({"error": response["error"]}), 400
         else:
             # Convert the response to a string if it's something else
-            return jsonify({"explanation": str(response)})
+            return jsonify({"explanation": str(response), "sources": sources})
     
     @app.route('/api/feedback', methods=['POST'])
     def submit_feedback():
@@ -0,0 +1,65 @@
+import re
+from typing import Dict, Any, Optional
+
+from .trends import extract_period_values, CORE_METRICS
+from .value_parser import parse_value
+
+# Company names as a filing prints them on its cover page or title
+_REGISTRANT = re.compile(r"^[ \t]*(\S[^\n]{1,120}?)[ \t]*\n[ \t]*\(exact name of registrant", re.IGNORECASE | re.MULTILINE)
+_COMPANY = re.compile(
+    r"\b([A-Z][\w&.,'’\- ]{0,80}?\b(?:Inc|Corp|Corporation|Company|Co|Ltd|Limited|plc|PLC|LLC|N\.V|S\.A|AG|SE|Holdings|Group))\b\.?"
+)
+# The cover page's share count, e.g. "15,204,137,000 shares of common stock outstanding"
+_SHARES = re.compile(r"\b(\d{1,3}(?:,\d{3}){2,})\s+shares\b", re.IGNORECASE)
+
+def _company_name(text: str) -> Optional[str]:
+    match = _REGISTRANT.search(text)
+    if match is None:
+        match = _COMPANY.search(text[:5000])
+    return match.group(1).strip(" ,") if match else None
+
+def extract_financial_data_with_rules(pdf_data: Dict[str, Any]) -> dict:
+    """
+    Extract the current-year financial data from the statement rows of a filing,
+    without calling an LLM.
+
+    The statements are read with trends.extract_period_values and the fiscal
+    year is the latest year with core statement metrics (CORE_METRICS), so a
+    schedule of later years, such as debt maturities in the MD&A, is never
+    taken for the current year; the company name and the share count come
+    from the cover page. Metrics the statements do not print under a recognized label
+    are left out, and tables without an "(in millions)"-style caption keep
+    their values as printed.
+
+    Args:
+        pdf_data (Dict[str, Any]): The extracted data from the PDF (only 'text' is used)
+
+    Returns:
+        dict: Extracted financial data in the format of the LLM extraction, or
+              an error message if the filing has no recognizable statement rows
+    """
+    text = pdf_data.get('text', '')
+    periods, _ = extract_period_values(text)
+    if not periods:
+        return {"error": "No financial statement rows found in the document"}
+
+    statement_years = [year for year, values in periods.items() if any(metric in values for metric in CORE_METRICS)]
+    if not statement_years:
+        return {"error": "No financial statement rows found in the document"}
+    fiscal_year = max(statement_years)
+    data = {
+        "company_name": _company_name(text) or "Unknown",
+        "fiscal_year": str(fiscal_year),
+        "fiscal_period": "Annual",
+        **periods[fiscal_year]
+    }
+    shares = _SHARES.search(text)
+    if shares:
+        data["outstanding_shares"] = parse_value(shares.group(1))
+    # Statements print these as outflows or in parentheses; the LLM extraction reports them positive
+    for metric in ("capex", "interest_expense"):
+        if metric in data:
+            data[metric] = abs(data[metric])
+    if "capex" in data and "operating_cash_flow" in data:
+        data["free_cash_flow"] = data["operating_cash_flow"] - data["capex"]
+    return data
@@ -0,0 +1,129 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+from .profiling import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within one process
+    fcntl = None
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for it and get the same result or
+    exception. If the leader is aborted by a BaseException such as a job
+    cancellation, the waiting callers retry and one of them becomes the leader.
+
+    With a lock directory the leader also holds an exclusive file lock for the
+    key, so a worker process that asks for the same key waits for it instead
+    of starting a duplicate run. That second worker then calls the function
+    itself, which is cheap when the function first checks the result store the
+    leader wrote to.
+
+    The lock file is removed when the leader is done, so the lock directory
+    only holds the files of the keys in flight.
+
+    Args:
+        lock_dir (str, optional): Directory for per-key lock files shared by
+                                  all worker processes
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None):
+        self.lock_dir = lock_dir if fcntl else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    @contextmanager
+    def _process_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        path = os.path.join(self.lock_dir, f"{key}.lock")
+        while True:
+            lock_file = open(path, 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # The holder before us unlinks the file before it unlocks it, so a
+            # lock on a file that is no longer at path locks nothing: start over
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and current.st_ino == os.fstat(lock_file.fileno()).st_ino:
+                break
+            lock_file.close()
+        try:
+            yield
+        finally:
+            # Remove the file while still holding the lock, so the next leader
+            # always locks a file nobody is about to delete
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn for key, or wait for the run of fn that is already in flight for key.
+
+        Args:
+            key (str): Identity of the work, e.g. an analysis_key
+            fn (Callable): The work; called with no arguments
+
+        Returns:
+            Any: The result of fn, from this call or from the leader
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.executions += 1
+                else:
+                    self.coalesced += 1
+
+            if not leader:
+                with span("single_flight.wait"):
+                    call.done.wait()
+                if call.aborted:
+                    continue
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            try:
+                with self._process_lock(key):
+                    call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                raise
+            except BaseException:
+                call.aborted = True
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executions": self.executions, "coalesced": self.coalesced}
@@ -0,0 +1,313 @@
+import math
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+from .utils import safe_float
+from .value_parser import detect_scale, parse_column
+
+# Statement line items and the labels they appear under, matched against the
+# start of a normalized row label. The first match in the document wins, so the
+# primary statements take precedence over notes that repeat a line item.
+LINE_ITEMS: List[Tuple[str, re.Pattern]] = [(metric, re.compile(pattern)) for metric, pattern in [
+    ("revenue", r"^(total )?(net )?(revenues?|sales)( net)?$|^net sales and revenues?$"),
+    ("cogs", r"^(total )?cost of (revenues?|sales|goods sold)$"),
+    ("gross_profit", r"^gross (profit|margin)$"),
+    ("operating_expenses", r"^total (operating )?(costs and )?expenses$"),
+    ("operating_income", r"^(total )?(operating income|income from operations)( \(loss\))?$"),
+    ("interest_expense", r"^interest expense( net)?$"),
+    ("net_income", r"^net (income|earnings|loss|income \(loss\)|earnings \(loss\))$"),
+    ("cash_and_equivalents", r"^cash and (cash )?equivalents$"),
+    ("accounts_receivable", r"^(trade )?accounts receivable"),
+    ("inventory", r"^inventor(y|ies)( net)?$"),
+    ("total_current_assets", r"^total current assets$"),
+    ("ppe", r"^(total )?property( plant)? and equipment( net)?$"),
+    ("total_assets", r"^total assets$"),
+    ("accounts_payable", r"^(trade )?accounts payable$"),
+    ("short_term_debt", r"^(short-term (debt|borrowings)|current portion of long-term debt|commercial paper)$"),
+    ("total_current_liabilities", r"^total current liabilities$"),
+    ("long_term_debt", r"^long-term debt( net)?( (of|less|excluding) current portion)?$"),
+    ("total_liabilities", r"^total liabilities$"),
+    ("stockholders_equity", r"^total (stockholders|shareholders)['’]? equity$"),
+    ("operating_cash_flow", r"^net cash (provided by|from|generated by|provided by \(used in\)) operating activities$"),
+    ("capex", r"^(capital expenditures|purchases? of property|payments for (acquisition of )?property)"),
+    ("investing_cash_flow", r"^net cash (provided by|from|used in|\(used in\) provided by|provided by \(used in\)) investing activities$"),
+    ("financing_cash_flow", r"^net cash (provided by|from|used in|\(used in\) provided by|provided by \(used in\)) financing activities$"),
+]]
+
+# Line items every set of statements prints; the latest year they are printed
+# for is the fiscal year of the statements
+CORE_METRICS = ("revenue", "net_income", "total_assets")
+
+_YEAR = re.compile(r"\b(19[89]\d|20\d\d)\b")
+_NUMBER = re.compile(r"^\(?-?\$?\(?\d[\d,]*(\.\d+)?\)?$")
+_DASHES = {"-", "—", "–", "$-", "$—"}
+_SEPARATOR = re.compile(r"^--- (Page|Table on Page) ")
+
+def _normalize_label(label: str) -> str:
+    label = label.lower().replace("$", "").replace(",", "")
+    return re.sub(r"\s+", " ", label).strip(" :.")
+
+def _split_row(line: str) -> Tuple[str, List[str]]:
+    """
+    Split a statement row into its label and the printed numbers that follow it.
+    """
+    tokens = line.replace("|", " ").split()
+    label, numbers = [], []
+    for token in tokens:
+        if token == "$":
+            continue
+        if token in _DASHES or _NUMBER.match(token):
+            numbers.append(token)
+        elif numbers:
+            # Text after the numbers (e.g. a footnote) ends the row
+            break
+        else:
+            label.append(token)
+    return " ".join(label), numbers
+
+def _header_years(line: str) -> Optional[List[int]]:
+    """
+    Years of a column header row such as "2024 2023 2022", or None.
+    """
+    years = [int(year) for year in _YEAR.findall(line)]
+    if len(years) < 2 or len(set(years)) != len(years) or len(line) > 120:
+        return None
+    remainder = _YEAR.sub(" ", line)
+    if sum(1 for token in remainder.split() if _NUMBER.match(token.strip(","))) > 1:
+        return None  # A data row whose values happen to look like years
+    return years
+
+def extract_period_values(text: str) -> Tuple[Dict[int, Dict[str, float]], Dict[str, float]]:
+    """
+    Read the multi-year columns of the financial statements in a filing's text.
+
+    Rows are matched to LINE_ITEMS under the most recent header row of years on
+    the same page or table, and only when they have one number per year.
+    Values are scaled by an "(in millions)"-style caption on the same page; a
+    table without one keeps its values as printed and reports a scale of 0.
+
+    The fiscal year of the statements is the latest year with a CORE_METRICS
+    row. Rows under years later than that (e.g. a debt maturity or contractual
+    obligations schedule in the MD&A) are skipped, so they neither add periods
+    nor claim a line item before the statements.
+
+    Args:
+        text (str): pdf_data["text"] from extract_text_and_tables
+
+    Returns:
+        Tuple: ({year: {metric: value}}, {metric: scale applied to it})
+    """
+    rows = []  # (metric, years, numbers, scale) in document order
+    years, scale = None, 0.0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if _SEPARATOR.match(line):
+            years, scale = None, 0.0
+            continue
+        scale = detect_scale(line) or scale
+        header = _header_years(line)
+        if header:
+            years = header
+            continue
+        if not years:
+            continue
+        label, numbers = _split_row(line)
+        if len(numbers) != len(years) or not label:
+            continue
+        label = _normalize_label(label)
+        for metric, pattern in LINE_ITEMS:
+            if pattern.match(label):
+                rows.append((metric, years, numbers, scale))
+                break
+
+    fiscal_year = max((max(years) for metric, years, _, _ in rows if metric in CORE_METRICS), default=None)
+    selected = {}
+    for metric, years, numbers, scale in rows:
+        if metric not in selected and (fiscal_year is None or max(years) <= fiscal_year):
+            selected[metric] = (years, numbers, scale)
+
+    # The printed values of all the selected rows are parsed in one batch
+    values = iter(parse_column([number for _, numbers, _ in selected.values() for number in numbers]))
+    periods: Dict[int, Dict[str, float]] = {}
+    scales: Dict[str, float] = {}
+    for metric, (years, numbers, scale) in selected.items():
+        for year, value in zip(years, values):
+            if value is not None:
+                periods.setdefault(year, {})[metric] = value * (scale or 1.0)
+        scales[metric] = scale
+    return periods, scales
+
+def _calibrate(periods: Dict[int, Dict[str, float]], scales: Dict[str, float],
+               extracted_data: Optional[Dict[str, Any]]) -> None:
+    """
+    Scale metrics printed without a units caption to match the extracted current-year values.
+    """
+    unscaled = [metric for metric, scale in scales.items() if not scale]
+    if not unscaled or not extracted_data or not periods:
+        return
+    latest = periods[max(periods)]
+    factors = []
+    for metric in unscaled:
+        extracted, printed = safe_float(extracted_data.get(metric)), latest.get(metric)
+        if extracted and printed:
+            ratio = abs(extracted / printed)
+            power = round(math.log10(ratio) / 3) * 3 if ratio > 0 else 0
+            if power in (3, 6, 9) and abs(ratio / 10 ** power - 1) < 0.1:
+                factors.append(10 ** power)
+    if not factors:
+        return
+    factor = max(set(factors), key=factors.count)
+    for values in periods.values():
+        for metric in unscaled:
+            if metric in values:
+                values[metric] *= factor
+
+def _pct_change(current: Optional[float], prior: Optional[float]) -> Optional[float]:
+    if current is None or not prior:
+        return None
+    return (current - prior) / abs(prior) * 100
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+def compute_trends(periods: Dict[int, Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Year-over-year changes, CAGR, margin trajectories and working-capital swings.
+
+    Args:
+        periods (Dict[int, Dict[str, float]]): Output of extract_period_values
+
+    Returns:
+        Dict[str, Any]: The trend analysis, or {} with fewer than two periods
+    """
+    years = sorted(periods)
+    if len(years) < 2:
+        return {}
+    latest, prior = periods[years[-1]], periods[years[-2]]
+    metrics = [metric for metric, _ in LINE_ITEMS if any(metric in periods[year] for year in years)]
+
+    series = {metric: [periods[year].get(metric) for year in years] for metric in metrics}
+
+    yoy = {}
+    for metric in metrics:
+        current, previous = latest.get(metric), prior.get(metric)
+        if current is not None and previous is not None:
+            yoy[metric] = {
+                "current": current, "prior": previous, "change": current - previous,
+                "change_pct": _round(_pct_change(current, previous))
+            }
+
+    cagr = {}
+    for metric, values in series.items():
+        known = [(year, value) for year, value in zip(years, values) if value is not None]
+        if len(known) >= 3 and known[0][1] > 0 and known[-1][1] > 0:
+            span = known[-1][0] - known[0][0]
+            cagr[metric] = _round(((known[-1][1] / known[0][1]) ** (1 / span) - 1) * 100)
+
+    margins = {}
+    for name, numerator in (("gross_margin", "gross_profit"), ("operating_margin", "operating_income"), ("net_margin", "net_income")):
+        trajectory = [
+            _round(periods[year][numerator] / periods[year]["revenue"] * 100)
+            if periods[year].get(numerator) is not None and periods[year].get("revenue") else None
+            for year in years
+        ]
+        if any(value is not None for value in trajectory):
+            margins[name] = trajectory
+    margin_change_pp = {
+        name: _round(trajectory[-1] - trajectory[-2])
+        for name, trajectory in margins.items()
+        if trajectory[-1] is not None and trajectory[-2] is not None
+    }
+
+    working_capital = {}
+    capital = [
+        periods[year]["total_current_assets"] - periods[year]["total_current_liabilities"]
+        if "total_current_assets" in periods[year] and "total_current_liabilities" in periods[year] else None
+        for year in years
+    ]
+    if any(value is not None for value in capital):
+        working_capital["values"] = capital
+        if capital[-1] is not None and capital[-2] is not None:
+            working_capital["change"] = capital[-1] - capital[-2]
+        # Cash tied up (negative) or released (positive) by operating working capital
+        deltas = {metric: yoy[metric]["change"] for metric in ("accounts_receivable", "inventory", "accounts_payable") if metric in yoy}
+        if deltas:
+            working_capital["component_changes"] = deltas
+            working_capital["operating_cash_impact"] = (
+                -deltas.get("accounts_receivable", 0) - deltas.get("inventory", 0) + deltas.get("accounts_payable", 0)
+            )
+
+    trends = {
+        "periods": years,
+        "series": series,
+        "yoy": yoy,
+        "cagr_pct": cagr,
+        "margins_pct": margins,
+        "margin_change_pp": margin_change_pp,
+        "working_capital": working_capital,
+    }
+    trends["summary"] = summarize_trends(trends)
+    trends["preliminary_trend_assessment"] = trends["summary"]["preliminary_trend_assessment"]
+    return trends
+
+def summarize_trends(trends: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compact numeric summary of a trend analysis for LLM prompts.
+    """
+    years = trends["periods"]
+    yoy, margin_change = trends["yoy"], trends["margin_change_pp"]
+    summary: Dict[str, Any] = {"periods": f"{years[0]}-{years[-1]}"}
+    for metric in ("revenue", "gross_profit", "operating_income", "net_income", "operating_cash_flow"):
+        if metric in yoy and yoy[metric]["change_pct"] is not None:
+            summary[f"{metric}_yoy_pct"] = yoy[metric]["change_pct"]
+    for metric, value in trends["cagr_pct"].items():
+        if metric in ("revenue", "net_income", "operating_income"):
+            summary[f"{metric}_cagr_pct"] = value
+    for name, value in margin_change.items():
+        summary[f"{name}_change_pp"] = value
+    working_capital = trends["working_capital"]
+    if "change" in working_capital:
+        summary["working_capital_change"] = working_capital["change"]
+    if "operating_cash_impact" in working_capital:
+        summary["working_capital_cash_impact"] = working_capital["operating_cash_impact"]
+
+    observations = []
+    revenue_growth = summary.get("revenue_yoy_pct")
+    if revenue_growth is not None:
+        observations.append(f"revenue {'grew' if revenue_growth >= 0 else 'fell'} {abs(revenue_growth):.1f}% year over year")
+    margin = margin_change.get("operating_margin", margin_change.get("net_margin"))
+    if margin is not None:
+        name = "operating" if "operating_margin" in margin_change else "net"
+        direction = "expanded" if margin > 0.5 else "contracted" if margin < -0.5 else "held steady"
+        observations.append(f"{name} margin {direction} ({margin:+.1f} pp)")
+    earnings_growth = summary.get("net_income_yoy_pct")
+    if earnings_growth is not None:
+        observations.append(f"net income {'rose' if earnings_growth >= 0 else 'declined'} {abs(earnings_growth):.1f}%")
+    if "working_capital_cash_impact" in summary:
+        impact = summary["working_capital_cash_impact"]
+        observations.append("working capital " + ("released cash" if impact > 0 else "absorbed cash" if impact < 0 else "was cash-neutral"))
+    summary["preliminary_trend_assessment"] = (
+        f"From {summary['periods']}: " + "; ".join(observations) + "." if observations
+        else "Multi-period statement data found, but no comparable line items."
+    )
+    return summary
+
+def analyze_trends(pdf_data: Dict[str, Any], extracted_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Trend analysis from the prior-year columns of the statements in a parsed filing.
+
+    Args:
+        pdf_data (Dict[str, Any]): Output of extract_text_and_tables
+        extracted_data (Dict[str, Any], optional): Current-year values in raw units,
+                                                   used to scale tables printed without
+                                                   a units caption
+
+    Returns:
+        Dict[str, Any]: Output of compute_trends, or {} if the filing has fewer than
+                        two periods of statement data
+    """
+    periods, scales = extract_period_values(pdf_data.get("text", ""))
+    _calibrate(periods, scales, extracted_data)
+    return compute_trends(periods)
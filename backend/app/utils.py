@@ -1,8 +1,14 @@
+import hashlib
 import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
+from .value_parser import parse_value
 
 # Configure upload settings
 # UPLOAD_FOLDER = tempfile.gettempdir() # This might be needed if utils access it directly, or passed as arg
-ALLOWED_EXTENSIONS = {'pdf'}
+ALLOWED_EXTENSIONS = {'pdf', 'htm', 'html', 'xhtml'}  # PDFs and inline XBRL filings
 # app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER # App specific config
 # app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload # App specific config
 
@@ -26,36 +32,119 @@ def safe_float(value: any) -> float | None:
     Args:
         value (any): The value to convert. It can be a number, string, or None.
                      String values can include '$' and ',', and negative numbers
-                     can be represented with '()'. Also handles 'M' (million) and
-                     'B' (billion) suffixes common in financial reports.
+                     can be represented with '()' or a minus sign. Unit suffixes
+                     (K, M, B, 'thousand', 'million'...), footnote markers and
+                     lone dashes for zero are handled; see value_parser.parse_value.
 
     Returns:
         float | None: The converted float value, or None if conversion fails.
     """
-    if value is None:
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    try:
-        # Handle common suffixes in financial reports
-        original_value = str(value).strip()
-        multiplier = 1.0
-        
-        # Check for million/billion suffixes
-        if original_value.upper().endswith('M'):
-            multiplier = 1000000.0
-            value = original_value[:-1]
-        elif original_value.upper().endswith('B'):
-            multiplier = 1000000000.0
-            value = original_value[:-1]
-        
-        # Remove currency symbols and commas
-        clean_value = str(value).replace("$", "").replace(",", "").strip()
-        
-        # Handle parentheses notation for negative numbers
-        if clean_value.startswith("(") and clean_value.endswith(")"):
-            return -float(clean_value[1:-1]) * multiplier
-        
-        return float(clean_value) * multiplier
-    except (ValueError, TypeError):
-        return None
+    return parse_value(value)
+
+def compute_file_hash(filepath: str, block_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 hex digest of a file.
+
+    Args:
+        filepath (str): The path to the file.
+        block_size (int): Number of bytes read per iteration.
+
+    Returns:
+        str: The hex digest, used as the document id for caching.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FileTooLarge(ValueError):
+    """
+    Raised by copy_and_hash when the source is larger than allowed.
+    """
+
+def copy_and_hash(source: BinaryIO, destination: BinaryIO, block_size: int = 1024 * 1024,
+                  max_size: Optional[int] = None) -> tuple[str, int]:
+    """
+    Copy a binary stream while computing its SHA-256 in the same pass.
+
+    Args:
+        source (BinaryIO): Stream to read from.
+        destination (BinaryIO): Stream to write to.
+        block_size (int): Number of bytes copied per iteration.
+        max_size (int, optional): Most bytes to copy; reading stops as soon as
+                                  the source turns out to be larger.
+
+    Returns:
+        tuple[str, int]: The hex digest and the number of bytes copied.
+
+    Raises:
+        FileTooLarge: If the source has more than max_size bytes
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        if max_size is not None and size + len(block) > max_size:
+            raise FileTooLarge(f"File is larger than {max_size} bytes")
+        digest.update(block)
+        destination.write(block)
+        size += len(block)
+    return digest.hexdigest(), size
+
+class SpooledUpload:
+    """
+    An uploaded file copied into a SpooledTemporaryFile, hashed while it is saved.
+
+    Uploads up to max_memory_size bytes stay in memory and larger ones roll over
+    to an anonymous temporary file, so concurrent uploads with the same name can
+    never overwrite each other. Use it as a context manager: the spooled data is
+    released on every exit path.
+
+    Args:
+        file_storage: The uploaded file (werkzeug FileStorage)
+        max_memory_size (int): Size above which the upload is spooled to disk
+    """
+
+    def __init__(self, file_storage, max_memory_size: int = 8 * 1024 * 1024):
+        self.filename = file_storage.filename
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory_size)
+        try:
+            self.sha256, self.size = copy_and_hash(file_storage.stream, self.file)
+        except Exception:
+            self.file.close()
+            raise
+        self.file.seek(0)
+
+    @property
+    def stream(self) -> BinaryIO:
+        """
+        The upload as a seekable binary stream positioned at the start,
+        suitable for pdfplumber.open.
+        """
+        self.file.seek(0)
+        return self.file
+
+    def persist(self, directory: str) -> str:
+        """
+        Write the upload to a new, uniquely named file in directory.
+
+        Returns:
+            str: The path of the written file. The caller owns (and must delete) it.
+        """
+        extension = os.path.splitext(self.filename or '')[1].lower() or '.pdf'
+        fd, path = tempfile.mkstemp(suffix=extension, dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(self.stream, f)
+        return path
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,177 @@
+import re
+from typing import List, Any, Iterable, Optional, Tuple
+
+# Multipliers of the unit words and suffixes a printed value may carry
+UNITS = {
+    "k": 1e3, "thousand": 1e3, "thousands": 1e3,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "mil": 1e6, "million": 1e6, "millions": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9, "billions": 1e9,
+    "t": 1e12, "tn": 1e12, "trillion": 1e12, "trillions": 1e12,
+}
+
+_MINUS = "-−–"  # hyphen-minus, unicode minus, en dash
+
+# The common case, a plain or parenthesized amount such as "1,234", "$ 12.5", "(1,234)" or "1.5M"
+_PLAIN = re.compile(r"[$ ]*(\(?)[$ ]*(\d[\d,]*(?:\.\d+)?)(\)?) *([KkMmBb]?) *")
+_DIGITS = frozenset("0123456789")
+_SUFFIXES = {"": 1.0, "k": 1e3, "K": 1e3, "m": 1e6, "M": 1e6, "b": 1e9, "B": 1e9}
+
+# Any printed value: optional sign and currency, optional accounting parentheses,
+# the number, an optional unit word (inside or outside the parentheses) and
+# trailing footnote markers such as "(1)", "(a)", "[2]", "*" or superscript digits
+_VALUE = re.compile(rf"""
+    \s*(?P<sign>[{_MINUS}])?[\s$€£]*
+    (?P<open>\()?[\s$€£]*(?P<inner_sign>[{_MINUS}])?[\s$€£]*
+    (?P<number>\d[\d,]*(?:\.\d*)?|\.\d+)(?:[eE](?P<exponent>[-+]?\d+))?
+    \s*(?P<unit>[A-Za-z]+)?\.?\s*
+    (?P<close>\))?\s*(?P<outer_unit>[A-Za-z]+)?\.?
+    (?:\s*(?:\(\d\d?\)|\([a-z]\)|\[\d\d?\]|[*†‡¹²³⁰-⁹]))*
+    \s*""", re.VERBOSE)
+
+# A cell that is only a dash (optionally with a currency sign) means zero
+_ZERO = re.compile(rf"\s*[$€£]?\s*[{_MINUS}—]+\s*")
+
+# Column or page captions such as "(in millions, except per share data)"
+_SCALE = re.compile(r"\bin (thousands|millions|billions)\b", re.IGNORECASE)
+
+def detect_scale(text: str) -> Optional[float]:
+    """
+    Unit scale of a statement or column from its "(in millions)"-style caption.
+
+    Args:
+        text (str): Caption, header row or page text
+
+    Returns:
+        float | None: 1e3, 1e6 or 1e9, or None if the text has no such caption
+    """
+    match = _SCALE.search(text)
+    return UNITS[match.group(1).lower()] if match else None
+
+def _parse_text(text: str) -> Tuple[Optional[float], bool]:
+    """
+    Parse one printed value.
+
+    Returns:
+        Tuple: (value, has_unit), where value is None if the text is not a number
+               and has_unit tells whether the text carried its own unit
+    """
+    match = _PLAIN.fullmatch(text)
+    if match is not None:
+        open_paren, number, close_paren, suffix = match.groups()
+        if open_paren == "(" and close_paren == ")":
+            return -float(number.replace(",", "")) * _SUFFIXES[suffix], suffix != ""
+        if not open_paren and not close_paren:
+            return float(number.replace(",", "")) * _SUFFIXES[suffix], suffix != ""
+
+    match = _VALUE.fullmatch(text)
+    if match is None:
+        return (0.0, False) if _ZERO.fullmatch(text) else (None, False)
+    sign, open_paren, inner_sign, number, exponent, unit, close_paren, outer_unit = match.groups()
+    if (open_paren is None) != (close_paren is None) or (unit and outer_unit):
+        return None, False
+    unit = unit or outer_unit
+    if unit:
+        multiplier = UNITS.get(unit.lower())
+        if multiplier is None:
+            return None, False
+    value = float(number.replace(",", "") if exponent is None else f"{number.replace(',', '')}e{exponent}")
+    if unit:
+        value *= multiplier
+    if (sign is not None) ^ (inner_sign is not None) ^ (open_paren is not None):
+        value = -value
+    return value, unit is not None
+
+def _strip_plain(text: str) -> str:
+    # Leaves plain amounts as float() input; str.replace is much faster than
+    # str.translate once the text has non-ASCII characters such as "—". Inner
+    # spaces are kept, so "1,234 1,100" (two values) fails float() and is
+    # rejected by the full parser instead of being read as 12341100
+    return text.replace("$", "").replace(",", "")
+
+def parse_value(value: Any, scale: float = 1.0) -> Optional[float]:
+    """
+    Convert a printed financial value to a float.
+
+    Handles currency signs, thousands separators, "-", unicode and en-dash minus
+    signs, accounting parentheses for negatives, unit suffixes and words
+    (K/thousand, M/million, B/billion, T/trillion), trailing footnote markers,
+    and lone dashes, which statements print for zero.
+
+    Args:
+        value (Any): A number, a string, or None
+        scale (float): Multiplier for values printed without their own unit,
+                       e.g. 1e6 for a column captioned "(in millions)"
+
+    Returns:
+        float | None: The value, or None if it is missing or not a number
+    """
+    kind = type(value)
+    if kind is float or kind is int:
+        return value * scale if scale != 1.0 else float(value)
+    if value is None:
+        return None
+    if kind is not str:
+        if isinstance(value, (int, float)):
+            return float(value) * scale
+        value = str(value)
+    # Plain amounts such as "$ 1,234" go straight to float()
+    line = _strip_plain(value).strip()
+    if line and line[-1] in _DIGITS and line[0] in _DIGITS:
+        try:
+            return float(line) * scale
+        except ValueError:
+            pass
+    number, has_unit = _parse_text(value)
+    if number is None or has_unit or scale == 1.0:
+        return number
+    return number * scale
+
+def parse_column(cells: Iterable[Any], scale: float = 1.0) -> List[Optional[float]]:
+    """
+    Parse a column of printed values at once.
+
+    Currency signs and separators are stripped from the whole column in one
+    pass, so a plain or parenthesized amount costs one float() call.
+    Other cells take the full parser, once per distinct text (columns repeat
+    "—", "$" and the like).
+
+    Args:
+        cells (Iterable[Any]): The column's cells (strings, numbers or None)
+        scale (float): Multiplier for values printed without their own unit
+
+    Returns:
+        List[float | None]: One value per cell, None where a cell is not a number
+    """
+    cells = cells if isinstance(cells, list) else list(cells)
+    texts = [cell if type(cell) is str else "" for cell in cells]
+    lines = _strip_plain("\n".join(texts)).split("\n")
+    if len(lines) != len(texts):
+        lines = [_strip_plain(text) for text in texts]  # A cell spans lines
+    digits = _DIGITS
+    parsed = {}
+    values = []
+    append = values.append
+    for cell, line in zip(cells, lines):
+        line = line.strip()
+        if line and line[-1] in digits:
+            if line[0] in digits:
+                try:
+                    append(float(line) * scale)
+                    continue
+                except ValueError:
+                    pass
+        elif line[:1] == "(" and line[-2:-1] in digits and line[-1] == ")":
+            try:
+                append(-float(line[1:-1]) * scale)
+                continue
+            except ValueError:
+                pass
+        if type(cell) is not str:
+            append(parse_value(cell, scale))
+            continue
+        value = parsed.get(cell, parsed)
+        if value is parsed:
+            number, has_unit = _parse_text(cell)
+            value = parsed[cell] = number if number is None or has_unit else number * scale
+        append(value)
+    return values
@@ -0,0 +1,68 @@
+"""
+Production gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is loaded once in the master (preload_app) so the slow SDK imports and
+warm-up are paid before forking. Each worker serves requests on a few threads;
+analyses spend most of their time waiting on LLM APIs, and the CPU-bound PDF
+parsing runs in a per-worker process pool so it does not hold the GIL that the
+request threads share.
+
+Every setting can be overridden with the environment variable named next to it.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+
+# A full analysis is parse + four LLM calls, each capped by LLM_REQUEST_TIMEOUT
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then so memory held by large documents is returned
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+
+# App settings for this profile, read by create_app() when the app is preloaded
+os.environ.setdefault("PARSE_POOL_WORKERS", "1")
+os.environ.setdefault("PDF_PARSE_TIMEOUT", "120")
+os.environ.setdefault("LLM_REQUEST_TIMEOUT", "120")
+# Recover unfinished jobs and start the parse workers in the workers (post_fork),
+# not in the master: forked workers could not share the master's pool
+os.environ.setdefault("JOB_RECOVERY_ON_START", "false")
+os.environ.setdefault("PARSE_POOL_ON_START", "false")
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="finbrief-metrics-")
+
+def _extensions(server):
+    return server.app.wsgi().extensions
+
+def post_fork(server, worker):
+    # The job threads must start in the worker; JobStore.claim makes sure only
+    # one worker takes over each job
+    recovered = _extensions(server)["finbrief_jobs"].recover()
+    if recovered:
+        print(f"Worker {worker.pid} recovered {recovered} unfinished jobs")
+    # Start this worker's PDF parse workers now, so they are warm by the first upload
+    config = server.app.wsgi().config
+    if config["PARSE_POOL_WORKERS"] > 0:
+        from app.pdf_pool import get_parse_pool
+        get_parse_pool(config["PARSE_POOL_WORKERS"], config["PARSE_WORKER_MAX_JOBS"])
+
+def worker_exit(server, worker):
+    # Let running jobs finish within graceful_timeout; queued ones stay in the
+    # job store and are recovered by the next worker
+    from app.pdf_pool import shutdown_parse_pool
+    _extensions(server)["finbrief_jobs"].shutdown(wait=True)
+    shutdown_parse_pool()
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
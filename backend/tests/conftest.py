@@ -0,0 +1,60 @@
+import importlib.util
+import io
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    The Flask app from create_app(), with its data directory in a temporary folder.
+    """
+    monkeypatch.setenv("FINBRIEF_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("WARMUP", "false")
+    monkeypatch.setenv("PARSE_POOL_WORKERS", "0")
+    # app.py shares its name with the app package, so load it by path
+    spec = importlib.util.spec_from_file_location("backend_app", os.path.join(BACKEND_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.create_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def make_pdf(pages):
+    """
+    A PDF with one page per list of text lines, in Helvetica, written by hand
+    so the tests need no PDF library besides the pdfplumber the app uses.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"{_pdf_string(line)} '" for line in lines) + " ET"
+        stream = content.encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return output.getvalue()
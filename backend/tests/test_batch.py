@@ -0,0 +1,41 @@
+import io
+import os
+import zipfile
+
+from werkzeug.datastructures import FileStorage
+
+from app.batch import save_batch_files, latency_percentiles
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename="filings.zip")
+
+def test_zip_members_over_the_file_limit_are_skipped(tmp_path):
+    upload = _zip({"small.pdf": b"%PDF" + b"0" * 100, "bomb.pdf": b"\0" * 10_000_000})
+    saved, skipped = save_batch_files([upload], str(tmp_path), 10, max_file_size=1_000_000)
+    assert [name for name, _, _ in saved] == ["small.pdf"]
+    assert skipped[0]["filename"] == "bomb.pdf"
+    assert "larger than the limit" in skipped[0]["error"]
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) < 1_000
+
+def test_zip_members_over_the_total_limit_are_skipped(tmp_path):
+    upload = _zip({f"{index}.pdf": b"x" * 600 for index in range(5)})
+    saved, skipped = save_batch_files([upload], str(tmp_path), 10, max_file_size=1_000, max_total_size=2_000)
+    assert len(saved) == 3
+    assert len(skipped) == 2
+    assert all("Batch size limit" in record["error"] for record in skipped)
+
+def test_member_larger_than_its_header_is_cut_off(tmp_path):
+    upload = FileStorage(stream=io.BytesIO(b"y" * 5_000), filename="big.pdf")
+    saved, skipped = save_batch_files([upload], str(tmp_path), 10, max_file_size=1_000)
+    assert saved == []
+    assert skipped[0]["filename"] == "big.pdf"
+    assert os.listdir(tmp_path) == []
+
+def test_latency_percentiles():
+    assert latency_percentiles([]) == {"p50": None, "p90": None, "p99": None, "max": None}
+    assert latency_percentiles([float(value) for value in range(1, 11)]) == {"p50": 5.0, "p90": 9.0, "p99": 10.0, "max": 10.0}
@@ -0,0 +1,30 @@
+from app.chunk_selection import (select_chunks, score_chunk, estimate_tokens, missing_fields,
+                                 CHUNK_TOP_K, CHUNK_TOKEN_BUDGET, REQUIRED_FIELDS)
+from app.pdf_processor import MAX_CHUNK_CHARS
+
+STATEMENT_ROWS = "Total net revenues 10,000 9,000\nNet income 1,000 800\nTotal assets 20,000 18,000\n"
+PROSE = "The company designs and sells products in many markets around the world. "
+
+def _chunk(text, size):
+    return (text * (size // len(text) + 1))[:size]
+
+def test_the_token_budget_cuts_the_third_full_size_chunk():
+    chunks = [_chunk(PROSE, 10_000) for _ in range(18)]
+    for index in (0, 4, 9):
+        chunks[index] = _chunk("CONSOLIDATED BALANCE SHEETS (in millions)\n" + STATEMENT_ROWS * 3, MAX_CHUNK_CHARS)
+    # A short tail chunk, less dense than the statements
+    chunks.append(_chunk("Net income grew. " + PROSE + "Revenues 1,000 ", 2_000))
+    assert score_chunk(chunks[-1]) < score_chunk(chunks[0])
+    assert CHUNK_TOP_K * estimate_tokens(chunks[0]) > CHUNK_TOKEN_BUDGET
+    selected = select_chunks(chunks)
+    # Two full-size statement chunks fit, the third does not; the short tail chunk takes its slot
+    assert [index for index, _ in selected] == [0, 4, len(chunks) - 1]
+    assert sum(estimate_tokens(chunk) for _, chunk in selected) <= CHUNK_TOKEN_BUDGET
+    # Without the budget, the top three are the statement chunks
+    assert [index for index, _ in select_chunks(chunks, token_budget=10**6)] == [0, 4, 9]
+
+def test_early_stop_does_not_wait_for_often_unreported_fields():
+    combined = {field: 1.0 for field in REQUIRED_FIELDS}
+    assert "inventory" not in REQUIRED_FIELDS and "interest_expense" not in REQUIRED_FIELDS
+    assert missing_fields(dict(combined, inventory=None, interest_expense=None, gross_profit=None)) == []
+    assert missing_fields(dict(combined, revenue=None)) == ["revenue"]
@@ -0,0 +1,55 @@
+import json
+
+from app import cli
+
+from conftest import make_pdf
+from test_trends import STATEMENTS
+
+STATEMENT = [line for line in STATEMENTS.splitlines() if not line.startswith("---")]
+
+def _records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_rerun_on_the_same_output_does_not_repeat_filings(tmp_path):
+    filings = tmp_path / "filings"
+    filings.mkdir()
+    for index in range(2):
+        (filings / f"co{index}.pdf").write_bytes(make_pdf([STATEMENT + [f"Company {index}"]]))
+    output = tmp_path / "out.jsonl"
+    argv = [str(filings), "-o", str(output), "--data-dir", str(tmp_path / "data"),
+            "--analysis-detail", "fast", "--parse-workers", "1", "--llm-workers", "1"]
+
+    assert cli.main(argv) == 0
+    first = [record for record in _records(output) if "summary" not in record]
+    assert len(first) == 2
+
+    # An interrupted write leaves half a line behind
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"filename": "co')
+    assert cli.main(argv) == 0
+    lines = output.read_text(encoding='utf-8').splitlines()
+    assert lines[-2] == '{"filename": "co'
+    records = [json.loads(line) for line in lines if line != '{"filename": "co']
+    assert [record for record in records if "summary" not in record] == first
+    assert records[-1]["summary"]["filings"] == 0
+
+def test_failed_filings_are_recorded_with_their_id_and_retried_on_request(tmp_path):
+    filings = tmp_path / "filings"
+    filings.mkdir()
+    (filings / "blank.pdf").write_bytes(make_pdf([["No statements here"]]))
+    (filings / "broken.pdf").write_bytes(b"%PDF-1.4 not really")
+    output = tmp_path / "out.jsonl"
+    argv = [str(filings), "-o", str(output), "--data-dir", str(tmp_path / "data"),
+            "--analysis-detail", "fast", "--parse-workers", "1", "--llm-workers", "1"]
+
+    assert cli.main(argv) == 1
+    failed = [record for record in _records(output) if "summary" not in record]
+    assert [record["status"] for record in failed] == ["error", "error"]
+    assert all(record["document_id"] for record in failed)
+
+    assert cli.main(argv) == 0
+    assert _records(output)[-1]["summary"]["filings"] == 0
+
+    assert cli.main(argv + ["--retry-failed"]) == 1
+    assert _records(output)[-1]["summary"]["filings"] == 2
@@ -0,0 +1,43 @@
+import os
+import threading
+
+from app.document_cache import DocumentCache
+
+DOCUMENT_ID = "a" * 64
+
+def test_concurrent_writers_of_one_document_never_collide(tmp_path):
+    cache = DocumentCache(str(tmp_path), "1")
+    errors = []
+
+    def writer(index):
+        try:
+            for _ in range(20):
+                cache.put(DOCUMENT_ID, {"text": str(index) * 50_000, "page_chunks": []})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    document = cache.get_document(DOCUMENT_ID)
+    assert len(set(document["text"])) == 1
+    assert sorted(os.listdir(tmp_path / DOCUMENT_ID)) == ["document.json", "index.json"]
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+    cache = DocumentCache(str(tmp_path), "1")
+    try:
+        cache.put(DOCUMENT_ID, {"text": object(), "page_chunks": []})
+    except TypeError:
+        pass
+    assert os.listdir(tmp_path / DOCUMENT_ID) == []
+
+def test_documents_of_another_extractor_version_are_a_miss(tmp_path):
+    DocumentCache(str(tmp_path), "1").put(DOCUMENT_ID, {"text": "cached", "page_chunks": []})
+
+    assert DocumentCache(str(tmp_path), "1").get_document(DOCUMENT_ID) == {"text": "cached", "page_chunks": []}
+    assert DocumentCache(str(tmp_path), "1").get_index(DOCUMENT_ID) is not None
+    assert DocumentCache(str(tmp_path), "2").get_document(DOCUMENT_ID) is None
+    assert DocumentCache(str(tmp_path), "2").get_index(DOCUMENT_ID) is None
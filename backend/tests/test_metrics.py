@@ -0,0 +1,35 @@
+import io
+import re
+
+from conftest import make_pdf
+
+STATEMENT = [
+    "Acme Corp Annual Report 2024",
+    "CONSOLIDATED STATEMENTS OF OPERATIONS (in millions)",
+    "Total net revenues 1,000 900",
+    "Net income 100 80",
+    "CONSOLIDATED BALANCE SHEETS",
+    "Total assets 2,000 1,800",
+    "Total liabilities 800 700",
+]
+
+def _count(metrics, name, labels=""):
+    match = re.search(rf"^{name}_count{re.escape(labels)} (\S+)$", metrics, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+def test_upload_page_parse_and_table_histograms_are_exposed(client):
+    before = client.get("/metrics").get_data(as_text=True)
+    response = client.post("/api/analyze", data={
+        "file": (io.BytesIO(make_pdf([STATEMENT, ["Item 7. Management discussion"]])), "acme.pdf"),
+        "analysis_detail": "standard",
+        "include_llm_analysis": "false",
+    }, content_type="multipart/form-data")
+    assert response.status_code in (200, 400)
+    after = client.get("/metrics").get_data(as_text=True)
+
+    assert _count(after, "finbrief_upload_duration_seconds", '{route="analyze"}') == \
+        _count(before, "finbrief_upload_duration_seconds", '{route="analyze"}') + 1
+    assert _count(after, "finbrief_pdf_page_parse_duration_seconds") == \
+        _count(before, "finbrief_pdf_page_parse_duration_seconds") + 2
+    assert _count(after, "finbrief_table_extraction_duration_seconds") == \
+        _count(before, "finbrief_table_extraction_duration_seconds") + 2
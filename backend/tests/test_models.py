@@ -0,0 +1,48 @@
+import json
+
+from app.analysis_store import AnalysisStore
+from app.financial_analyzer import calculate_financial_ratios
+from app.models import AnalysisResult, FinancialSnapshot
+from app.ratio_engine import batch_ratios
+
+DATA = {
+    "company_name": "Acme Corp",
+    "fiscal_year": "2024",
+    "fiscal_period": "FY",
+    "revenue": "1,000",
+    "net_income": "100",
+    "total_assets": "2,000",
+    "total_current_assets": "600",
+    "total_current_liabilities": "300",
+    "total_liabilities": "800",
+    "stockholders_equity": "1,200",
+    "outstanding_shares": "50",
+    "operating_cash_flow": "150",
+    "capex": "(40)",
+}
+
+def _results():
+    return calculate_financial_ratios(dict(DATA), "20", include_llm_analysis=False)
+
+def test_analysis_result_round_trips_to_the_same_json():
+    results = _results()
+    results["scores"]["roe"]["peer_percentile"] = 61.5
+    results["scores"]["roe"]["peer_count"] = 12
+
+    typed = AnalysisResult.from_json(results)
+    assert isinstance(typed.extracted_data, FinancialSnapshot)
+    assert json.dumps(typed.to_json()) == json.dumps(results)
+
+def test_store_serializes_through_analysis_result(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.db"), "test")
+    results = _results()
+    analysis_id = store.put("doc", {"tier": "standard"}, AnalysisResult.from_json(results))
+
+    stored = store.find("doc", {"tier": "standard"})
+    assert stored == dict(results, analysis_id=analysis_id)
+
+    snapshots = store.snapshots("2024")
+    assert list(snapshots) == [analysis_id]
+    assert snapshots[analysis_id].company_name == "Acme Corp"
+    [(ratios, _)] = batch_ratios(list(snapshots.values()), [20.0])
+    assert ratios == results["ratios"]
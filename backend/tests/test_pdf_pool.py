@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from app import pdf_pool
+from app.pdf_pool import ParseTimeout, get_parse_pool, parse_in_pool, shutdown_parse_pool
+
+from conftest import make_pdf
+
+@pytest.fixture
+def fresh_pool():
+    shutdown_parse_pool()
+    yield
+    shutdown_parse_pool()
+
+def test_pool_started_on_demand_honors_parse_worker_max_jobs(fresh_pool, monkeypatch):
+    monkeypatch.setenv("PARSE_WORKER_MAX_JOBS", "3")
+    assert get_parse_pool(1).max_jobs_per_worker == 3
+
+def test_document_is_parsed_in_the_workers(fresh_pool, tmp_path):
+    path = tmp_path / "filing.pdf"
+    path.write_bytes(make_pdf([["Page one"], ["Page two"], ["Page three"]]))
+    document = parse_in_pool(str(path), 2, timeout=60, pages_per_job=2)
+    assert document["page_count"] == 3
+    assert "Page three" in document["text"]
+
+def test_unreadable_pdf_gives_an_empty_document(fresh_pool, tmp_path):
+    path = tmp_path / "bad.pdf"
+    path.write_bytes(b"not a pdf")
+    document = parse_in_pool(str(path), 1, timeout=60)
+    assert document["page_count"] == 0
+    assert not document["text"].strip()
+
+def test_waiting_for_a_busy_pool_counts_against_the_timeout(fresh_pool, tmp_path):
+    path = tmp_path / "filing.pdf"
+    path.write_bytes(make_pdf([["Page one"]]))
+    pool = get_parse_pool(1)
+    busy = pool.submit(time.sleep, 5)
+    started = time.monotonic()
+    with pytest.raises(ParseTimeout):
+        parse_in_pool(str(path), 1, timeout=1)
+    assert time.monotonic() - started < 3
+    busy.cancel()
+
+def test_unpicklable_job_fails_its_future_and_the_pool_keeps_working(fresh_pool):
+    pool = get_parse_pool(1)
+    with pytest.raises(Exception):
+        pool.submit(len, lambda: None).result(timeout=60)
+    assert pool.submit(len, [1, 2]).result(timeout=60) == 2
+
+def test_worker_that_fails_to_start_is_retried(fresh_pool, monkeypatch):
+    real_worker = pdf_pool._Worker
+    failures = []
+
+    def flaky_worker(context):
+        if not failures:
+            failures.append(True)
+            raise OSError("no process")
+        return real_worker(context)
+
+    pool = pdf_pool.ParseWorkerPool(1, max_jobs_per_worker=1)
+    monkeypatch.setattr(pdf_pool, "_Worker", flaky_worker)
+    try:
+        assert pool.submit(len, [1]).result(timeout=60) == 1
+        assert pool.submit(len, [1, 2]).result(timeout=60) == 2
+        assert failures == [True]
+    finally:
+        pool.shutdown(wait=True)
+
+def test_stats_do_not_count_the_shutdown_sentinels(fresh_pool):
+    pool = pdf_pool.ParseWorkerPool(2)
+    pool.shutdown()
+    assert pool.stats()["queued"] == 0
@@ -0,0 +1,51 @@
+from app import financial_analyzer, pipeline
+from app.analysis_store import AnalysisStore
+
+DATA = {
+    "company_name": "Acme Corp",
+    "fiscal_year": "2024",
+    "revenue": 1000.0,
+    "net_income": 100.0,
+    "total_assets": 2000.0,
+    "total_liabilities": 800.0,
+    "stockholders_equity": 1200.0,
+    "total_current_assets": 600.0,
+    "total_current_liabilities": 300.0,
+}
+
+def _finish(store, options):
+    return pipeline._finish_analysis("doc", dict(DATA), {}, "", options, [], lambda stage, payload: None, store)
+
+def test_analysis_with_a_failed_llm_stage_is_not_stored(tmp_path, monkeypatch):
+    failure = lambda *args, **kwargs: {"error": "API unavailable"}
+    for name in ("interpret_financial_ratios_with_llm", "predict_earnings_outlook_with_llm",
+                 "generate_swot_analysis_with_llm", "create_financial_story_with_llm"):
+        monkeypatch.setattr(financial_analyzer, name, failure)
+    store = AnalysisStore(str(tmp_path / "analyses.db"), "test")
+    options = {"analysis_detail": "detailed", "include_llm_analysis": True}
+    results = _finish(store, options)
+    assert "llm_ratio_interpretation" in results["failed_llm_stages"]
+    assert store.find("doc", options) is None
+
+def test_analysis_with_an_error_is_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "calculate_financial_ratios",
+                        lambda *args, **kwargs: {"error": "Error calculating ratios: boom", "qualitative_summary": {}})
+    store = AnalysisStore(str(tmp_path / "analyses.db"), "test")
+    options = {"analysis_detail": "fast"}
+    _finish(store, options)
+    assert store.find("doc", options) is None
+
+def test_successful_fast_analysis_is_stored(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.db"), "test")
+    options = {"analysis_detail": "fast"}
+    _finish(store, options)
+    assert store.find("doc", options) is not None
+
+def test_standard_tier_runs_the_llm_chain_only_on_request():
+    assert pipeline.parse_analysis_options({})["include_llm_analysis"] is False
+    assert pipeline.parse_analysis_options({"include_llm_analysis": "true"})["include_llm_analysis"] is True
+    assert pipeline.parse_analysis_options({"analysis_detail": "fast"})["include_llm_analysis"] is False
+
+def test_only_the_fast_tier_gets_fast_priority():
+    assert pipeline.is_fast_analysis(pipeline.parse_analysis_options({"analysis_detail": "fast"}))
+    assert not pipeline.is_fast_analysis(pipeline.parse_analysis_options({"include_llm_analysis": "false"}))
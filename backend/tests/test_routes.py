@@ -0,0 +1,11 @@
+import pytest
+
+@pytest.mark.parametrize("price", ["nan", "inf", "-inf", "-1", 0])
+def test_reprice_rejects_prices_that_are_not_positive_and_finite(client, price):
+    response = client.post("/api/analyses/missing/reprice", json={"stock_price": price})
+    assert response.status_code == 400
+    assert "positive finite" in response.get_json()["error"]
+
+def test_reprice_of_an_unknown_analysis_is_not_found(client):
+    response = client.post("/api/analyses/missing/reprice", json={"stock_price": "12.5"})
+    assert response.status_code == 404
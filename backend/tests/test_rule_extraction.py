@@ -0,0 +1,18 @@
+from app.rule_extraction import extract_financial_data_with_rules
+
+from test_trends import MATURITY_SCHEDULE, STATEMENTS
+
+COVER = """ACME CORP
+(Exact name of registrant as specified in its charter)
+"""
+
+def test_fiscal_year_and_metrics_come_from_the_statements():
+    data = extract_financial_data_with_rules({"text": COVER + MATURITY_SCHEDULE + STATEMENTS})
+    assert data["company_name"] == "ACME CORP"
+    assert data["fiscal_year"] == "2024"
+    assert data["revenue"] == 10_000_000_000
+    assert data["long_term_debt"] == 4_000_000_000
+
+def test_schedule_without_statements_is_not_a_fiscal_year():
+    data = extract_financial_data_with_rules({"text": COVER + MATURITY_SCHEDULE})
+    assert "error" in data
@@ -0,0 +1,38 @@
+import os
+import threading
+import time
+
+from app.singleflight import SingleFlight
+
+def test_lock_files_are_removed_after_the_call(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    assert flight.do("key", lambda: 42) == 42
+    assert os.listdir(tmp_path) == []
+
+def test_lock_excludes_other_processes_while_files_are_removed(tmp_path):
+    # Separate SingleFlight objects only share the lock files, like worker processes
+    flights = [SingleFlight(str(tmp_path)) for _ in range(8)]
+    state = {"running": 0, "most": 0, "runs": 0}
+    guard = threading.Lock()
+
+    def work():
+        with guard:
+            state["running"] += 1
+            state["most"] = max(state["most"], state["running"])
+            state["runs"] += 1
+        time.sleep(0.002)
+        with guard:
+            state["running"] -= 1
+
+    def caller(flight):
+        for _ in range(20):
+            flight.do("key", work)
+
+    threads = [threading.Thread(target=caller, args=(flight,)) for flight in flights]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["runs"] == 160
+    assert state["most"] == 1
+    assert os.listdir(tmp_path) == []
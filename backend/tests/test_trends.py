@@ -0,0 +1,32 @@
+from app.trends import extract_period_values, analyze_trends
+
+MATURITY_SCHEDULE = """--- Page 40 ---
+Contractual Obligations (in millions)
+2025 2026 2027 2028 2029
+Long-term debt 500 750 1,000 250 1,200
+Operating leases 90 80 70 60 50
+"""
+
+STATEMENTS = """--- Page 60 ---
+CONSOLIDATED STATEMENTS OF OPERATIONS (in millions)
+2024 2023 2022
+Total net revenues 10,000 9,000 8,000
+Net income 1,000 800 700
+--- Page 61 ---
+CONSOLIDATED BALANCE SHEETS (in millions)
+2024 2023
+Total assets 20,000 18,000
+Long-term debt 4,000 4,500
+"""
+
+def test_maturity_schedule_before_the_statements_is_ignored():
+    periods, _ = extract_period_values(MATURITY_SCHEDULE + STATEMENTS)
+    assert sorted(periods) == [2022, 2023, 2024]
+    assert periods[2024]["long_term_debt"] == 4_000_000_000
+    assert periods[2024]["revenue"] == 10_000_000_000
+
+def test_trends_are_built_from_the_statement_years():
+    trends = analyze_trends({"text": MATURITY_SCHEDULE + STATEMENTS})
+    assert trends["periods"] == [2022, 2023, 2024]
+    assert trends["series"]["revenue"] == [8e9, 9e9, 10e9]
+    assert trends["yoy"]["long_term_debt"]["change_pct"] == -11.11
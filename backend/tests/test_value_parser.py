@@ -0,0 +1,26 @@
+import pytest
+
+from app.value_parser import parse_value, parse_column
+
+@pytest.mark.parametrize("text", ["1,234 1,100", "2024 2023", "$ 12 $ 13"])
+def test_more_than_one_number_is_not_a_value(text):
+    assert parse_value(text) is None
+    assert parse_column([text]) == [None]
+
+@pytest.mark.parametrize("text, expected", [
+    ("$ 1,234", 1234.0),
+    (" 1,234 ", 1234.0),
+    ("(1,234)", -1234.0),
+    ("$ (12.5)", -12.5),
+    ("1.5M", 1.5e6),
+    ("12 million", 12e6),
+    ("—", 0.0),
+    ("−42", -42.0),
+    ("1,234 (1)", 1234.0),
+])
+def test_printed_values(text, expected):
+    assert parse_value(text) == expected
+
+def test_column_matches_cell_by_cell_parsing():
+    cells = ["$ 1,234", "(56)", "—", None, 7, "n/a", "1,234 1,100", "3.5B"]
+    assert parse_column(cells, 1e6) == [parse_value(cell, 1e6) for cell in cells]
@@ -0,0 +1,16 @@
+"""
+WSGI entry point for gunicorn: gunicorn -c gunicorn.conf.py wsgi:application
+
+app.py cannot be imported by name because the app/ package shadows it, so it
+is loaded from its path here.
+"""
+import importlib.util
+import os
+
+_spec = importlib.util.spec_from_file_location(
+    "finbrief_main", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+)
+_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_main)
+
+application = _main.create_app()